@@ -1,10 +1,67 @@
-﻿from fastapi import APIRouter
+﻿from datetime import datetime, timedelta, timezone
 
-from app.services.stats_service import StatsService
+from fastapi import APIRouter, HTTPException, Query, status
+
+from app.services.email_log import email_stats
+from app.services.llm import get_llm_client
+from app.services.stats_rollup import query_stats
+from app.services.stats_service import get_stats_service
 
 router = APIRouter()
 
 
 @router.get("/stats")
-def get_stats() -> dict:
-    return StatsService().get_stats()
+def get_stats(
+    tenant_id: int | None = None,
+    start: datetime | None = Query(None, alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    bucket: str | None = None,
+    group_by: str | None = None,
+) -> dict:
+    """
+    All-time totals, or with any of ``from``/``to``/``bucket``/``group_by``
+    a time series from the rollups: ``bucket`` is minute, hour (default) or
+    day, ``group_by`` a comma-separated subset of tenant, action, intent.
+    The range defaults to the 24 hours before ``to`` (default now), in UTC.
+    """
+    if start is None and end is None and bucket is None and group_by is None:
+        return email_stats(tenant_id)
+
+    end = _utc(end) if end is not None else datetime.utcnow()
+    start = _utc(start) if start is not None else end - timedelta(days=1)
+    dimensions = [name.strip() for name in (group_by or "").split(",") if name.strip()]
+    try:
+        return query_stats(start, end, bucket or "hour", dimensions, tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _utc(moment: datetime) -> datetime:
+    """Naive UTC, as stored"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@router.get("/stats/logs")
+def get_log_stats() -> dict:
+    """Counters scraped from the log files (only what rotation kept)"""
+    return get_stats_service().get_stats()
+
+
+@router.get("/llm-cache")
+def get_llm_cache_stats() -> dict:
+    cache = get_llm_client().cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@router.get("/llm/endpoints")
+def get_llm_endpoints() -> list[dict]:
+    return get_llm_client().router.stats()
+
+
+@router.post("/llm/health")
+def check_llm_health() -> list[dict]:
+    return get_llm_client().check_health()
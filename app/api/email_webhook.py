@@ -1,21 +1,37 @@
-from fastapi import APIRouter, HTTPException, status
+from typing import AsyncIterator
+import json
 import logging
+import math
+import time
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.schemas.email_schema import EmailInbound
 from app.crew.crew import build_crew, CrewError
-from app.services.email_service import EmailService
-from app.services.tagging_service import TaggingService
-from app.services.escalation_service import EscalationService
+from app.middleware.tenant import get_tenant_id
+from app.services.actions import execute_action
+from app.services.email_log import elapsed_ms, record_email
+from app.services.job_queue import JobQueue
+from app.services.metrics import EMAIL_ERRORS
+from app.services.rate_limit import AdmissionController, RateLimited, get_admission_controller
+from app.utils.config import settings
+from app.utils.logger import log_context
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
 @router.post("/email/webhook")
-def process_email(payload: EmailInbound) -> dict:
+async def process_email(payload: EmailInbound, request: Request) -> dict:
     """
     Process incoming email through the AI workflow.
     
+    The LLM chain is awaited on the event loop; only the blocking action
+    (e.g. the SMTP send) is handed to the threadpool. With WEBHOOK_ASYNC
+    the email is queued instead (see ``enqueue_email``).
+    
     Args:
         payload: Email data
         
@@ -23,45 +39,48 @@ def process_email(payload: EmailInbound) -> dict:
         Processing result
         
     Raises:
-        HTTPException: If processing fails
+        HTTPException: If processing fails, or 429 (with Retry-After) when
+            the tenant, the sender or the server is over its limit
     """
+    if settings.webhook_async:
+        return await enqueue_email(payload, request)
+
+    # The slot first: a request refused for lack of one keeps its tokens
+    admission = _acquire_slot()
+    try:
+        await _admit(payload, request)
+        tenant_id = _tenant(request)
+        with log_context(email_id=payload.message_id, tenant_id=tenant_id, stage="triage"):
+            return await _process(payload, tenant_id)
+    finally:
+        admission.release()
+
+
+async def _process(payload: EmailInbound, tenant_id: int | None = None) -> dict:
     try:
-        logger.info(f"Processing email: {payload.subject}")
+        logger.info("Processing email: %s", payload.subject)
         
         # Initialize crew
         crew = build_crew()
         
         # Process email through crew
-        result = crew.kickoff(inputs={
+        started = time.perf_counter()
+        result = await crew.akickoff(inputs={
             "subject": payload.subject, 
-            "body": payload.body
+            "body": payload.body,
+            "tenant_id": tenant_id,
         })
+        stage_ms = {"triage": elapsed_ms(started)}
 
         action = result.get("action")
         
         # Execute appropriate action
-        try:
-            if action == "AUTO_REPLY":
-                reply = result.get("reply", "")
-                if reply:
-                    EmailService().send_reply(payload, reply)
-                    logger.info(f"Sent auto-reply for: {payload.subject}")
-                else:
-                    logger.warning("Auto-reply action but no reply generated")
-                    
-            elif action == "TAG_ARCHIVE":
-                tags = result.get("tags", [])
-                TaggingService().tag_and_archive(payload, tags)
-                logger.info(f"Tagged email with: {tags}")
-                
-            elif action == "ESCALATE":
-                summary = result.get("summary", "No summary available")
-                EscalationService().notify_human(payload, summary)
-                logger.info(f"Escalated email: {payload.subject}")
-                
-        except Exception as e:
-            logger.error(f"Action execution failed: {e}")
-            result["action_error"] = str(e)
+        started = time.perf_counter()
+        with log_context(stage="action"):
+            await run_in_threadpool(execute_action, payload, result)
+        stage_ms["action"] = elapsed_ms(started)
+        result["stage_ms"] = stage_ms
+        record_email(payload, result, tenant_id, "webhook")
 
         return {
             "status": "processed", 
@@ -71,15 +90,156 @@ def process_email(payload: EmailInbound) -> dict:
         }
         
     except CrewError as e:
-        logger.error(f"Crew processing failed: {e}")
+        logger.error("Crew processing failed: %s", e)
+        EMAIL_ERRORS.labels("triage", type(e).__name__).inc()
+        record_email(payload, None, tenant_id, "webhook", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Email processing failed: {str(e)}"
         )
         
     except Exception as e:
-        logger.error(f"Unexpected error processing email: {e}")
+        logger.error("Unexpected error processing email: %s", e)
+        EMAIL_ERRORS.labels("webhook", type(e).__name__).inc()
+        record_email(payload, None, tenant_id, "webhook", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error during email processing"
         )
+
+
+async def _admit(payload: EmailInbound, request: Request) -> None:
+    """Take the tenant's and sender's rate-limit tokens, or answer 429"""
+    try:
+        await run_in_threadpool(
+            get_admission_controller().check, get_tenant_id(request), payload.from_address
+        )
+    except RateLimited as e:
+        logger.warning("Rejected email from %s: %s", payload.from_address, e)
+        raise _too_many(e)
+
+
+def _acquire_slot() -> AdmissionController:
+    """Take a processing slot (global in-flight ceiling), or answer 429"""
+    admission = get_admission_controller()
+    try:
+        admission.acquire()
+    except RateLimited as e:
+        logger.warning("Rejected email: %s", e)
+        raise _too_many(e)
+    return admission
+
+
+def _too_many(e: RateLimited) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
+def _tenant(request: Request) -> int | None:
+    tenant = get_tenant_id(request)
+    return int(tenant) if tenant and tenant.strip().isdigit() else None
+
+
+@router.post("/email/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_email(payload: EmailInbound, request: Request) -> JSONResponse:
+    """
+    Store the email in the durable job queue and return right away.
+    
+    Worker processes (job_worker.py) run the crew and the action; poll
+    ``GET /api/email/jobs/{job_id}`` for the result.
+    """
+    await _admit(payload, request)
+    job_id = await run_in_threadpool(JobQueue().enqueue, payload, _tenant(request))
+    logger.info("Queued email as job %s: %s", job_id, payload.subject)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job_id, "status": "queued", "status_url": f"/api/email/jobs/{job_id}"},
+        headers={"Location": f"/api/email/jobs/{job_id}"},
+    )
+
+
+@router.get("/email/jobs/{job_id}")
+def get_job(job_id: int, request: Request) -> dict:
+    job = JobQueue().status(job_id)
+    if job is None or (job["tenant_id"] is not None and job["tenant_id"] != _tenant(request)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/email/webhook/stream")
+async def process_email_stream(payload: EmailInbound, request: Request) -> StreamingResponse:
+    """
+    Streaming variant of the webhook (Server-Sent Events).
+    
+    Emits a ``decision`` event as soon as the action is known, ``token``
+    events while an auto-reply is generated, then ``result`` once the
+    action has been executed. Failures are reported as an ``error`` event.
+    """
+    admission = _acquire_slot()
+    try:
+        await _admit(payload, request)
+    except BaseException:
+        admission.release()
+        raise
+    tenant_id = _tenant(request)
+    logger.info("Processing email: %s", payload.subject)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            crew = build_crew()
+            started = time.perf_counter()
+            async for event in crew.astream_kickoff(inputs={
+                "subject": payload.subject,
+                "body": payload.body,
+                "tenant_id": tenant_id,
+            }):
+                if event["event"] != "result":
+                    yield _sse(event.pop("event"), event)
+                    continue
+
+                result = event["result"]
+                stage_ms = {"triage": elapsed_ms(started)}
+                started = time.perf_counter()
+                with log_context(email_id=payload.message_id, tenant_id=tenant_id, stage="action"):
+                    await run_in_threadpool(execute_action, payload, result)
+                stage_ms["action"] = elapsed_ms(started)
+                result["stage_ms"] = stage_ms
+                record_email(payload, result, tenant_id, "webhook")
+                yield _sse("result", {
+                    "status": "processed",
+                    "action": result.get("action"),
+                    "intent": result.get("intent", "unknown"),
+                    "details": result
+                })
+        except Exception as e:
+            logger.error("Streaming email processing failed: %s", e)
+            EMAIL_ERRORS.labels("webhook", type(e).__name__).inc()
+            record_email(payload, None, tenant_id, "webhook", error=str(e))
+            yield _sse("error", {"detail": "Internal server error during email processing"})
+
+    return AdmittedStream(events(), admission, media_type="text/event-stream")
+
+
+class AdmittedStream(StreamingResponse):
+    """
+    Holds a processing slot until the response is over, however it ends:
+    the body generator's own cleanup does not run if the client goes away
+    before the body is first iterated.
+    """
+
+    def __init__(self, content: AsyncIterator[str], admission: AdmissionController, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.admission.release()
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.services.job_queue import JobQueue
+from app.services.metrics import JOBS, registry
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint: the metrics of every process sharing METRICS_DIR"""
+    counts = await run_in_threadpool(JobQueue().counts)
+    for status in ("queued", "running", "done", "failed"):
+        JOBS.labels(status).set(counts.get(status, 0))
+    text = await run_in_threadpool(registry.render)
+    return PlainTextResponse(text, media_type=CONTENT_TYPE)
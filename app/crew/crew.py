@@ -1,26 +1,85 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import re
 import logging
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, AsyncIterator, Generator
 
-from app.services.llm import LLMClient, LLMError
+from app.crew.rules import RULES
+from app.services.dedup import Cluster, NearDuplicateIndex, get_dedup_index
+from app.services.llm import LLMClient, LLMError, get_llm_client
+from app.services.metrics import LLM_ERRORS, LLM_STEP_SECONDS
+from app.services.preprocess import prepare_body
+from app.utils.config import settings
 
 logger = logging.getLogger(__name__)
 
 PROMPTS_DIR = Path(__file__).resolve().parent / "prompts"
 
+ACTIONS = ("AUTO_REPLY", "TAG_ARCHIVE", "ESCALATE")
+
+# response_format for the single-call triage mode (intent + action in one completion)
+TRIAGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "email_triage",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "intent": {"type": "string"},
+                "action": {"type": "string", "enum": list(ACTIONS)},
+                "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+                "tags": {"type": "array", "items": {"type": "string"}, "maxItems": 3},
+            },
+            "required": ["intent", "action", "confidence", "tags"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+_TRIAGE_SCHEMA = TRIAGE_RESPONSE_FORMAT["json_schema"]["schema"]
+
+# response_format for packing several short emails into one triage completion
+BATCH_TRIAGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "email_batch_triage",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "items": {
+                    "type": "array",
+                    "items": {
+                        **_TRIAGE_SCHEMA,
+                        "properties": {"id": {"type": "integer"}, **_TRIAGE_SCHEMA["properties"]},
+                        "required": ["id", *_TRIAGE_SCHEMA["required"]],
+                    },
+                },
+            },
+            "required": ["items"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 
 def _load_prompt(filename: str) -> str:
     """Load prompt from file with error handling"""
     path = PROMPTS_DIR / filename
     if not path.exists():
-        logger.warning(f"Prompt file not found: {filename}")
+        logger.warning("Prompt file not found: %s", filename)
         return ""
     try:
         return path.read_text(encoding="utf-8").strip()
     except Exception as e:
-        logger.error(f"Failed to read prompt file {filename}: {e}")
+        logger.error("Failed to read prompt file %s: %s", filename, e)
         return ""
 
 
@@ -51,58 +110,118 @@ def _fallback_classification(intent: str, subject: str, body: str) -> str:
     Fallback classification based on intent when LLM classification is unclear.
     Provides rule-based classification as safety net.
     """
-    # Convert to lowercase for matching
-    intent_lower = intent.lower()
-    subject_lower = subject.lower()
-    body_lower = body.lower()
-    combined_text = subject_lower + " " + body_lower
-    
-    # Strong complaint indicators - ESCALATE
-    strong_complaint_words = ['angry', 'furious', 'outraged', 'disgusted']
-    demand_words = ['demand', 'unacceptable', 'manager', 'supervisor', 'lawsuit', 'legal']
-    
-    if intent_lower == 'complaint':
-        # Check if it's a strong complaint
-        if any(word in combined_text for word in strong_complaint_words + demand_words):
-            return "ESCALATE"
-        # Mild complaint might still get auto-reply
-        return "AUTO_REPLY"
-    
-    # Strong escalation indicators in text
-    if any(word in combined_text for word in ['terrible', 'horrible', 'worst', 'never again']):
-        # Check if it's really angry or just expressing disappointment
-        if any(word in combined_text for word in demand_words):
-            return "ESCALATE"
-    
-    # Simple queries - AUTO_REPLY (expanded list)
-    auto_reply_intents = [
-        'refund_request', 'shipping_inquiry', 'product_inquiry', 
-        'general_inquiry', 'support_request', 'order_status',
-        'shipping', 'delivery', 'order', 'product', 'warranty',
-        'return', 'exchange', 'tracking'
-    ]
-    
-    # Check intent or keywords in text
-    if intent_lower in auto_reply_intents:
-        return "AUTO_REPLY"
+    return RULES.classify(intent, subject, body)
+
+
+def _reconcile_action(action: str, intent: str, subject: str, body: str) -> str:
+    """Cross-check an LLM-chosen action against the rule-based fallback"""
+    matches = RULES.match(subject, body)
+    fallback_action = RULES.classify(intent, subject, body, matches)
     
-    # Check for shipping/delivery keywords
-    shipping_keywords = ['shipping', 'delivery', 'arrive', 'ship', 'delivered', 'tracking', 'when will']
-    if any(keyword in combined_text for keyword in shipping_keywords):
-        return "AUTO_REPLY"
+    # If LLM and fallback disagree, log and use fallback for customer queries
+    if action != fallback_action:
+        logger.info("LLM classified as %s, fallback suggests %s", action, fallback_action)
+        
+        # Trust fallback for AUTO_REPLY suggestions (it's keyword-based and reliable)
+        if fallback_action == "AUTO_REPLY":
+            logger.info("Using fallback classification: %s", fallback_action)
+            action = fallback_action
+        # For ESCALATE, check if LLM has good reason
+        elif action == "ESCALATE" and fallback_action != "ESCALATE":
+            # Only escalate if there are strong indicators
+            if not matches.has("legal"):
+                logger.info("Overriding ESCALATE with fallback: %s", fallback_action)
+                action = fallback_action
     
-    # Check for refund/return keywords
-    refund_keywords = ['refund', 'return', 'money back', 'exchange']
-    if any(keyword in combined_text for keyword in refund_keywords):
-        return "AUTO_REPLY"
+    return action
+
+
+def _parse_triage(text: str) -> dict | None:
+    """
+    Parse and validate a triage JSON object.
     
-    # Spam/informational - TAG_ARCHIVE  
-    archive_intents = ['spam', 'newsletter', 'notification', 'confirmation']
-    if intent_lower in archive_intents:
-        return "TAG_ARCHIVE"
+    Returns None when the output is not a usable object, so the caller can
+    fall back to the two-step intent/classify path.
+    """
+    if not text:
+        return None
+    # Tolerate markdown fences or chatter around the object
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    action = str(data.get("action", "")).strip().upper()
+    intent = _extract_label(str(data.get("intent", "")), default="").lower()
+    if action not in ACTIONS or not intent:
+        return None
+
+    try:
+        confidence = min(max(float(data.get("confidence", 0.0)), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return None
+
+    tags = data.get("tags") or []
+    if not isinstance(tags, list):
+        return None
+    tags = [str(tag).strip() for tag in tags if str(tag).strip()][:3]
+
+    return {"intent": intent, "action": action, "confidence": confidence, "tags": tags}
+
+
+def _parse_batch_triage(text: str, count: int) -> dict[int, dict]:
+    """
+    Parse a packed triage response into {item id: triage}.
     
-    # Default to AUTO_REPLY for customer questions
-    return "AUTO_REPLY"
+    Items that are missing or invalid are simply left out; those emails
+    go through the regular per-email path.
+    """
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0)).get("items")
+    except (ValueError, AttributeError):
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    parsed: dict[int, dict] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            item_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        triage = _parse_triage(json.dumps(item))
+        if triage is not None and 0 <= item_id < count:
+            parsed[item_id] = triage
+    return parsed
+
+
+def _empty_email_result() -> dict:
+    logger.error("Empty email provided to crew")
+    return {
+        "intent": "unknown",
+        "action": "ESCALATE",
+        "error": "Empty email content",
+        "summary": "Email has no content"
+    }
+
+
+def _error_result(error: str) -> dict:
+    return {
+        "intent": "unknown",
+        "action": "ESCALATE",
+        "error": error,
+        "summary": f"Processing failed: {error}",
+    }
 
 
 def _parse_tags(text: str) -> list[str]:
@@ -118,20 +237,59 @@ class CrewError(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class LLMCall:
+    """A single LLM request yielded by the crew workflow"""
+    step: str
+    prompt: str
+    system_prompt: str | None = None
+    max_tokens: int = 512
+    response_format: dict | None = None
+
+
+# The workflow is written once as a generator that yields LLMCall requests and
+# receives the generated text back; kickoff/akickoff only drive it. LLM
+# failures are thrown back into the generator so each step keeps its own
+# fallback handling.
+CrewSteps = Generator[LLMCall, str, Any]
+
+
 class SimpleCrew:
-    def __init__(self, llm_client: LLMClient) -> None:
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        triage_mode: bool | None = None,
+        rules_fast_path: bool | None = None,
+        rules_threshold: float | None = None,
+        dedup: NearDuplicateIndex | None = None,
+        preprocess: bool | None = None,
+    ) -> None:
         self.llm = llm_client
+        self.triage_mode = settings.crew_triage_mode if triage_mode is None else triage_mode
+        if rules_fast_path is None:
+            rules_fast_path = settings.crew_rules_fast_path
+        # None disables the rule fast path
+        self.rules_threshold = (
+            (settings.crew_rules_threshold if rules_threshold is None else rules_threshold)
+            if rules_fast_path else None
+        )
+        if dedup is None and settings.crew_dedup_enabled:
+            dedup = get_dedup_index()
+        self.dedup = dedup
+        self.preprocess = settings.crew_preprocess if preprocess is None else preprocess
         self.intent_prompt = _load_prompt("intent.txt")
         self.classify_prompt = _load_prompt("classify.txt")
         self.autoreply_prompt = _load_prompt("autoreply.txt")
         self.escalate_prompt = _load_prompt("escalate.txt")
+        self.triage_prompt = _load_prompt("triage.txt")
 
     def kickoff(self, inputs: dict) -> dict:
         """
         Process email through the crew workflow with error handling.
         
         Args:
-            inputs: Dictionary with 'subject' and 'body'
+            inputs: Dictionary with 'subject' and 'body'; an optional
+                'tenant_id' limits near-duplicate reuse to that tenant
             
         Returns:
             Dictionary with processing results
@@ -139,17 +297,348 @@ class SimpleCrew:
         Raises:
             CrewError: If critical processing fails
         """
+        return self._run(self._workflow(inputs))
+
+    async def akickoff(self, inputs: dict) -> dict:
+        """
+        Async variant of ``kickoff``; awaits each LLM step without blocking a thread.
+        """
+        return await self._arun(self._workflow(inputs))
+
+    async def astream_kickoff(self, inputs: dict) -> AsyncIterator[dict]:
+        """
+        Streaming variant of ``akickoff``.
+        
+        Yields events as soon as they are known:
+            {"event": "decision", "intent", "action", ...} once triage is done
+            {"event": "token", "text"} for each auto-reply chunk
+            {"event": "result", "result"} with the same dict ``akickoff`` returns
+        """
+        subject, body, trimmed = self._prepare_inputs(inputs)
+        if not subject and not body:
+            yield {"event": "result", "result": _empty_email_result()}
+            return
+
+        scope = inputs.get("tenant_id")
+        cluster = self._find_duplicate(subject, body, scope)
+        if cluster is not None:
+            result = await self._arun(self._reuse_cluster(subject, body, cluster))
+            if trimmed:
+                result["preprocess"] = trimmed
+            yield {"event": "decision", "intent": result["intent"], "action": result["action"],
+                   "source": "dedup"}
+            yield {"event": "result", "result": result}
+            return
+
+        intent, action, extras = await self._arun(self._triage_steps(subject, body))
+        decision = {"event": "decision", "intent": intent, "action": action}
+        for key in ("confidence", "source"):
+            if key in extras:
+                decision[key] = extras[key]
+        yield decision
+
+        steps = self._action_steps(subject, body, intent, action, tags=extras.get("tags"))
+        try:
+            call = next(steps)
+            while True:
+                started = time.perf_counter()
+                try:
+                    if call.step == "reply":
+                        chunks = []
+                        async for chunk in self.llm.astream(
+                            call.prompt,
+                            system_prompt=call.system_prompt,
+                            max_tokens=call.max_tokens,
+                            stop=settings.crew_reply_stop,
+                            max_chars=settings.crew_reply_max_chars,
+                        ):
+                            chunks.append(chunk)
+                            yield {"event": "token", "text": chunk}
+                        text = "".join(chunks).strip()
+                    else:
+                        text = await self.llm.agenerate(
+                            call.prompt,
+                            system_prompt=call.system_prompt,
+                            max_tokens=call.max_tokens,
+                            response_format=call.response_format,
+                        )
+                except LLMError as e:
+                    LLM_ERRORS.labels(call.step, type(e).__name__).inc()
+                    call = steps.throw(e)
+                else:
+                    LLM_STEP_SECONDS.labels(call.step).observe(time.perf_counter() - started)
+                    call = steps.send(text)
+        except StopIteration as stop:
+            result = stop.value
+
+        for key in ("confidence", "source"):
+            if key in extras:
+                result[key] = extras[key]
+        self._remember_cluster(subject, body, result, scope)
+        if trimmed:
+            result["preprocess"] = trimmed
+        yield {"event": "result", "result": result}
+
+    def kickoff_batch(
+        self,
+        inputs_list: list[dict],
+        max_concurrency: int | None = None,
+        pack: bool | None = None,
+    ) -> list[dict]:
+        """
+        Process several emails with their LLM steps running concurrently.
+        
+        Must not be called from a running event loop (use akickoff_batch).
+        
+        Args:
+            inputs_list: One 'subject'/'body' dictionary per email
+            max_concurrency: Emails in flight at once (CREW_BATCH_CONCURRENCY)
+            pack: Triage short emails with one multi-item prompt (CREW_BATCH_PACK)
+            
+        Returns:
+            One result per email, in input order; failures are reported per
+            email in the result's 'error' field
+        """
+        async def run_batch() -> list[dict]:
+            try:
+                return await self.akickoff_batch(inputs_list, max_concurrency, pack)
+            finally:
+                await self.llm.aclose_pool()
+
+        return asyncio.run(run_batch())
+
+    async def akickoff_batch(
+        self,
+        inputs_list: list[dict],
+        max_concurrency: int | None = None,
+        pack: bool | None = None,
+    ) -> list[dict]:
+        """Async variant of ``kickoff_batch``"""
+        limit = max(1, max_concurrency or settings.crew_batch_concurrency)
+        semaphore = asyncio.Semaphore(limit)
+        pack = settings.crew_batch_pack if pack is None else pack
+
+        presets: dict[int, tuple] = {}
+        if pack:
+            presets = await self._apack_triage(inputs_list)
+
+        async def run_one(index: int, inputs: dict) -> dict:
+            async with semaphore:
+                try:
+                    return await self._arun(self._workflow(inputs, preset=presets.get(index)))
+                except Exception as e:
+                    logger.error("Batch item %s failed: %s", index, e)
+                    return _error_result(str(e))
+
+        logger.info("Processing batch of %s emails (concurrency=%s)", len(inputs_list), limit)
+        return list(await asyncio.gather(
+            *(run_one(index, inputs) for index, inputs in enumerate(inputs_list))
+        ))
+
+    async def _apack_triage(self, inputs_list: list[dict]) -> dict[int, tuple]:
+        """Triage short emails in chunks with one multi-item completion per chunk"""
+        max_chars = settings.crew_batch_pack_max_chars
+        candidates = []
+        for index, inputs in enumerate(inputs_list):
+            subject, body, _ = self._prepare_inputs(inputs)
+            if not (subject or body) or len(subject) + len(body) > max_chars:
+                continue
+            if self._rule_triage(subject, body) is not None:
+                continue
+            candidates.append((index, subject, body))
+
+        size = max(2, settings.crew_batch_pack_size)
+        chunks = [candidates[i:i + size] for i in range(0, len(candidates), size)]
+        chunk_presets = await asyncio.gather(*(self._apack_chunk(chunk) for chunk in chunks))
+
+        presets: dict[int, tuple] = {}
+        for chunk_preset in chunk_presets:
+            presets.update(chunk_preset)
+        return presets
+
+    async def _apack_chunk(self, chunk: list[tuple[int, str, str]]) -> dict[int, tuple]:
+        if len(chunk) < 2:
+            return {}
+        items = "\n\n".join(
+            f"[{position}] Subject: {subject}\nBody: {body}"
+            for position, (_, subject, body) in enumerate(chunk)
+        )
+        prompt = (
+            f"{items}\n\n"
+            "Return a JSON object {\"items\": [...]} with one triage object per email, "
+            "each including its numeric id from the brackets."
+        )
+        started = time.perf_counter()
+        try:
+            raw = await self.llm.agenerate(
+                prompt,
+                system_prompt=self.triage_prompt,
+                max_tokens=96 * len(chunk),
+                response_format=BATCH_TRIAGE_RESPONSE_FORMAT,
+            )
+        except LLMError as e:
+            LLM_ERRORS.labels("batch_triage", type(e).__name__).inc()
+            logger.error("Packed triage failed: %s, using per-email path", e)
+            return {}
+        LLM_STEP_SECONDS.labels("batch_triage").observe(time.perf_counter() - started)
+
+        parsed = _parse_batch_triage(raw, len(chunk))
+        logger.info("Packed triage resolved %s/%s emails", len(parsed), len(chunk))
+        presets: dict[int, tuple] = {}
+        for position, triage in parsed.items():
+            index, subject, body = chunk[position]
+            action = _reconcile_action(triage["action"], triage["intent"], subject, body)
+            presets[index] = (triage["intent"], action, {**triage, "source": "llm_batch_triage"})
+        return presets
+
+    def _run(self, steps: CrewSteps) -> Any:
+        """Drive a workflow generator with blocking LLM calls"""
+        try:
+            call = next(steps)
+            while True:
+                started = time.perf_counter()
+                try:
+                    text = self.llm.generate(
+                        call.prompt,
+                        system_prompt=call.system_prompt,
+                        max_tokens=call.max_tokens,
+                        response_format=call.response_format,
+                    )
+                except LLMError as e:
+                    LLM_ERRORS.labels(call.step, type(e).__name__).inc()
+                    call = steps.throw(e)
+                else:
+                    LLM_STEP_SECONDS.labels(call.step).observe(time.perf_counter() - started)
+                    call = steps.send(text)
+        except StopIteration as stop:
+            return stop.value
+
+    async def _arun(self, steps: CrewSteps) -> Any:
+        """Drive a workflow generator with awaited LLM calls"""
+        try:
+            call = next(steps)
+            while True:
+                started = time.perf_counter()
+                try:
+                    text = await self.llm.agenerate(
+                        call.prompt,
+                        system_prompt=call.system_prompt,
+                        max_tokens=call.max_tokens,
+                        response_format=call.response_format,
+                    )
+                except LLMError as e:
+                    LLM_ERRORS.labels(call.step, type(e).__name__).inc()
+                    call = steps.throw(e)
+                else:
+                    LLM_STEP_SECONDS.labels(call.step).observe(time.perf_counter() - started)
+                    call = steps.send(text)
+        except StopIteration as stop:
+            return stop.value
+
+    def _prepare_inputs(self, inputs: dict) -> tuple[str, str, dict | None]:
+        """
+        Return (subject, body, trim info) with the body cleaned and capped at
+        CREW_BODY_TOKEN_BUDGET tokens; trim info is None if nothing was cut.
+        """
         subject = inputs.get("subject", "")
         body = inputs.get("body", "")
+        if not self.preprocess or not body:
+            return subject, body, None
+
+        prepared = prepare_body(body, settings.crew_body_token_budget)
+        if prepared.removed_chars <= 0:
+            return subject, prepared.text, None
+
+        logger.info("Trimmed email body: removed %s chars, %s tokens",
+                    prepared.removed_chars, prepared.removed_tokens)
+        return subject, prepared.text, {
+            "original_tokens": prepared.original_tokens,
+            "tokens": prepared.tokens,
+            "removed_chars": prepared.removed_chars,
+            "truncated": prepared.truncated,
+        }
+
+    def _workflow(self, inputs: dict, preset: tuple | None = None) -> CrewSteps:
+        subject, body, trimmed = self._prepare_inputs(inputs)
 
         if not subject and not body:
-            logger.error("Empty email provided to crew")
-            return {
-                "intent": "unknown",
-                "action": "ESCALATE",
-                "error": "Empty email content",
-                "summary": "Email has no content"
+            return _empty_email_result()
+
+        result = yield from self._email_steps(subject, body, preset, inputs.get("tenant_id"))
+        if trimmed:
+            result["preprocess"] = trimmed
+        return result
+
+    def _email_steps(self, subject: str, body: str, preset: tuple | None, scope=None) -> CrewSteps:
+        cluster = self._find_duplicate(subject, body, scope) if preset is None else None
+        if cluster is not None:
+            return (yield from self._reuse_cluster(subject, body, cluster))
+
+        if preset is not None:
+            intent, action, extras = preset
+        else:
+            intent, action, extras = yield from self._triage_steps(subject, body)
+        result = yield from self._action_steps(
+            subject, body, intent, action, tags=extras.get("tags")
+        )
+        for key in ("confidence", "source"):
+            if key in extras:
+                result[key] = extras[key]
+        self._remember_cluster(subject, body, result, scope)
+        return result
+
+    def _find_duplicate(self, subject: str, body: str, scope=None) -> Cluster | None:
+        # Clusters are per tenant (``inputs["tenant_id"]``)
+        if self.dedup is None:
+            return None
+        cluster = self.dedup.lookup(subject, body, scope)
+        if cluster is not None:
+            logger.info("Near-duplicate of cluster %s (%s/%s)",
+                        cluster.id, cluster.result.get('intent'), cluster.result.get('action'))
+        return cluster
+
+    def _remember_cluster(self, subject: str, body: str, result: dict, scope=None) -> None:
+        # Failed results must not become the template for a whole campaign
+        if self.dedup is not None and "error" not in result:
+            self.dedup.add(subject, body, result, scope)
+
+    def _reuse_cluster(self, subject: str, body: str, cluster: Cluster) -> CrewSteps:
+        """Reuse a cluster's decision; optionally regenerate the per-email text"""
+        template = cluster.result
+        intent, action = template["intent"], template["action"]
+        if settings.crew_dedup_regenerate and action in ("AUTO_REPLY", "ESCALATE"):
+            result = yield from self._action_steps(
+                subject, body, intent, action, tags=template.get("tags")
+            )
+        else:
+            result = {
+                key: template[key]
+                for key in ("intent", "action", "tags", "reply", "summary")
+                if key in template
             }
+        result["source"] = "dedup"
+        result["duplicate_of"] = cluster.id
+        return result
+
+    def _triage_steps(self, subject: str, body: str) -> CrewSteps:
+        """
+        Steps 1-2: detect intent and decide the action.
+        
+        Returns (intent, action, extras) where extras may carry the triage
+        confidence, its source and suggested tags.
+        """
+        # Rule fast path: obvious mail skips the intent/classify LLM calls
+        rule_triage = self._rule_triage(subject, body)
+        if rule_triage is not None:
+            return rule_triage
+
+        if self.triage_mode:
+            triage = yield from self._single_call_triage(subject, body)
+            if triage is not None:
+                action = _reconcile_action(triage["action"], triage["intent"], subject, body)
+                logger.info("Triage: intent=%s action=%s confidence=%.2f",
+                            triage['intent'], action, triage['confidence'])
+                return triage["intent"], action, {**triage, "source": "llm_triage"}
 
         # Step 1: Intent Detection
         try:
@@ -158,15 +647,16 @@ class SimpleCrew:
                 f"Body: {body}\n"
                 "Return a single snake_case intent label."
             )
-            intent_raw = self.llm.generate(
-                intent_prompt, 
-                system_prompt=self.intent_prompt, 
-                max_tokens=32
+            intent_raw = yield LLMCall(
+                "intent",
+                intent_prompt,
+                system_prompt=self.intent_prompt,
+                max_tokens=32,
             )
             intent = _extract_label(intent_raw).lower()
-            logger.info(f"Detected intent: {intent}")
+            logger.info("Detected intent: %s", intent)
         except LLMError as e:
-            logger.error(f"Intent detection failed: {e}")
+            logger.error("Intent detection failed: %s", e)
             intent = "unknown"
 
         # Step 2: Classification
@@ -177,38 +667,74 @@ class SimpleCrew:
                 f"Intent: {intent}\n\n"
                 "Based on the email content and intent, return only one label: AUTO_REPLY, TAG_ARCHIVE, or ESCALATE."
             )
-            action_raw = self.llm.generate(
-                classify_prompt, 
-                system_prompt=self.classify_prompt, 
-                max_tokens=32
+            action_raw = yield LLMCall(
+                "classify",
+                classify_prompt,
+                system_prompt=self.classify_prompt,
+                max_tokens=32,
             )
             action = _normalize_action(action_raw)
             
             # Apply intelligent fallback logic
-            fallback_action = _fallback_classification(intent, subject, body)
-            
-            # If LLM and fallback disagree, log and use fallback for customer queries
-            if action != fallback_action:
-                logger.info(f"LLM classified as {action}, fallback suggests {fallback_action}")
-                
-                # Trust fallback for AUTO_REPLY suggestions (it's keyword-based and reliable)
-                if fallback_action == "AUTO_REPLY":
-                    logger.info(f"Using fallback classification: {fallback_action}")
-                    action = fallback_action
-                # For ESCALATE, check if LLM has good reason
-                elif action == "ESCALATE" and fallback_action != "ESCALATE":
-                    # Only escalate if there are strong indicators
-                    strong_escalate = any(word in (subject + " " + body).lower() 
-                                        for word in ['lawsuit', 'legal', 'lawyer', 'attorney', 'sue'])
-                    if not strong_escalate:
-                        logger.info(f"Overriding ESCALATE with fallback: {fallback_action}")
-                        action = fallback_action
+            action = _reconcile_action(action, intent, subject, body)
             
-            logger.info(f"Final classified action: {action}")
+            logger.info("Final classified action: %s", action)
         except LLMError as e:
-            logger.error(f"Classification failed: {e}, using fallback")
+            logger.error("Classification failed: %s, using fallback", e)
             action = _fallback_classification(intent, subject, body)
 
+        return intent, action, {}
+
+    def _rule_triage(self, subject: str, body: str) -> tuple | None:
+        if self.rules_threshold is None:
+            return None
+        decision = RULES.evaluate(subject, body)
+        if decision.confidence < self.rules_threshold:
+            return None
+        logger.info("Rule fast path: %s (%s, confidence=%.2f)",
+                    decision.action, decision.reason, decision.confidence)
+        return decision.intent, decision.action, {
+            "confidence": decision.confidence,
+            "source": "rules",
+        }
+
+    def _single_call_triage(self, subject: str, body: str) -> CrewSteps:
+        """Intent, action, confidence and tags from one constrained completion"""
+        try:
+            triage_prompt = (
+                f"Subject: {subject}\n"
+                f"Body: {body}\n"
+                "Return the triage JSON object."
+            )
+            triage_raw = yield LLMCall(
+                "triage",
+                triage_prompt,
+                system_prompt=self.triage_prompt,
+                max_tokens=96,
+                response_format=TRIAGE_RESPONSE_FORMAT,
+            )
+        except LLMError as e:
+            logger.error("Triage call failed: %s, using two-step path", e)
+            return None
+
+        triage = _parse_triage(triage_raw)
+        if triage is None:
+            logger.warning("Triage output was not valid JSON, using two-step path")
+        return triage
+
+    def _action_steps(
+        self,
+        subject: str,
+        body: str,
+        intent: str,
+        action: str,
+        tags: list[str] | None = None,
+    ) -> CrewSteps:
+        """
+        Step 3: produce the reply, tags or escalation summary.
+        
+        Tags already chosen during triage skip the tagging call.
+        """
         result = {"intent": intent, "action": action}
 
         # Step 3: Execute Action
@@ -220,24 +746,30 @@ class SimpleCrew:
                     f"Intent: {intent}\n"
                     "Write a concise, helpful reply."
                 )
-                reply = self.llm.generate(
-                    reply_prompt, 
-                    system_prompt=self.autoreply_prompt, 
-                    max_tokens=256
+                reply = yield LLMCall(
+                    "reply",
+                    reply_prompt,
+                    system_prompt=self.autoreply_prompt,
+                    max_tokens=256,
                 )
                 result["reply"] = reply
                 result["tags"] = [intent]
-                logger.info(f"Generated auto-reply ({len(reply)} chars)")
+                logger.info("Generated auto-reply (%s chars)", len(reply))
+                
+            elif action == "TAG_ARCHIVE" and tags:
+                result["tags"] = tags
+                logger.info("Assigned tags: %s", result["tags"])
                 
             elif action == "TAG_ARCHIVE":
                 tags_prompt = f"Intent: {intent}\nReturn 1-3 short tags, comma-separated."
-                tags_raw = self.llm.generate(
-                    tags_prompt, 
-                    system_prompt="You assign mailbox tags."
+                tags_raw = yield LLMCall(
+                    "tags",
+                    tags_prompt,
+                    system_prompt="You assign mailbox tags.",
                 )
                 tags = _parse_tags(tags_raw)
                 result["tags"] = tags or [intent]
-                logger.info(f"Assigned tags: {result['tags']}")
+                logger.info("Assigned tags: %s", result["tags"])
                 
             elif action == "ESCALATE":
                 summary_prompt = (
@@ -245,16 +777,17 @@ class SimpleCrew:
                     f"Body: {body}\n"
                     "Summarize the issue for a human agent."
                 )
-                summary = self.llm.generate(
-                    summary_prompt, 
-                    system_prompt=self.escalate_prompt, 
-                    max_tokens=256
+                summary = yield LLMCall(
+                    "summary",
+                    summary_prompt,
+                    system_prompt=self.escalate_prompt,
+                    max_tokens=256,
                 )
                 result["summary"] = summary
-                logger.info(f"Generated escalation summary")
+                logger.info("Generated escalation summary")
                 
         except LLMError as e:
-            logger.error(f"Action execution failed: {e}")
+            logger.error("Action execution failed: %s", e)
             result["error"] = str(e)
             result["action"] = "ESCALATE"
             result["summary"] = f"Processing failed: {str(e)}"
@@ -263,9 +796,9 @@ class SimpleCrew:
 
 
 def build_crew() -> SimpleCrew:
-    """Factory function to create SimpleCrew instance"""
+    """Factory function to create SimpleCrew instance on the shared LLM client"""
     try:
-        return SimpleCrew(LLMClient())
+        return SimpleCrew(get_llm_client())
     except Exception as e:
-        logger.error(f"Failed to build crew: {e}")
+        logger.error("Failed to build crew: %s", e)
         raise CrewError(f"Crew initialization failed: {e}") from e
@@ -0,0 +1,261 @@
+"""
+Keyword rule engine for email triage.
+
+All keyword lists are compiled into one Aho-Corasick automaton, so an email
+is scanned once regardless of how many rules exist. The engine serves two
+purposes:
+
+- ``classify`` reproduces the rule-based fallback used to sanity-check LLM
+  decisions (substring semantics, intent-aware).
+- ``evaluate`` scores an email *before* any LLM call and returns an action
+  with a confidence, letting the crew skip intent/classify for obvious mail.
+"""
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+
+
+# Keyword groups shared by the fallback rules and the confidence scorer
+KEYWORD_GROUPS: dict[str, list[str]] = {
+    "strong_complaint": ["angry", "furious", "outraged", "disgusted"],
+    "demand": ["demand", "unacceptable", "manager", "supervisor", "lawsuit", "legal"],
+    "negative": ["terrible", "horrible", "worst", "never again"],
+    "legal": ["lawsuit", "legal", "lawyer", "attorney", "sue"],
+    "shipping": ["shipping", "delivery", "arrive", "ship", "delivered", "tracking", "when will"],
+    "refund": ["refund", "return", "money back", "exchange"],
+    "order_status": [
+        "where is my order", "where's my order", "order status", "track my order",
+        "tracking number", "tracking", "has my order shipped", "not arrived yet",
+    ],
+    "archive": [
+        "unsubscribe", "newsletter", "view in browser", "view this email in your browser",
+        "no-reply", "noreply", "do not reply", "this is an automated",
+    ],
+}
+
+# Evidence weight of a whole-word keyword hit for the confidence scorer.
+# Anything not listed counts as DEFAULT_WEIGHT.
+KEYWORD_WEIGHTS: dict[str, float] = {
+    "where is my order": 0.85,
+    "where's my order": 0.85,
+    "track my order": 0.85,
+    "has my order shipped": 0.8,
+    "order status": 0.7,
+    "tracking number": 0.7,
+    "tracking": 0.5,
+    "refund": 0.7,
+    "money back": 0.7,
+    "unsubscribe": 0.7,
+    "view this email in your browser": 0.8,
+    "view in browser": 0.7,
+    "ship": 0.25,
+    "when will": 0.3,
+    "return": 0.35,
+    "exchange": 0.35,
+}
+DEFAULT_WEIGHT = 0.45
+
+# Scored groups -> (action, intent) they vote for
+CANDIDATES: dict[str, tuple[str, str]] = {
+    "order_status": ("AUTO_REPLY", "order_status"),
+    "shipping": ("AUTO_REPLY", "shipping_inquiry"),
+    "refund": ("AUTO_REPLY", "refund_request"),
+    "archive": ("TAG_ARCHIVE", "newsletter"),
+}
+
+# Groups whose presence argues against a routine automated decision
+RISK_GROUPS = ("strong_complaint", "demand", "negative", "legal")
+
+AUTO_REPLY_INTENTS = {
+    'refund_request', 'shipping_inquiry', 'product_inquiry',
+    'general_inquiry', 'support_request', 'order_status',
+    'shipping', 'delivery', 'order', 'product', 'warranty',
+    'return', 'exchange', 'tracking'
+}
+ARCHIVE_INTENTS = {'spam', 'newsletter', 'notification', 'confirmation'}
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton mapping keywords to the groups they belong to"""
+
+    def __init__(self, groups: dict[str, list[str]]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[tuple[str, tuple[str, ...]]]] = [[]]
+
+        keyword_groups: dict[str, list[str]] = {}
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                keyword_groups.setdefault(keyword.lower(), []).append(group)
+        for keyword, owners in keyword_groups.items():
+            self._insert(keyword, tuple(owners))
+        self._build_failure_links()
+
+    def _insert(self, keyword: str, owners: tuple[str, ...]) -> None:
+        node = 0
+        for char in keyword:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][char] = nxt
+            node = nxt
+        self._out[node].append((keyword, owners))
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child].extend(self._out[self._fail[child]])
+
+    def scan(self, text: str) -> list[tuple[int, str, tuple[str, ...]]]:
+        """Return (end_index, keyword, groups) for every occurrence in one pass"""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: list[tuple[int, str, tuple[str, ...]]] = []
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                for keyword, owners in out[node]:
+                    hits.append((index, keyword, owners))
+        return hits
+
+
+@dataclass
+class KeywordMatches:
+    """Keyword hits per group; ``words`` only holds whole-word hits"""
+    substrings: dict[str, set[str]] = field(default_factory=dict)
+    words: dict[str, set[str]] = field(default_factory=dict)
+
+    def has(self, *groups: str) -> bool:
+        return any(self.substrings.get(group) for group in groups)
+
+
+@dataclass(frozen=True)
+class RuleDecision:
+    action: str
+    intent: str
+    confidence: float
+    reason: str
+
+
+class RuleEngine:
+    def __init__(self, groups: dict[str, list[str]] | None = None) -> None:
+        self._automaton = KeywordAutomaton(groups or KEYWORD_GROUPS)
+
+    def match(self, subject: str, body: str) -> KeywordMatches:
+        text = f"{subject} {body}".lower()
+        matches = KeywordMatches()
+        for end, keyword, owners in self._automaton.scan(text):
+            start = end - len(keyword) + 1
+            whole_word = (
+                (start == 0 or not text[start - 1].isalnum())
+                and (end + 1 == len(text) or not text[end + 1].isalnum())
+            )
+            for group in owners:
+                matches.substrings.setdefault(group, set()).add(keyword)
+                if whole_word:
+                    matches.words.setdefault(group, set()).add(keyword)
+        return matches
+
+    def classify(
+        self,
+        intent: str,
+        subject: str,
+        body: str,
+        matches: KeywordMatches | None = None,
+    ) -> str:
+        """
+        Rule-based action for an email whose intent is already known.
+        Provides rule-based classification as safety net.
+        """
+        matches = matches or self.match(subject, body)
+        intent_lower = intent.lower()
+
+        if intent_lower == 'complaint':
+            # Check if it's a strong complaint
+            if matches.has("strong_complaint", "demand"):
+                return "ESCALATE"
+            # Mild complaint might still get auto-reply
+            return "AUTO_REPLY"
+
+        # Strong escalation indicators in text, backed by a demand
+        if matches.has("negative") and matches.has("demand"):
+            return "ESCALATE"
+
+        # Simple queries - AUTO_REPLY
+        if intent_lower in AUTO_REPLY_INTENTS:
+            return "AUTO_REPLY"
+
+        # Shipping/delivery or refund/return keywords
+        if matches.has("shipping", "refund"):
+            return "AUTO_REPLY"
+
+        # Spam/informational - TAG_ARCHIVE
+        if intent_lower in ARCHIVE_INTENTS:
+            return "TAG_ARCHIVE"
+
+        # Default to AUTO_REPLY for customer questions
+        return "AUTO_REPLY"
+
+    def evaluate(self, subject: str, body: str) -> RuleDecision:
+        """
+        Score an email without an LLM intent.
+
+        Each group's evidence is combined noisy-or style from its whole-word
+        hits; competing groups and risk words (anger, demands, legal) lower
+        the confidence of routine decisions.
+        """
+        matches = self.match(subject, body)
+
+        if matches.words.get("legal") or (
+            matches.words.get("strong_complaint") and matches.words.get("demand")
+        ):
+            risk_words = sorted(set().union(*(matches.words.get(g, set()) for g in RISK_GROUPS)))
+            confidence = _noisy_or(risk_words)
+            return RuleDecision("ESCALATE", "complaint", confidence, f"risk: {', '.join(risk_words)}")
+
+        scores = {group: _noisy_or(matches.words.get(group, ())) for group in CANDIDATES}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_group, best_score = ranked[0]
+        if best_score == 0.0:
+            return RuleDecision("AUTO_REPLY", "unknown", 0.0, "no rule matched")
+
+        # Shipping and order tracking agree on the action, so only a
+        # different action counts as competition
+        best_action, best_intent = CANDIDATES[best_group]
+        competing = max(
+            (score for group, score in ranked[1:] if CANDIDATES[group][0] != best_action),
+            default=0.0,
+        )
+        risk = _noisy_or(set().union(*(matches.words.get(g, set()) for g in RISK_GROUPS)))
+        confidence = best_score * (1.0 - 0.5 * competing) * (1.0 - risk)
+
+        return RuleDecision(
+            best_action,
+            best_intent,
+            round(confidence, 4),
+            f"{best_group}: {', '.join(sorted(matches.words[best_group]))}",
+        )
+
+
+def _noisy_or(keywords) -> float:
+    remaining = 1.0
+    for keyword in keywords:
+        remaining *= 1.0 - KEYWORD_WEIGHTS.get(keyword, DEFAULT_WEIGHT)
+    return 1.0 - remaining
+
+
+RULES = RuleEngine()
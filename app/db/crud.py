@@ -1,4 +1,10 @@
-﻿from sqlalchemy.orm import Session
+﻿from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 
 from app.db import models
 
@@ -9,3 +15,278 @@ def create_tenant(db: Session, name: str) -> models.Tenant:
     db.commit()
     db.refresh(tenant)
     return tenant
+
+
+def list_tenants(db: Session) -> list[models.Tenant]:
+    return db.query(models.Tenant).order_by(models.Tenant.id).all()
+
+
+def create_mailbox(db: Session, tenant_id: int, **fields) -> models.Mailbox:
+    mailbox = models.Mailbox(tenant_id=tenant_id, **fields)
+    db.add(mailbox)
+    db.commit()
+    db.refresh(mailbox)
+    return mailbox
+
+
+def list_mailboxes(db: Session, enabled_only: bool = True) -> list[models.Mailbox]:
+    query = db.query(models.Mailbox)
+    if enabled_only:
+        query = query.filter(models.Mailbox.enabled.is_(True))
+    return query.order_by(models.Mailbox.id).all()
+
+
+def get_sync_state(db: Session, account: str, mailbox: str) -> models.MailboxSyncState | None:
+    return (
+        db.query(models.MailboxSyncState)
+        .filter_by(account=account, mailbox=mailbox)
+        .one_or_none()
+    )
+
+
+def save_sync_state(
+    db: Session, account: str, mailbox: str, uidvalidity: int, last_uid: int
+) -> models.MailboxSyncState:
+    state = get_sync_state(db, account, mailbox)
+    if state is None:
+        state = models.MailboxSyncState(account=account, mailbox=mailbox)
+        db.add(state)
+    state.uidvalidity = uidvalidity
+    state.last_uid = last_uid
+    db.commit()
+    return state
+
+
+def get_processed_messages(
+    db: Session, account: str, message_keys: list[str]
+) -> dict[str, models.ProcessedMessage]:
+    if not message_keys:
+        return {}
+    rows = (
+        db.query(models.ProcessedMessage)
+        .filter(
+            models.ProcessedMessage.account == account,
+            models.ProcessedMessage.message_key.in_(message_keys),
+        )
+        .all()
+    )
+    return {row.message_key: row for row in rows}
+
+
+def record_processed_message(
+    db: Session, account: str, message_key: str, uid: int | None, action: str | None
+) -> models.ProcessedMessage:
+    """Record a handled message (``action``) or one more failed attempt (None)"""
+    row = get_processed_messages(db, account, [message_key]).get(message_key)
+    if row is None:
+        row = models.ProcessedMessage(account=account, message_key=message_key, attempts=0)
+        db.add(row)
+    row.uid = uid
+    row.attempts = (row.attempts or 0) + 1
+    if action is not None:
+        row.action = action
+    db.commit()
+    return row
+
+
+def create_email_job(db: Session, payload: str, tenant_id: int | None = None) -> models.EmailJob:
+    job = models.EmailJob(payload=payload, tenant_id=tenant_id, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_email_job(db: Session, job_id: int) -> models.EmailJob | None:
+    return db.get(models.EmailJob, job_id)
+
+
+def claim_email_job(db: Session, worker_id: str, lease: float) -> models.EmailJob | None:
+    """
+    Lease the oldest available job: queued and due, or running with an
+    expired lease. The conditional UPDATE makes the claim atomic, so
+    concurrent workers never get the same job.
+    """
+    Job = models.EmailJob
+    for _ in range(5):
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(Job.status == "queued", Job.available_at <= now),
+            and_(Job.status == "running", Job.locked_until < now),
+        )
+        job_id = db.query(Job.id).filter(claimable).order_by(Job.available_at, Job.id).limit(1).scalar()
+        if job_id is None:
+            return None
+        claimed = (
+            db.query(Job)
+            .filter(Job.id == job_id, claimable)
+            .update(
+                {
+                    Job.status: "running",
+                    Job.locked_by: worker_id,
+                    Job.locked_until: now + timedelta(seconds=lease),
+                    Job.attempts: Job.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed:
+            return db.get(Job, job_id)
+    return None  # lost every race; the caller polls again
+
+
+def finish_email_job(
+    db: Session,
+    job_id: int,
+    worker_id: str,
+    status: str,
+    result: str | None = None,
+    error: str | None = None,
+    retry_at: datetime | None = None,
+) -> bool:
+    """
+    Record the outcome of a leased job; ``retry_at`` puts it back in the
+    queue. False when the lease was lost to another worker meanwhile.
+    """
+    Job = models.EmailJob
+    values = {Job.status: status, Job.error: error, Job.locked_by: None, Job.locked_until: None}
+    if result is not None:
+        values[Job.result] = result
+    if retry_at is not None:
+        values[Job.available_at] = retry_at
+    else:
+        values[Job.finished_at] = datetime.utcnow()
+    updated = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.status == "running", Job.locked_by == worker_id)
+        .update(values, synchronize_session=False)
+    )
+    db.commit()
+    return bool(updated)
+
+
+def count_email_jobs(db: Session) -> dict[str, int]:
+    """Number of webhook jobs per status"""
+    Job = models.EmailJob
+    return dict(db.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+
+
+def email_log_stats(
+    db: Session,
+    tenant_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> list[tuple]:
+    """
+    Per-action aggregates of EmailLog rows in ``[since, until)``:
+    ``(action, emails, errors, trimmed, chars_trimmed, triage_ms, triaged,
+    action_ms, acted)``, where the ``*_ms`` sums go with the counts of rows
+    that have them.
+    """
+    Log = models.EmailLog
+    query = db.query(
+        Log.action,
+        func.count(Log.id),
+        func.count(Log.error),
+        func.count(Log.chars_trimmed),
+        func.coalesce(func.sum(Log.chars_trimmed), 0),
+        func.coalesce(func.sum(Log.triage_ms), 0),
+        func.count(Log.triage_ms),
+        func.coalesce(func.sum(Log.action_ms), 0),
+        func.count(Log.action_ms),
+    )
+    if tenant_id is not None:
+        query = query.filter(Log.tenant_id == tenant_id)
+    if since is not None:
+        query = query.filter(Log.created_at >= since)
+    if until is not None:
+        query = query.filter(Log.created_at < until)
+    return [tuple(row) for row in query.group_by(Log.action).all()]
+
+
+ROLLUP_KEY = ("bucket", "bucket_start", "tenant_id", "action", "intent")
+ROLLUP_MEASURES = (
+    "emails", "errors", "trimmed", "chars_trimmed", "triage_ms", "triaged", "action_ms", "acted",
+)
+
+
+def add_to_stats_rollup(db: Session, values: list[dict]) -> None:
+    """
+    Add ``values`` (ROLLUP_KEY and ROLLUP_MEASURES fields) to the rollup
+    rows with the same key, creating the missing ones. Not committed.
+    """
+    Rollup = models.EmailStatsRollup.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        for start in range(0, len(values), 500):
+            stmt = insert(Rollup).values(values[start:start + 500])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(ROLLUP_KEY),
+                set_={name: Rollup.c[name] + stmt.excluded[name] for name in ROLLUP_MEASURES},
+            )
+            db.execute(stmt)
+        return
+
+    # Other databases: update, then insert when nothing matched
+    for value in values:
+        key = and_(*(Rollup.c[name] == value[name] for name in ROLLUP_KEY))
+        increments = {name: Rollup.c[name] + value[name] for name in ROLLUP_MEASURES}
+        if not db.execute(update(Rollup).where(key).values(increments)).rowcount:
+            db.execute(Rollup.insert().values(value))
+
+
+def stats_rollup_rows(
+    db: Session,
+    bucket: str,
+    start: datetime,
+    end: datetime,
+    tenant_id: int | None = None,
+) -> list[dict]:
+    """Rollup rows of one bucket size with ``start <= bucket_start < end``"""
+    Rollup = models.EmailStatsRollup.__table__
+    query = select(*(Rollup.c[name] for name in ROLLUP_KEY + ROLLUP_MEASURES)).where(
+        Rollup.c.bucket == bucket, Rollup.c.bucket_start >= start, Rollup.c.bucket_start < end
+    )
+    if tenant_id is not None:
+        query = query.where(Rollup.c.tenant_id == tenant_id)
+    return [dict(row) for row in db.execute(query).mappings()]
+
+
+def first_stats_rollup_start(db: Session, bucket: str) -> datetime | None:
+    Rollup = models.EmailStatsRollup
+    return db.query(func.min(Rollup.bucket_start)).filter(Rollup.bucket == bucket).scalar()
+
+
+def delete_stats_rollup(db: Session, bucket: str, before: datetime) -> int:
+    Rollup = models.EmailStatsRollup
+    result = db.execute(delete(Rollup).where(Rollup.bucket == bucket, Rollup.bucket_start < before))
+    db.commit()
+    return result.rowcount
+
+
+def get_rollup_watermark(db: Session, bucket: str) -> datetime | None:
+    row = db.get(models.StatsRollupWatermark, bucket)
+    return None if row is None else row.folded_until
+
+
+def move_rollup_watermark(db: Session, bucket: str, old: datetime | None, new: datetime) -> bool:
+    """
+    Move the watermark from ``old`` to ``new`` (compare-and-set); False if
+    another process moved it first. Not committed.
+    """
+    Watermark = models.StatsRollupWatermark
+    if old is None:
+        try:
+            with db.begin_nested():
+                db.add(Watermark(bucket=bucket, folded_until=new))
+        except IntegrityError:
+            return False
+        return True
+    moved = (
+        db.query(Watermark)
+        .filter(Watermark.bucket == bucket, Watermark.folded_until == old)
+        .update({Watermark.folded_until: new}, synchronize_session=False)
+    )
+    return bool(moved)
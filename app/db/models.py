@@ -1,6 +1,6 @@
 ﻿from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Integer, String, Text
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -11,16 +11,148 @@ class Tenant(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
+    # Emails of this tenant in the pipeline at once, and emails sent to the
+    # LLM per minute (NULL = the TENANT_* defaults)
+    max_concurrency = Column(Integer)
+    llm_emails_per_minute = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class Mailbox(Base):
+    """An IMAP/SMTP account watched by the monitor on behalf of a tenant"""
+    __tablename__ = "mailboxes"
+    __table_args__ = (UniqueConstraint("imap_host", "username", "folder"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, index=True, nullable=False)
+    username = Column(String(255), nullable=False)
+    # Plain value, or "env:NAME" to read it from the environment
+    password = Column(String(500), nullable=False)
+    imap_host = Column(String(255), nullable=False)
+    imap_port = Column(Integer)
+    imap_ssl = Column(Boolean)
+    smtp_host = Column(String(255))
+    smtp_port = Column(Integer)
+    folder = Column(String(255), nullable=False, default="INBOX")
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class EmailLog(Base):
+    """
+    One row per processed email. Stats are aggregated from this table;
+    the composite index serves the per-tenant time-range counts by action.
+    """
     __tablename__ = "email_logs"
+    __table_args__ = (Index("ix_email_logs_tenant_created_action", "tenant_id", "created_at", "action"),)
 
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, index=True)
+    # webhook, job, monitor or backfill
+    source = Column(String(20))
     subject = Column(String(500))
     body = Column(Text)
     intent = Column(String(100))
     action = Column(String(50))
+    # Comma-separated
+    tags = Column(String(500))
+    # Milliseconds spent in the triage (LLM) and action stages
+    triage_ms = Column(Integer)
+    action_ms = Column(Integer)
+    # Characters cut from the body before triage (NULL = nothing cut)
+    chars_trimmed = Column(Integer)
+    error = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class EmailStatsRollup(Base):
+    """
+    EmailLog counts per time bucket (minute, hour or day), tenant, action
+    and intent. Minute rows are added to as EmailLog rows are written;
+    closed hours are folded into hour rows and closed days into day rows
+    (see ``StatsRollupWatermark``). Missing tenant, action or intent are
+    stored as 0 / "" so the unique key also works for them; the key's
+    (bucket, bucket_start) prefix serves range queries.
+    """
+    __tablename__ = "email_stats_rollup"
+    __table_args__ = (UniqueConstraint("bucket", "bucket_start", "tenant_id", "action", "intent"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket = Column(String(10), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    tenant_id = Column(Integer, nullable=False, default=0)
+    action = Column(String(50), nullable=False, default="")
+    intent = Column(String(100), nullable=False, default="")
+    emails = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    trimmed = Column(Integer, nullable=False, default=0)
+    chars_trimmed = Column(BigInteger, nullable=False, default=0)
+    # Latency sums, and the number of emails they cover
+    triage_ms = Column(BigInteger, nullable=False, default=0)
+    triaged = Column(Integer, nullable=False, default=0)
+    action_ms = Column(BigInteger, nullable=False, default=0)
+    acted = Column(Integer, nullable=False, default=0)
+
+
+class StatsRollupWatermark(Base):
+    """Buckets of ``bucket`` size before ``folded_until`` were folded in from the finer size"""
+    __tablename__ = "stats_rollup_watermarks"
+
+    bucket = Column(String(10), primary_key=True)
+    folded_until = Column(DateTime, nullable=False)
+
+
+class EmailJob(Base):
+    """
+    An email accepted by the webhook and waiting for (or done with)
+    processing. Workers lease a job by setting ``locked_until``; a job whose
+    lease expired is picked up again by another worker.
+    """
+    __tablename__ = "email_jobs"
+    __table_args__ = (Index("ix_email_jobs_claim", "status", "available_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, index=True)
+    # queued -> running -> done | failed (running -> queued again on retry)
+    status = Column(String(20), nullable=False, default="queued")
+    payload = Column(Text, nullable=False)
+    result = Column(Text)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String(255))
+    locked_until = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+
+class MailboxSyncState(Base):
+    """Highest processed IMAP UID per mailbox, valid for one UIDVALIDITY"""
+    __tablename__ = "mailbox_sync_state"
+    __table_args__ = (UniqueConstraint("account", "mailbox"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    account = Column(String(255), nullable=False)
+    mailbox = Column(String(255), nullable=False)
+    uidvalidity = Column(BigInteger, nullable=False)
+    last_uid = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ProcessedMessage(Base):
+    """
+    Messages the monitor has seen, keyed by Message-ID (or by
+    UIDVALIDITY/UID when the header is missing). ``action`` stays empty
+    while the message is still being retried.
+    """
+    __tablename__ = "processed_messages"
+    __table_args__ = (UniqueConstraint("account", "message_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    account = Column(String(255), nullable=False)
+    message_key = Column(String(500), nullable=False)
+    uid = Column(BigInteger)
+    action = Column(String(50))
+    attempts = Column(Integer, nullable=False, default=0)
+    processed_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
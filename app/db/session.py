@@ -1,7 +1,68 @@
-﻿from sqlalchemy import create_engine
+﻿import logging
+from typing import Callable
+
+from sqlalchemy import Index, create_engine, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 
+from app.db.models import Base
 from app.utils.config import settings
 
+logger = logging.getLogger(__name__)
+
 engine = create_engine(settings.database_url, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def init_db(bind: Engine | None = None) -> None:
+    """Create any missing tables, and add the columns and indexes missing from existing ones"""
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    upgrade_tables(bind)
+
+
+def upgrade_tables(bind: Engine) -> None:
+    """
+    ``create_all`` never alters a table that exists, so columns and indexes
+    added to the models since it was created are added here. New columns
+    are added as nullable; existing rows get NULL.
+    """
+    preparer = bind.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        columns = _columns(bind, table.name)
+        for column in table.columns:
+            if column.name not in columns:
+                ddl = (
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{preparer.format_column(column)} {column.type.compile(dialect=bind.dialect)}"
+                )
+                _upgrade(bind, ddl, lambda: column.name in _columns(bind, table.name))
+
+        indexes = _indexes(bind, table.name)
+        for index in table.indexes:
+            if index.name not in indexes:
+                _upgrade(bind, index, lambda: index.name in _indexes(bind, table.name))
+
+
+def _columns(bind: Engine, table: str) -> set[str]:
+    return {column["name"] for column in inspect(bind).get_columns(table)}
+
+
+def _indexes(bind: Engine, table: str) -> set[str]:
+    return {index["name"] for index in inspect(bind).get_indexes(table)}
+
+
+def _upgrade(bind: Engine, change: str | Index, applied: Callable[[], bool]) -> None:
+    """Run one DDL change; another process applying it at the same time is fine"""
+    try:
+        with bind.begin() as conn:
+            if isinstance(change, Index):
+                change.create(conn)
+            else:
+                conn.execute(text(change))
+    except SQLAlchemyError:
+        if not applied():
+            raise
+        return
+    logger.info("Database upgraded: %s", f"CREATE INDEX {change.name}" if isinstance(change, Index) else change)
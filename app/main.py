@@ -1,11 +1,20 @@
-﻿from fastapi import FastAPI
+﻿import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 from app.api.email_webhook import router as email_webhook_router
 from app.api.admin import router as admin_router
 from app.api.health import router as health_router
-from app.utils.logger import setup_logging
+from app.api.metrics import router as metrics_router
+from app.db.session import init_db
+from app.services.email_log import close_email_log_writer
+from app.services.llm import aclose_llm_client
+from app.services.metrics import registry as metrics_registry
+from app.services.smtp_pool import close_outbound_queue
+from app.utils.logger import setup_logging, stop_logging
 
 # Load environment variables
 load_dotenv()
@@ -14,11 +23,29 @@ load_dotenv()
 setup_logging()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The webhook's job queue lives in the database
+    await asyncio.to_thread(init_db)
+    yield
+    # Release pooled LLM connections on shutdown
+    await aclose_llm_client()
+    # Send queued replies and close pooled SMTP sessions
+    await asyncio.to_thread(close_outbound_queue)
+    # Write the buffered EmailLog rows
+    await asyncio.to_thread(close_email_log_writer)
+    # Last metrics snapshot, so the other processes' /metrics keep our counts
+    metrics_registry.close()
+    # Write the queued log records (LOG_QUEUE_ENABLED)
+    stop_logging()
+
+
 def create_app() -> FastAPI:
     app = FastAPI(
         title="EmailCleaner Pro",
         description="AI-powered email automation with agentic workflow",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan,
     )
     
     # Add CORS middleware
@@ -32,6 +59,7 @@ def create_app() -> FastAPI:
     
     # Include routers
     app.include_router(health_router, tags=["health"])
+    app.include_router(metrics_router, tags=["metrics"])
     app.include_router(email_webhook_router, prefix="/api", tags=["email"])
     app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
     
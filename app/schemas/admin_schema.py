@@ -6,3 +6,5 @@ class AdminStats(BaseModel):
     auto_replies: int
     tagged: int
     escalations: int
+    trimmed: int = 0
+    chars_trimmed: int = 0
@@ -6,3 +6,9 @@ class EmailInbound(BaseModel):
     body: str
     from_address: str | None = None
     to_address: str | None = None
+    message_id: str | None = None
+    references: str | None = None
+    # IMAP UID in the source mailbox (None for webhook submissions)
+    uid: int | None = None
+    # Loop-relevant headers (Auto-Submitted, Precedence, List-Id, ...)
+    headers: dict[str, str] | None = None
@@ -0,0 +1,57 @@
+"""
+Side effects for a crew decision: auto-reply, tag and archive, or escalate.
+"""
+import logging
+from concurrent.futures import Future
+from functools import partial
+
+from app.schemas.email_schema import EmailInbound
+from app.services.email_service import EmailService
+from app.services.escalation_service import EscalationService
+from app.services.loop_guard import auto_generated_reason
+from app.services.metrics import EMAIL_ERRORS
+from app.services.tagging_service import TaggingService
+
+logger = logging.getLogger(__name__)
+
+
+def execute_action(payload: EmailInbound, result: dict) -> None:
+    """Run the blocking side effect (SMTP, tagging, escalation) for a crew result"""
+    action = result.get("action")
+    try:
+        loop_reason = auto_generated_reason(payload) if action == "AUTO_REPLY" else None
+        if loop_reason:
+            # Answering an auto-responder starts a mail loop
+            logger.info("Suppressed auto-reply to auto-generated mail (%s): %s", loop_reason, payload.subject)
+            result["reply_suppressed"] = loop_reason
+
+        elif action == "AUTO_REPLY":
+            reply = result.get("reply", "")
+            if reply:
+                future = EmailService().send_reply(payload, reply)
+                if future is not None:
+                    logger.info("Queued auto-reply for: %s", payload.subject)
+                    future.add_done_callback(partial(_log_sent, payload.subject))
+            else:
+                logger.warning("Auto-reply action but no reply generated")
+                
+        elif action == "TAG_ARCHIVE":
+            tags = result.get("tags", [])
+            TaggingService().tag_and_archive(payload, tags)
+            logger.info("Tagged email with: %s", tags)
+            
+        elif action == "ESCALATE":
+            summary = result.get("summary", "No summary available")
+            EscalationService().notify_human(payload, summary)
+            logger.info("Escalated email: %s", payload.subject)
+            
+    except Exception as e:
+        logger.error("Action execution failed: %s", e)
+        EMAIL_ERRORS.labels("action", type(e).__name__).inc()
+        result["action_error"] = str(e)
+
+
+def _log_sent(subject: str, future: Future) -> None:
+    # Counted by the log-based stats; only once SMTP accepted the reply
+    if not future.cancelled() and future.exception() is None:
+        logger.info("Sent auto-reply for: %s", subject)
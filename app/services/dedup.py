@@ -0,0 +1,192 @@
+"""
+Near-duplicate detection for bulk email campaigns.
+
+Emails are reduced to a 64-bit SimHash over word shingles of their
+normalized subject and body. Fingerprints within a small Hamming distance
+belong to the same cluster; the first email of a cluster (its
+representative) keeps the crew result that later duplicates reuse.
+Clusters are scoped (per tenant): an email only matches clusters of its
+own scope, so one tenant's decisions and replies never reach another.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from app.utils.config import settings
+
+FINGERPRINT_BITS = 64
+
+_GREETING_RE = re.compile(r"^\s*(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^\n]*\n", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"\d+")
+_WORD_RE = re.compile(r"[a-z0-9#]+")
+
+
+def normalize(subject: str, body: str) -> list[str]:
+    """Lowercased word tokens with greetings dropped and numbers masked"""
+    body = _GREETING_RE.sub("", body or "", count=1)
+    text = f"{subject or ''}\n{body}".lower()
+    text = _NUMBER_RE.sub("#", text)
+    return _WORD_RE.findall(text)
+
+
+def shingles(tokens: list[str], size: int = 3) -> list[str]:
+    if len(tokens) <= size:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+
+def simhash(features: list[str]) -> int:
+    weights = [0] * FINGERPRINT_BITS
+    for feature in features:
+        digest = int.from_bytes(
+            hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if digest >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+@dataclass
+class Cluster:
+    id: int
+    fingerprint: int
+    created_at: float
+    result: dict
+    duplicates: int = 0
+    bands: tuple[tuple, ...] = field(default_factory=tuple)
+
+
+class NearDuplicateIndex:
+    """
+    Bounded in-memory SimHash index.
+
+    Fingerprints are split into ``bands`` equal bit ranges; two fingerprints
+    within ``max_distance`` bits share at least one band exactly as long as
+    ``max_distance < bands``, so only same-band entries are compared.
+    Clusters older than ``window`` seconds are ignored and evicted, and the
+    index never holds more than ``max_entries`` clusters.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        window: float = 3600.0,
+        max_distance: int = 3,
+        bands: int = 4,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.window = window
+        self.max_distance = max_distance
+        self.bands = max(max_distance + 1, bands)
+        self._band_bits = FINGERPRINT_BITS // self.bands
+        self._clusters: OrderedDict[int, Cluster] = OrderedDict()
+        self._buckets: dict[tuple, set[int]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def fingerprint(self, subject: str, body: str) -> int | None:
+        features = shingles(normalize(subject, body))
+        return simhash(features) if features else None
+
+    def lookup(self, subject: str, body: str, scope=None) -> Cluster | None:
+        """Return the live cluster of ``scope`` this email duplicates, if any"""
+        fingerprint = self.fingerprint(subject, body)
+        if fingerprint is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            best: Cluster | None = None
+            best_distance = self.max_distance + 1
+            for band_key in self._band_keys(fingerprint, scope):
+                for cluster_id in self._buckets.get(band_key, ()):
+                    cluster = self._clusters[cluster_id]
+                    distance = hamming_distance(fingerprint, cluster.fingerprint)
+                    if distance < best_distance:
+                        best, best_distance = cluster, distance
+            if best is not None:
+                best.duplicates += 1
+            return best
+
+    def add(self, subject: str, body: str, result: dict, scope=None) -> Cluster | None:
+        """Register an email as the representative of a new cluster in ``scope``"""
+        fingerprint = self.fingerprint(subject, body)
+        if fingerprint is None:
+            return None
+        with self._lock:
+            cluster = Cluster(
+                id=self._next_id,
+                fingerprint=fingerprint,
+                created_at=time.time(),
+                result=dict(result),
+                bands=tuple(self._band_keys(fingerprint, scope)),
+            )
+            self._next_id += 1
+            self._clusters[cluster.id] = cluster
+            for band_key in cluster.bands:
+                self._buckets.setdefault(band_key, set()).add(cluster.id)
+            while len(self._clusters) > self.max_entries:
+                self._evict(next(iter(self._clusters)))
+            return cluster
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clusters": len(self._clusters),
+                "duplicates": sum(cluster.duplicates for cluster in self._clusters.values()),
+            }
+
+    def _band_keys(self, fingerprint: int, scope=None) -> list[tuple]:
+        mask = (1 << self._band_bits) - 1
+        return [
+            (scope, band, fingerprint >> (band * self._band_bits) & mask)
+            for band in range(self.bands)
+        ]
+
+    def _expire(self, now: float) -> None:
+        # Clusters are kept in insertion order, so the oldest come first
+        while self._clusters:
+            cluster = next(iter(self._clusters.values()))
+            if now - cluster.created_at <= self.window:
+                break
+            self._evict(cluster.id)
+
+    def _evict(self, cluster_id: int) -> None:
+        cluster = self._clusters.pop(cluster_id)
+        for band_key in cluster.bands:
+            members = self._buckets.get(band_key)
+            if members is not None:
+                members.discard(cluster_id)
+                if not members:
+                    del self._buckets[band_key]
+
+
+_shared_index: NearDuplicateIndex | None = None
+_shared_lock = threading.Lock()
+
+
+def get_dedup_index() -> NearDuplicateIndex:
+    """Return the process-wide near-duplicate index"""
+    global _shared_index
+    if _shared_index is None:
+        with _shared_lock:
+            if _shared_index is None:
+                _shared_index = NearDuplicateIndex(
+                    max_entries=settings.crew_dedup_max_entries,
+                    window=settings.crew_dedup_window,
+                    max_distance=settings.crew_dedup_max_distance,
+                )
+    return _shared_index
@@ -0,0 +1,267 @@
+"""
+Structured per-email records in EmailLog, and the stats computed from them.
+
+``record_email`` turns a processed email into a row and hands it to the
+process-wide ``EmailLogWriter``, which inserts rows from a background
+thread in batches: one transaction per ``batch_size`` rows or per
+``flush_interval`` seconds, whichever comes first. Recording never blocks
+processing; while the database is unreachable rows wait in a bounded
+buffer, and rows that do not fit are dropped (and counted). Each batch
+is also counted into the stats rollups in the same transaction, and the
+writer thread compacts the rollups every ``compact_interval`` seconds.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.models import EmailLog
+from app.db.session import SessionLocal
+from app.schemas.email_schema import EmailInbound
+from app.services.metrics import EMAIL_STAGE_SECONDS, EMAILS_PROCESSED
+from app.services.stats_rollup import add_email_logs, compact_rollups
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Stats counters per crew action
+_ACTION_COUNTERS = {"AUTO_REPLY": "auto_replies", "TAG_ARCHIVE": "tagged", "ESCALATE": "escalations"}
+
+
+class EmailLogWriter:
+    def __init__(
+        self,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_buffer: int = 10_000,
+        compact_interval: float | None = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_buffer = max(1, max_buffer)
+        # None: rollups are compacted elsewhere
+        self.compact_interval = compact_interval
+        self._compacted_at = time.monotonic()
+        self._session_factory = session_factory
+        self._buffer: deque[dict] = deque()
+        self._cond = threading.Condition()
+        # Serializes inserts between the background thread and flush()
+        self._write_lock = threading.Lock()
+        self._counters = {"written": 0, "dropped": 0, "failed_batches": 0}
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    def add(self, row: dict) -> bool:
+        """Buffer a row for the next batch; False if it was dropped"""
+        with self._cond:
+            if self._closed or len(self._buffer) >= self.max_buffer:
+                self._counters["dropped"] += 1
+                return False
+            self._buffer.append(row)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="email-log-writer", daemon=True)
+                self._thread.start()
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def flush(self) -> int:
+        """Write everything buffered now; returns the number of rows written"""
+        written = 0
+        while True:
+            batch = self._take()
+            if not batch:
+                return written
+            if not self._write(batch):
+                return written
+            written += len(batch)
+
+    def close(self) -> None:
+        """Stop the background thread and write what is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {**self._counters, "buffered": len(self._buffer)}
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._buffer) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return  # close() writes the rest
+            batch = self._take()
+            if batch and not self._write(batch):
+                # Database unavailable: rows stay buffered, retry next interval
+                with self._cond:
+                    self._cond.wait(self.flush_interval)
+            self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if self.compact_interval is None or time.monotonic() - self._compacted_at < self.compact_interval:
+            return
+        self._compacted_at = time.monotonic()
+        try:
+            compact_rollups(session_factory=self._session_factory)
+        except Exception as e:
+            logger.error("Stats rollup compaction failed: %s", e)
+
+    def _take(self) -> list[dict]:
+        with self._cond:
+            count = min(self.batch_size, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def _write(self, batch: list[dict]) -> bool:
+        try:
+            with self._write_lock, self._session_factory() as db:
+                db.execute(insert(EmailLog), batch)
+                add_email_logs(db, batch)
+                db.commit()
+        except Exception as e:
+            logger.error("Could not write %s email log row(s): %s", len(batch), e)
+            with self._cond:
+                self._counters["failed_batches"] += 1
+                # Back to the front, oldest first; what no longer fits is dropped
+                room = self.max_buffer - len(self._buffer)
+                self._counters["dropped"] += max(0, len(batch) - room)
+                self._buffer.extendleft(reversed(batch[:max(0, room)]))
+            return False
+        with self._cond:
+            self._counters["written"] += len(batch)
+        return True
+
+
+def email_log_row(
+    email: EmailInbound,
+    result: dict | None,
+    tenant_id: int | None = None,
+    source: str | None = None,
+    error: str | None = None,
+) -> dict:
+    """The EmailLog row of one processed email (``result`` is the crew's)"""
+    result = result or {}
+    stage_ms = result.get("stage_ms") or {}
+    tags = ",".join(str(tag) for tag in result.get("tags") or [])
+    return {
+        "tenant_id": tenant_id,
+        "source": source,
+        "subject": (email.subject or "")[:500],
+        "intent": (result.get("intent") or "")[:100] or None,
+        "action": result.get("action"),
+        "tags": tags[:500] or None,
+        "triage_ms": _ms(stage_ms.get("triage")),
+        "action_ms": _ms(stage_ms.get("action")),
+        "chars_trimmed": (result.get("preprocess") or {}).get("removed_chars"),
+        "error": error or result.get("error") or result.get("action_error"),
+        # Taken now: the row may be inserted a flush interval later
+        "created_at": datetime.utcnow(),
+    }
+
+
+def record_email(
+    email: EmailInbound,
+    result: dict | None,
+    tenant_id: int | None = None,
+    source: str | None = None,
+    error: str | None = None,
+) -> None:
+    """Count a processed email and queue its EmailLog row (with EMAIL_LOG_ENABLED=true)"""
+    _observe(result, source)
+    if not settings.email_log_enabled:
+        return
+    try:
+        get_email_log_writer().add(email_log_row(email, result, tenant_id, source, error))
+    except Exception as e:
+        logger.error("Could not record email log row: %s", e)
+
+
+def _observe(result: dict | None, source: str | None) -> None:
+    result = result or {}
+    source = source or "unknown"
+    EMAILS_PROCESSED.labels(source, result.get("action") or "none").inc()
+    for stage, ms in (result.get("stage_ms") or {}).items():
+        EMAIL_STAGE_SECONDS.labels(source, stage).observe(ms / 1000)
+
+
+def email_stats(
+    tenant_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> dict:
+    """Pipeline counters aggregated from EmailLog in SQL"""
+    with session_factory() as db:
+        rows = crud.email_log_stats(db, tenant_id, since, until)
+
+    stats = {
+        "processed": 0, "auto_replies": 0, "tagged": 0, "escalations": 0,
+        "errors": 0, "trimmed": 0, "chars_trimmed": 0,
+    }
+    triage_ms = triaged = action_ms = acted = 0
+    for action, emails, errors, trimmed, chars_trimmed, *latency in rows:
+        stats["processed"] += emails
+        if action in _ACTION_COUNTERS:
+            stats[_ACTION_COUNTERS[action]] += emails
+        stats["errors"] += errors
+        stats["trimmed"] += trimmed
+        stats["chars_trimmed"] += int(chars_trimmed)
+        triage_ms, triaged = triage_ms + int(latency[0]), triaged + latency[1]
+        action_ms, acted = action_ms + int(latency[2]), acted + latency[3]
+    stats["avg_triage_ms"] = round(triage_ms / triaged, 1) if triaged else None
+    stats["avg_action_ms"] = round(action_ms / acted, 1) if acted else None
+    return stats
+
+
+def elapsed_ms(started: float) -> int:
+    """Milliseconds since ``started`` (a ``time.perf_counter()`` value)"""
+    return int((time.perf_counter() - started) * 1000)
+
+
+def _ms(value) -> int | None:
+    return None if value is None else int(value)
+
+
+_shared: EmailLogWriter | None = None
+_shared_lock = threading.Lock()
+
+
+def get_email_log_writer() -> EmailLogWriter:
+    """Return the process-wide writer (flushed at interpreter exit)"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = EmailLogWriter(
+                    batch_size=settings.email_log_batch_size,
+                    flush_interval=settings.email_log_flush_interval,
+                    max_buffer=settings.email_log_buffer_size,
+                    compact_interval=settings.rollup_compact_interval,
+                )
+                atexit.register(_shared.close)
+    return _shared
+
+
+def close_email_log_writer() -> None:
+    """Write the buffered rows; worker processes call this before exiting"""
+    if _shared is not None:
+        _shared.close()
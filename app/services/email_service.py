@@ -5,13 +5,33 @@ Handles sending and receiving emails through Gmail IMAP/SMTP
 import os
 import smtplib
 import imaplib
-import email
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime
+from email.utils import formatdate, make_msgid
+from email.parser import BytesHeaderParser
+from email.policy import default as default_policy
+from typing import Iterator
 import logging
 
+from app.db.models import Mailbox
 from app.schemas.email_schema import EmailInbound
+from app.services.imap_fetch import (
+    HEADER_FIELDS,
+    chunked,
+    decode_part,
+    find_text_part,
+    header_bytes,
+    parse_fetch_response,
+    uid_set,
+)
+from app.services.loop_guard import AUTO_REPLY_HEADERS, LOOP_HEADER_FIELDS, loop_headers
+from app.services.metrics import IMAP_FETCH_SECONDS, IMAP_MESSAGES, MIME_PARSE_SECONDS
+from app.services.mime_parser import html_to_text
+from app.services.smtp_pool import get_outbound_queue
 
 logger = logging.getLogger(__name__)
 
@@ -19,73 +39,144 @@ logger = logging.getLogger(__name__)
 class EmailService:
     """Email service for Gmail integration"""
     
-    def __init__(self):
+    def __init__(self, mailbox: Mailbox | None = None):
+        """
+        Args:
+            mailbox: Per-tenant mailbox config; without one, the single
+                account from the environment is used
+        """
         # Gmail configuration from environment variables
         self.email_user = os.getenv("EMAIL_USER")
         self.email_password = os.getenv("EMAIL_PASSWORD")
         self.smtp_host = os.getenv("EMAIL_SMTP_HOST", "smtp.gmail.com")
         self.smtp_port = int(os.getenv("EMAIL_SMTP_PORT", "587"))
         self.imap_host = os.getenv("EMAIL_IMAP_HOST", "imap.gmail.com")
+        self.imap_port = int(os.getenv("EMAIL_IMAP_PORT", "993"))
+        # Plain IMAP is only meant for local test servers
+        self.imap_ssl = os.getenv("EMAIL_IMAP_SSL", "true").lower() != "false"
+        self.imap_folder = "INBOX"
+        self.tenant_id = None
+        if mailbox is not None:
+            self._apply_mailbox(mailbox)
+        # UIDs per bulk FETCH, and the byte cap for the downloaded text part
+        self.fetch_chunk = int(os.getenv("EMAIL_FETCH_CHUNK", "200"))
+        self.fetch_max_bytes = int(os.getenv("EMAIL_FETCH_MAX_BYTES", "65536"))
         
         # Validate configuration
         if not self.email_user or not self.email_password:
             logger.warning("Email credentials not configured. Email sending will be disabled.")
     
-    def send_reply(self, email: EmailInbound, reply_text: str) -> None:
+    def _apply_mailbox(self, mailbox: Mailbox) -> None:
+        self.tenant_id = mailbox.tenant_id
+        self.email_user = mailbox.username
+        self.email_password = _resolve_secret(mailbox.password)
+        self.imap_host = mailbox.imap_host or self.imap_host
+        self.imap_port = mailbox.imap_port or self.imap_port
+        if mailbox.imap_ssl is not None:
+            self.imap_ssl = mailbox.imap_ssl
+        self.smtp_host = mailbox.smtp_host or self.smtp_host
+        self.smtp_port = mailbox.smtp_port or self.smtp_port
+        self.imap_folder = mailbox.folder or self.imap_folder
+    
+    def build_reply(self, email: EmailInbound, reply_text: str) -> MIMEMultipart:
+        """Reply message threaded onto the original via In-Reply-To/References"""
+        msg = MIMEMultipart()
+        msg['From'] = self.email_user
+        msg['To'] = email.from_address
+        subject = email.subject or ""
+        msg['Subject'] = subject if subject.lower().startswith("re:") else f"Re: {subject}"
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid(domain=(self.email_user or "").rpartition("@")[2] or None)
+        for name, value in AUTO_REPLY_HEADERS.items():
+            msg[name] = value
+        if email.message_id:
+            msg['In-Reply-To'] = email.message_id
+            msg['References'] = " ".join(filter(None, [email.references, email.message_id]))
+        
+        # Add reply text
+        msg.attach(MIMEText(reply_text, 'plain'))
+        return msg
+    
+    def send_reply(self, email: EmailInbound, reply_text: str, wait: bool = False) -> Future | None:
         """
         Send reply email using Gmail SMTP
         
+        The message is handed to the outbound queue, whose workers send it
+        over pooled SMTP sessions; the call returns right away unless
+        ``wait`` is set.
+        
         Args:
             email: Original email to reply to
             reply_text: Reply message text
+            wait: Block until the message was sent (errors are raised)
+        
+        Returns:
+            Future that resolves once the message was sent
         """
         if not self.email_user or not self.email_password:
             logger.error("Cannot send email - credentials not configured")
+            return None
+        
+        msg = self.build_reply(email, reply_text)
+        outbound = get_outbound_queue(
+            self.smtp_host, self.smtp_port, self.email_user, self.email_password
+        )
+        future = outbound.submit(msg)
+        future.add_done_callback(_log_send_failure)
+        logger.info("Queued reply to: %s", email.from_address)
+        
+        if wait:
+            future.result()
+        return future
+    
+    def connect_imap(self) -> imaplib.IMAP4:
+        """Open and log in an IMAP connection (no mailbox selected)"""
+        logger.info("Connecting to IMAP server: %s:%s", self.imap_host, self.imap_port)
+        if self.imap_ssl:
+            mail = imaplib.IMAP4_SSL(self.imap_host, self.imap_port)
+        else:
+            mail = imaplib.IMAP4(self.imap_host, self.imap_port)
+        
+        logger.info("Logging in as: %s", self.email_user)
+        mail.login(self.email_user, self.email_password)
+        return mail
+    
+    @contextmanager
+    def imap_session(self, mail: imaplib.IMAP4 | None = None) -> Iterator[imaplib.IMAP4]:
+        """
+        Yield a connection with the folder selected. A connection passed in (e.g.
+        from the IMAP watcher) is reused and left open; otherwise one is
+        opened for the block and closed afterwards.
+        """
+        if mail is not None:
+            yield mail
             return
         
+        mail = self.connect_imap()
         try:
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = self.email_user
-            msg['To'] = email.from_address
-            msg['Subject'] = f"Re: {email.subject}"
-            
-            # Add reply text
-            msg.attach(MIMEText(reply_text, 'plain'))
-            
-            # Connect to Gmail SMTP
-            logger.info(f"Connecting to SMTP server: {self.smtp_host}:{self.smtp_port}")
-            server = smtplib.SMTP(self.smtp_host, self.smtp_port)
-            server.starttls()  # Enable TLS encryption
-            
-            # Login
-            logger.info(f"Logging in as: {self.email_user}")
-            server.login(self.email_user, self.email_password)
-            
-            # Send email
-            logger.info(f"Sending reply to: {email.from_address}")
-            server.send_message(msg)
-            server.quit()
-            
-            logger.info(f"✅ Successfully sent reply to {email.from_address}")
-            
-        except smtplib.SMTPAuthenticationError:
-            logger.error("❌ SMTP Authentication failed! Check your email credentials.")
-            logger.error("Make sure you're using Gmail App Password, not your regular password")
-            raise
-            
-        except smtplib.SMTPException as e:
-            logger.error(f"❌ SMTP error: {e}")
-            raise
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to send email: {e}")
-            raise
+            mail.select(self.imap_folder)
+            yield mail
+        finally:
+            try:
+                mail.close()
+                mail.logout()
+            except Exception:
+                pass
     
-    def fetch_unread(self) -> list[EmailInbound]:
+    def fetch_unread(self, mail: imaplib.IMAP4 | None = None) -> list[EmailInbound]:
         """
         Fetch unread emails from Gmail IMAP
         
+        Messages are fetched in chunks of ``fetch_chunk``: one FETCH returns the
+        BODYSTRUCTURE and headers for the whole chunk, and one more per
+        distinct text-part section downloads only that part, capped at
+        ``fetch_max_bytes`` (the text/html part, converted to text, when there
+        is no text/plain one). Everything uses BODY.PEEK, so messages stay
+        unread until ``mark_seen`` is called after they were handled.
+        
+        Args:
+            mail: Connection with the folder already selected (see imap_session)
+        
         Returns:
             List of unread emails
         """
@@ -96,78 +187,125 @@ class EmailService:
         emails = []
         
         try:
-            # Connect to Gmail IMAP
-            logger.info(f"Connecting to IMAP server: {self.imap_host}")
-            mail = imaplib.IMAP4_SSL(self.imap_host)
-            
-            # Login
-            logger.info(f"Logging in as: {self.email_user}")
-            mail.login(self.email_user, self.email_password)
-            
-            # Select inbox
-            mail.select("INBOX")
-            
-            # Search for unread emails
-            status, messages = mail.search(None, 'UNSEEN')
-            
-            if status != "OK":
-                logger.error("Failed to search for emails")
-                return []
-            
-            email_ids = messages[0].split()
-            logger.info(f"Found {len(email_ids)} unread emails")
+            with self.imap_session(mail) as conn:
+                # Search for unread emails
+                status, messages = conn.uid("SEARCH", None, "UNSEEN")
+                
+                if status != "OK":
+                    logger.error("Failed to search for emails")
+                    return []
+                
+                uids = [int(uid) for uid in messages[0].split()]
+                logger.info("Found %s unread emails", len(uids))
+                
+                emails = self.fetch_messages(conn, uids)
             
-            # Fetch each email
-            for email_id in email_ids:
-                try:
-                    status, msg_data = mail.fetch(email_id, "(RFC822)")
-                    
-                    if status != "OK":
-                        continue
-                    
-                    # Parse email
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    
-                    # Extract fields
-                    from_address = msg.get("From", "")
-                    subject = msg.get("Subject", "")
-                    
-                    # Get email body
-                    body = ""
-                    if msg.is_multipart():
-                        for part in msg.walk():
-                            if part.get_content_type() == "text/plain":
-                                body = part.get_payload(decode=True).decode()
-                                break
-                    else:
-                        body = msg.get_payload(decode=True).decode()
-                    
-                    # Create EmailInbound object
-                    email_obj = EmailInbound(
-                        from_address=from_address,
-                        subject=subject,
-                        body=body,
-                        received_at=datetime.now().isoformat()
-                    )
-                    
-                    emails.append(email_obj)
-                    logger.info(f"Fetched email: {subject}")
-                    
-                except Exception as e:
-                    logger.error(f"Error parsing email {email_id}: {e}")
-                    continue
-            
-            # Close connection
-            mail.close()
-            mail.logout()
-            
-            logger.info(f"✅ Successfully fetched {len(emails)} emails")
+            logger.info("✅ Successfully fetched %s emails", len(emails))
             return emails
             
+        except imaplib.IMAP4.abort:
+            if mail is not None:
+                raise  # the caller reconnects its connection
+            logger.error("❌ IMAP connection lost")
+            return []
+            
         except imaplib.IMAP4.error as e:
-            logger.error(f"❌ IMAP error: {e}")
+            logger.error("❌ IMAP error: %s", e)
             return []
             
         except Exception as e:
-            logger.error(f"❌ Failed to fetch emails: {e}")
+            logger.error("❌ Failed to fetch emails: %s", e)
+            return []
+    
+    def fetch_messages(self, mail: imaplib.IMAP4, uids: list[int]) -> list[EmailInbound]:
+        """Fetch the given UIDs (see fetch_unread); IMAP errors propagate"""
+        emails = []
+        for chunk in chunked(uids, self.fetch_chunk):
+            emails.extend(self._fetch_chunk(mail, chunk))
+        return emails
+    
+    def mark_seen(self, mail: imaplib.IMAP4, uids: list[int]) -> None:
+        """Set \\Seen on messages that have been handled"""
+        for chunk in chunked(sorted(uids), self.fetch_chunk):
+            status, _ = mail.uid("STORE", uid_set(chunk), "+FLAGS.SILENT", r"(\Seen)")
+            if status != "OK":
+                logger.error("Failed to mark %s emails as seen", len(chunk))
+    
+    def _fetch_chunk(self, mail: imaplib.IMAP4, uids: list[int]) -> list[EmailInbound]:
+        with IMAP_FETCH_SECONDS.labels("headers").time():
+            status, data = mail.uid(
+                "FETCH", uid_set(uids), f"(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS} {LOOP_HEADER_FIELDS})])"
+            )
+        if status != "OK":
+            logger.error("Failed to fetch headers for %s emails", len(uids))
             return []
+        messages = parse_fetch_response(data)
+        
+        # Group messages by text-part section so each group is one FETCH
+        parts = {}
+        by_section = defaultdict(list)
+        for uid, fields in messages.items():
+            structure = fields.get("BODYSTRUCTURE")
+            # HTML-only mail is converted to text after download
+            part = find_text_part(structure) or find_text_part(structure, "html")
+            if part is not None:
+                parts[uid] = part
+                by_section[part.section].append(uid)
+        
+        bodies = {}
+        for section, section_uids in by_section.items():
+            with IMAP_FETCH_SECONDS.labels("body").time():
+                status, data = mail.uid(
+                    "FETCH", uid_set(section_uids), f"(UID BODY.PEEK[{section}]<0.{self.fetch_max_bytes}>)"
+                )
+            if status != "OK":
+                logger.error("Failed to fetch body section %s", section)
+                continue
+            for uid, fields in parse_fetch_response(data).items():
+                raw = fields.get(f"BODY[{section}]")
+                if uid in parts and isinstance(raw, bytes):
+                    started = time.perf_counter()
+                    text = decode_part(raw, parts[uid].encoding, parts[uid].charset)
+                    bodies[uid] = html_to_text(text) if parts[uid].subtype == "html" else text
+                    MIME_PARSE_SECONDS.observe(time.perf_counter() - started)
+        
+        emails = []
+        for uid in uids:
+            if uid not in messages:
+                continue
+            try:
+                headers = BytesHeaderParser(policy=default_policy).parsebytes(
+                    header_bytes(messages[uid])
+                )
+                subject = str(headers.get("Subject", ""))
+                email_obj = EmailInbound(
+                    from_address=str(headers.get("From", "")),
+                    to_address=str(headers.get("To", "")) or None,
+                    subject=subject,
+                    body=bodies.get(uid, ""),
+                    message_id=str(headers.get("Message-ID", "")).strip() or None,
+                    references=str(headers.get("References", "")).strip() or None,
+                    uid=uid,
+                    headers=loop_headers(headers) or None,
+                )
+                emails.append(email_obj)
+                logger.debug("Fetched email: %s", subject)
+            except Exception as e:
+                logger.error("Error parsing email %s: %s", uid, e)
+        IMAP_MESSAGES.inc(len(emails))
+        return emails
+
+
+def _log_send_failure(future: Future) -> None:
+    if future.cancelled():
+        return
+    if isinstance(future.exception(), smtplib.SMTPAuthenticationError):
+        logger.error("❌ SMTP Authentication failed! Check your email credentials.")
+        logger.error("Make sure you're using Gmail App Password, not your regular password")
+
+
+def _resolve_secret(value: str | None) -> str | None:
+    """Mailbox passwords may be stored as "env:NAME" to keep them out of the database"""
+    if value and value.startswith("env:"):
+        return os.getenv(value[4:])
+    return value
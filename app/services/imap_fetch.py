@@ -0,0 +1,226 @@
+"""
+Helpers for bulk IMAP fetching.
+
+Messages are fetched by UID in chunks. The first round trip of a chunk
+returns the BODYSTRUCTURE and a few headers of every message; the second
+downloads only each message's text/plain part with ``BODY.PEEK[section]``
+and a byte cap, so attachments are never transferred and the \\Seen flag is
+left alone until the message has actually been handled.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import codecs
+import quopri
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+HEADER_FIELDS = "FROM TO SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES"
+
+_OPEN = object()
+_CLOSE = object()
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+_PARTIAL_RE = re.compile(r"<\d+>$")
+# Mislabelled mail is common: ASCII labels often hide UTF-8 and Latin-1
+# labels Windows-1252 (the superset browsers decode it as)
+_CHARSET_ALIASES = {"ascii": "utf-8", "iso8859-1": "cp1252"}
+
+
+@dataclass(frozen=True)
+class TextPart:
+    section: str
+    subtype: str
+    encoding: str
+    charset: str
+    size: int
+
+
+def chunked(items: list, size: int) -> Iterator[list]:
+    for start in range(0, len(items), max(1, size)):
+        yield items[start:start + size]
+
+
+def uid_set(uids: Iterable[int]) -> str:
+    """Compact IMAP sequence set, e.g. [1, 2, 3, 7] -> "1:3,7" """
+    ordered = sorted(set(uids))
+    ranges: list[str] = []
+    start = prev = None
+    for uid in ordered:
+        if start is None:
+            start = prev = uid
+        elif uid == prev + 1:
+            prev = uid
+        else:
+            ranges.append(f"{start}:{prev}" if start != prev else str(start))
+            start = prev = uid
+    if start is not None:
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+
+def parse_fetch_response(data: list) -> dict[int, dict[str, object]]:
+    """
+    Turn ``imaplib`` FETCH data into ``{uid: {ITEM: value}}``.
+
+    Item names are upper-cased with any partial-fetch origin removed
+    (``BODY[1]<0>`` -> ``BODY[1]``); lists become Python lists, NIL becomes
+    None and strings/literals stay bytes. Responses without a UID (e.g.
+    unsolicited flag updates) are skipped.
+    """
+    tokens = _tokenize(data)
+    messages: dict[int, dict[str, object]] = {}
+    position = 0
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token is not _OPEN:
+            continue  # message sequence number
+        items, position = _read_list(tokens, position)
+        fields: dict[str, object] = {}
+        for index in range(0, len(items) - 1, 2):
+            name = items[index]
+            if isinstance(name, bytes):
+                key = _PARTIAL_RE.sub("", name.decode("ascii", "replace").upper())
+                fields[key] = items[index + 1]
+        uid = fields.get("UID")
+        if isinstance(uid, bytes) and uid.isdigit():
+            messages[int(uid)] = fields
+    return messages
+
+
+def header_bytes(fields: dict[str, object]) -> bytes:
+    """The ``BODY[HEADER.FIELDS (...)]`` item of a parsed FETCH response"""
+    for key, value in fields.items():
+        if key.startswith("BODY[HEADER") and isinstance(value, bytes):
+            return value
+    return b""
+
+
+def find_text_part(structure: object, subtype: str = "plain") -> TextPart | None:
+    """First non-attachment text/<subtype> part of a BODYSTRUCTURE"""
+    if not isinstance(structure, list):
+        return None
+    for section, node in _walk(structure, ""):
+        if len(node) < 7 or not all(isinstance(value, bytes) for value in node[:2]):
+            continue
+        if node[0].lower() != b"text" or node[1].lower() != subtype.encode():
+            continue
+        disposition = node[9] if len(node) > 9 else None
+        if isinstance(disposition, list) and disposition and _text(disposition[0]).lower() == "attachment":
+            continue
+        params = node[2] if isinstance(node[2], list) else []
+        charset = "utf-8"
+        for index in range(0, len(params) - 1, 2):
+            if _text(params[index]).lower() == "charset":
+                charset = _text(params[index + 1]) or charset
+        return TextPart(
+            section=section,
+            subtype=subtype,
+            encoding=_text(node[5]).lower() or "7bit",
+            charset=charset,
+            size=int(node[6]) if isinstance(node[6], bytes) and node[6].isdigit() else 0,
+        )
+    return None
+
+
+def decode_part(raw: bytes, encoding: str, charset: str) -> str:
+    """Undo the transfer encoding of a (possibly truncated) part and decode it"""
+    if encoding == "base64":
+        compact = re.sub(rb"[^A-Za-z0-9+/=]", b"", raw)
+        compact = compact[:len(compact) - len(compact) % 4]
+        try:
+            raw = base64.b64decode(compact)
+        except binascii.Error:
+            raw = b""
+    elif encoding == "quoted-printable":
+        raw = quopri.decodestring(raw)
+    try:
+        charset = codecs.lookup(charset).name
+    except LookupError:
+        charset = "utf-8"
+    return raw.decode(_CHARSET_ALIASES.get(charset, charset), errors="replace")
+
+
+def _walk(node: list, section: str) -> Iterator[tuple[str, list]]:
+    if node and isinstance(node[0], list):
+        # multipart: child parts come first, then the subtype and extensions
+        index = 0
+        for child in node:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from _walk(child, f"{section}.{index}" if section else str(index))
+    else:
+        yield section or "1", node
+
+
+def _text(value: object) -> str:
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else ""
+
+
+def _tokenize(data: list) -> list:
+    tokens: list = []
+    for item in data:
+        if isinstance(item, tuple):
+            text, literal = item[0], item[1]
+            text = _LITERAL_RE.sub(b"", text.rstrip())
+            _lex(text, tokens)
+            tokens.append(literal)
+        elif isinstance(item, bytes):
+            _lex(item, tokens)
+    return tokens
+
+
+def _lex(text: bytes, tokens: list) -> None:
+    index, length = 0, len(text)
+    while index < length:
+        char = text[index:index + 1]
+        if char in b" \r\n":
+            index += 1
+        elif char == b"(":
+            tokens.append(_OPEN)
+            index += 1
+        elif char == b")":
+            tokens.append(_CLOSE)
+            index += 1
+        elif char == b'"':
+            index += 1
+            value = bytearray()
+            while index < length and text[index:index + 1] != b'"':
+                if text[index:index + 1] == b"\\":
+                    index += 1
+                value += text[index:index + 1]
+                index += 1
+            tokens.append(bytes(value))
+            index += 1
+        else:
+            start = index
+            depth = 0
+            while index < length:
+                char = text[index:index + 1]
+                if char == b"[":
+                    depth += 1
+                elif char == b"]":
+                    depth -= 1
+                elif depth == 0 and char in b" ()":
+                    break
+                index += 1
+            atom = text[start:index]
+            tokens.append(None if atom.upper() == b"NIL" else atom)
+
+
+def _read_list(tokens: list, position: int) -> tuple[list, int]:
+    items: list = []
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token is _CLOSE:
+            return items, position
+        if token is _OPEN:
+            nested, position = _read_list(tokens, position)
+            items.append(nested)
+        else:
+            items.append(token)
+    return items, position
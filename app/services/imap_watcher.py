@@ -0,0 +1,256 @@
+"""
+Push-style mailbox watching over one persistent IMAP connection.
+
+When the server advertises IDLE (RFC 2177) the watcher parks the connection
+in IDLE and wakes up as soon as the server reports new messages. IDLE is
+re-issued before the server's inactivity timeout (29 minutes per the RFC).
+Servers without IDLE are polled with NOOP on the same connection, with an
+interval that backs off while the mailbox is quiet and snaps back to the
+minimum when mail arrives. Broken connections are re-established with
+exponential backoff.
+"""
+from __future__ import annotations
+
+import imaplib
+import logging
+import re
+import socket
+import threading
+import time
+from typing import Callable
+
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Untagged responses that mean the mailbox may hold new messages
+_CHANGE_RE = re.compile(rb"^\* (\d+ EXISTS|[1-9]\d* RECENT)\b", re.IGNORECASE)
+# While idling, wake up this often to honour the stop event
+_READ_SLICE = 1.0
+
+_CONNECTION_ERRORS = (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError)
+
+
+class ImapWatcher:
+    """
+    Keep a selected mailbox open and call back whenever it may have new mail.
+
+    ``connect`` returns a logged-in ``imaplib.IMAP4`` connection; the
+    watcher selects ``mailbox`` on it and owns it until ``close``.
+    ``on_change`` receives the live connection, so the fetch runs over the
+    same session instead of opening a new one.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], imaplib.IMAP4],
+        mailbox: str = "INBOX",
+        idle_timeout: float | None = None,
+        poll_min: float | None = None,
+        poll_max: float | None = None,
+        reconnect_max: float = 300.0,
+    ) -> None:
+        self._connect = connect
+        self.mailbox = mailbox
+        self.idle_timeout = idle_timeout if idle_timeout is not None else settings.email_idle_timeout
+        self.poll_min = poll_min if poll_min is not None else settings.email_poll_min
+        self.poll_max = max(self.poll_min, poll_max if poll_max is not None else settings.email_poll_max)
+        self.reconnect_max = reconnect_max
+        self._conn: imaplib.IMAP4 | None = None
+        self._buffer = b""
+        self._exists = 0
+        self._poll_interval = self.poll_min
+
+    @property
+    def connection(self) -> imaplib.IMAP4 | None:
+        return self._conn
+
+    @property
+    def supports_idle(self) -> bool:
+        return self._conn is not None and "IDLE" in self._conn.capabilities
+
+    def open(self) -> imaplib.IMAP4:
+        self.close()
+        conn = self._connect()
+        status, data = conn.select(self.mailbox)
+        if status != "OK":
+            conn.logout()
+            raise imaplib.IMAP4.error(f"Cannot select {self.mailbox}: {data}")
+        self._conn = conn
+        self._buffer = b""
+        self._exists = _to_int(data[0]) if data else 0
+        self._poll_interval = self.poll_min
+        logger.info(
+            "Watching %s (%s mode)", self.mailbox, "IDLE" if self.supports_idle else "polling"
+        )
+        return conn
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.logout()
+        except Exception:
+            pass
+
+    def run(
+        self,
+        on_change: Callable[[imaplib.IMAP4], None],
+        stop: threading.Event | None = None,
+    ) -> None:
+        """
+        Call ``on_change`` once at start-up (and after every reconnect, since
+        mail may have arrived while disconnected), then each time the server
+        reports new mail, until ``stop`` is set.
+        """
+        stop = stop or threading.Event()
+        failures = 0
+        changed = True
+        try:
+            while not stop.is_set():
+                try:
+                    if self._conn is None:
+                        self.open()
+                        changed = True
+                    if changed:
+                        self._notify(on_change)
+                    failures = 0
+                    changed = self.wait(stop)
+                except _CONNECTION_ERRORS as e:
+                    failures += 1
+                    delay = min(self.reconnect_max, 2 ** min(failures, 10))
+                    logger.warning("IMAP connection lost (%s); reconnecting in %ss", e, delay)
+                    self.close()
+                    stop.wait(delay)
+        finally:
+            self.close()
+
+    def _notify(self, on_change: Callable[[imaplib.IMAP4], None]) -> None:
+        try:
+            on_change(self._conn)
+        except _CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            # A failing handler must not stop the watcher
+            logger.error("Mailbox change handler failed: %s", e)
+
+    def wait(self, stop: threading.Event | None = None) -> bool:
+        """
+        Block until the mailbox may have new mail (True) or ``stop`` is set
+        (False). Connection failures propagate to the caller.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            # Mail that arrived while the handler ran was reported on its
+            # SEARCH/FETCH responses; IDLE would not announce it again
+            if self._consume_changes():
+                return True
+            if self.supports_idle:
+                if self._idle(self.idle_timeout, stop):
+                    return True
+            elif self._poll(stop):
+                return True
+        return False
+
+    def _idle(self, timeout: float, stop: threading.Event) -> bool:
+        """One IDLE round; returns whether the server reported new mail"""
+        conn = self._conn
+        tag = conn._new_tag()
+        conn.send(tag + b" IDLE\r\n")
+        line = self._read_line(30.0)
+        if line is None or not line.startswith(b"+"):
+            raise imaplib.IMAP4.abort(f"IDLE not accepted: {line!r}")
+
+        changed = False
+        deadline = time.monotonic() + timeout
+        while not changed and not stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break  # renew before the server drops the idle session
+            line = self._read_line(min(_READ_SLICE, remaining))
+            if line is not None and _CHANGE_RE.match(line):
+                changed = True
+                self._seen(line)
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = self._read_line(30.0)
+            if line is None:
+                raise imaplib.IMAP4.abort("No response to IDLE DONE")
+            if line.startswith(tag + b" "):
+                if not line[len(tag) + 1:].upper().startswith(b"OK"):
+                    raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+                break
+            if _CHANGE_RE.match(line):
+                changed = True
+                self._seen(line)
+        if changed:
+            logger.debug("IDLE: new mail reported")
+        return changed
+
+    def _poll(self, stop: threading.Event) -> bool:
+        """Sleep for the adaptive interval, then NOOP and compare EXISTS"""
+        if stop.wait(self._poll_interval):
+            return False
+        self._conn.noop()
+        changed = self._consume_changes()
+        if changed:
+            self._poll_interval = self.poll_min
+        else:
+            self._poll_interval = min(self.poll_max, self._poll_interval * 2)
+        return changed
+
+    def _consume_changes(self) -> bool:
+        """Pop the EXISTS/RECENT responses imaplib collected; True if they report new mail"""
+        responses = self._conn.untagged_responses
+        exists = responses.pop("EXISTS", [])
+        recent = responses.pop("RECENT", [])
+        counts = [_to_int(value) for value in exists if value is not None]
+        changed = bool(counts and counts[-1] > self._exists) or any(
+            _to_int(value) > 0 for value in recent if value is not None
+        )
+        if counts:
+            self._exists = counts[-1]
+        return changed
+
+    def _seen(self, line: bytes) -> None:
+        """Remember the message count from an untagged EXISTS read during IDLE"""
+        count, _, kind = line[2:].partition(b" ")
+        if kind.upper().startswith(b"EXISTS"):
+            self._exists = _to_int(count)
+
+    def _read_line(self, timeout: float) -> bytes | None:
+        """
+        Read one CRLF line from the raw socket, or None after ``timeout``.
+
+        imaplib's buffered reader cannot survive a socket timeout, so the
+        IDLE exchange reads the socket directly.
+        """
+        sock = self._conn.sock
+        previous_timeout = sock.gettimeout()
+        deadline = time.monotonic() + timeout
+        try:
+            while b"\r\n" not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                sock.settimeout(remaining)
+                try:
+                    chunk = sock.recv(4096)
+                except socket.timeout:
+                    return None
+                if not chunk:
+                    raise imaplib.IMAP4.abort("Server closed the connection")
+                self._buffer += chunk
+        finally:
+            sock.settimeout(previous_timeout)
+        line, self._buffer = self._buffer.split(b"\r\n", 1)
+        return line
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
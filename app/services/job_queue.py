@@ -0,0 +1,108 @@
+"""
+Durable queue of webhook emails, stored in the application database.
+
+The webhook only inserts a row and returns its id; worker processes
+(``job_worker.py``) lease jobs one at a time, run the crew and the action,
+and record the result. A lease that is not finished within the
+visibility timeout (the worker crashed or hung) expires and the job is
+picked up again, so delivery is at-least-once: a worker that dies after
+sending a reply but before recording it causes a second reply.
+Failures are retried with exponential backoff up to ``max_attempts``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.models import EmailJob
+from app.db.session import SessionLocal
+from app.schemas.email_schema import EmailInbound
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        visibility_timeout: float | None = None,
+        max_attempts: int | None = None,
+        retry_backoff: float | None = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.visibility_timeout = visibility_timeout or settings.job_visibility_timeout
+        self.max_attempts = max_attempts or settings.job_max_attempts
+        self.retry_backoff = settings.job_retry_backoff if retry_backoff is None else retry_backoff
+        self._session_factory = session_factory
+
+    def enqueue(self, email: EmailInbound, tenant_id: int | None = None) -> int:
+        with self._session_factory() as db:
+            return crud.create_email_job(db, email.model_dump_json(), tenant_id).id
+
+    def status(self, job_id: int) -> dict | None:
+        with self._session_factory() as db:
+            job = crud.get_email_job(db, job_id)
+            return None if job is None else job_status(job)
+
+    def counts(self) -> dict[str, int]:
+        """Jobs per status (queued, running, done, failed)"""
+        with self._session_factory() as db:
+            return crud.count_email_jobs(db)
+
+    def claim(self, worker_id: str) -> tuple[int, EmailInbound, int | None] | None:
+        """
+        Lease the next job: ``(job_id, email, tenant_id)``. Jobs whose
+        leases kept expiring are failed here.
+        """
+        with self._session_factory() as db:
+            while True:
+                job = crud.claim_email_job(db, worker_id, self.visibility_timeout)
+                if job is None:
+                    return None
+                if job.attempts > self.max_attempts:
+                    logger.error("Job %s timed out %s times; giving up", job.id, self.max_attempts)
+                    crud.finish_email_job(db, job.id, worker_id, "failed", error="visibility timeout exceeded")
+                    continue
+                try:
+                    return job.id, EmailInbound.model_validate_json(job.payload), job.tenant_id
+                except ValueError as e:
+                    crud.finish_email_job(db, job.id, worker_id, "failed", error=f"invalid payload: {e}")
+
+    def complete(self, job_id: int, worker_id: str, result: dict) -> bool:
+        with self._session_factory() as db:
+            done = crud.finish_email_job(db, job_id, worker_id, "done", result=json.dumps(result, default=str))
+        if not done:
+            logger.warning("Job %s finished after its lease expired", job_id)
+        return done
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Put the job back with backoff, or fail it after ``max_attempts``"""
+        with self._session_factory() as db:
+            job = crud.get_email_job(db, job_id)
+            if job is None:
+                return False
+            if job.attempts >= self.max_attempts:
+                logger.error("Job %s failed after %s attempts: %s", job_id, job.attempts, error)
+                return crud.finish_email_job(db, job_id, worker_id, "failed", error=error)
+            delay = self.retry_backoff * 2 ** (job.attempts - 1)
+            logger.warning("Job %s failed (%s); retrying in %.0fs", job_id, error, delay)
+            retry_at = datetime.utcnow() + timedelta(seconds=delay)
+            return crud.finish_email_job(db, job_id, worker_id, "queued", error=error, retry_at=retry_at)
+
+
+def job_status(job: EmailJob) -> dict:
+    return {
+        "job_id": job.id,
+        "tenant_id": job.tenant_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
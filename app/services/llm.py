@@ -1,9 +1,18 @@
 from __future__ import annotations
 
-import requests
-from requests.exceptions import RequestException, Timeout, ConnectionError
+import asyncio
+import importlib.util
+import json
 import logging
+import threading
+import weakref
+from typing import AsyncIterator, Iterator
 
+import httpx
+
+from app.services.llm_cache import LLMCache
+from app.services.llm_router import Endpoint, LLMRouter
+from app.services.metrics import LLM_CACHE, LLM_TOKENS
 from app.utils.config import settings
 
 logger = logging.getLogger(__name__)
@@ -11,17 +20,18 @@ logger = logging.getLogger(__name__)
 
 class LLMError(Exception):
     """Base exception for LLM-related errors"""
-    pass
+    # Whether another attempt (possibly on another endpoint) may succeed
+    retryable = False
 
 
 class LLMConnectionError(LLMError):
     """Raised when LLM server connection fails"""
-    pass
+    retryable = True
 
 
 class LLMTimeoutError(LLMError):
     """Raised when LLM request times out"""
-    pass
+    retryable = True
 
 
 class LLMResponseError(LLMError):
@@ -29,7 +39,19 @@ class LLMResponseError(LLMError):
     pass
 
 
+class LLMRequestError(LLMConnectionError):
+    """Raised when the LLM server rejects the request (HTTP 4xx)"""
+    retryable = False
+
+
 class LLMClient:
+    """
+    OpenAI-compatible chat completion client.
+
+    The client owns a pooled keep-alive HTTP transport, so it is meant to be
+    long-lived and shared (see ``get_llm_client``) rather than built per call.
+    """
+
     def __init__(
         self,
         base_url: str | None = None,
@@ -37,12 +59,131 @@ class LLMClient:
         model: str | None = None,
         timeout: int | None = None,
         temperature: float | None = None,
+        pool_size: int | None = None,
+        keepalive_expiry: float | None = None,
+        http2: bool | None = None,
+        cache: LLMCache | None = None,
+        base_urls: list[str] | None = None,
     ) -> None:
-        self.base_url = (base_url or settings.llm_base_url).rstrip("/")
+        if base_urls is None:
+            base_urls = [base_url] if base_url else settings.llm_base_urls
+        self.base_urls = [url.rstrip("/") for url in base_urls]
+        self.base_url = self.base_urls[0]
         self.api_key = api_key if api_key is not None else settings.llm_api_key
         self.model = model or settings.llm_model
         self.timeout = timeout or settings.llm_timeout
         self.temperature = temperature if temperature is not None else settings.llm_temperature
+        self.pool_size = pool_size or settings.llm_pool_size
+        self.keepalive_expiry = (
+            keepalive_expiry if keepalive_expiry is not None else settings.llm_keepalive_expiry
+        )
+        self.http2 = _http2_available(settings.llm_http2 if http2 is None else http2)
+        self._http = httpx.Client(
+            timeout=self.timeout,
+            limits=self._limits(),
+            http2=self.http2,
+            headers=self._headers(),
+        )
+        # One async pool per event loop: async connections are loop-bound
+        self._ahttp: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient] = (
+            weakref.WeakKeyDictionary()
+        )
+        if cache is None and settings.llm_cache_enabled:
+            cache = LLMCache(
+                max_entries=settings.llm_cache_size,
+                ttl=settings.llm_cache_ttl,
+                path=settings.llm_cache_path,
+            )
+        self.cache = cache
+        self.cache_max_temperature = settings.llm_cache_max_temperature
+        self.router = LLMRouter(
+            self.base_urls,
+            retries=settings.llm_retries,
+            backoff_base=settings.llm_retry_backoff,
+            hedge_percentile=settings.llm_hedge_percentile,
+            hedge_min_samples=settings.llm_hedge_min_samples,
+            failure_threshold=settings.llm_breaker_failures,
+            reset_timeout=settings.llm_breaker_reset,
+            # More threads than pooled connections would only wait for one
+            hedge_workers=self.pool_size,
+        )
+        self._health_stop = threading.Event()
+        if settings.llm_health_check_interval > 0:
+            threading.Thread(
+                target=self._health_loop,
+                args=(settings.llm_health_check_interval,),
+                name="llm-health",
+                daemon=True,
+            ).start()
+
+    def check_health(self) -> list[dict]:
+        """Probe all endpoints now and update their circuit breakers"""
+        return self.router.check_health(self._http)
+
+    def _health_loop(self, interval: float) -> None:
+        while not self._health_stop.wait(interval):
+            try:
+                for probe in self.check_health():
+                    if not probe["healthy"]:
+                        logger.warning("LLM endpoint unhealthy: %s", probe["url"])
+            except Exception as e:
+                logger.error("LLM health check failed: %s", e)
+
+    def _async_http(self) -> httpx.AsyncClient:
+        """
+        Return the pooled async transport for the running event loop.
+
+        Async connections are bound to the loop that opened them, so each
+        loop the client is used from gets its own pool.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._ahttp.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self._limits(),
+                http2=self.http2,
+                headers=self._headers(),
+            )
+            self._ahttp[loop] = client
+        return client
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _headers(self) -> dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def close(self) -> None:
+        """Close pooled connections held by the client"""
+        self._health_stop.set()
+        self._http.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def aclose_pool(self) -> None:
+        """Close the async pool of the running loop (call before the loop ends)"""
+        client = self._ahttp.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def aclose(self) -> None:
+        """Close the sync pool and the running loop's async pool"""
+        self.close()
+        await self.aclose_pool()
+
+    def __enter__(self) -> "LLMClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     def generate(
         self,
@@ -50,6 +191,7 @@ class LLMClient:
         system_prompt: str | None = None,
         max_tokens: int = 512,
         temperature: float | None = None,
+        response_format: dict | None = None,
     ) -> str:
         """
         Generate text using LLM with comprehensive error handling.
@@ -59,6 +201,8 @@ class LLMClient:
             system_prompt: Optional system instructions
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
+            response_format: Optional OpenAI-style ``response_format`` used to
+                constrain output (e.g. a JSON schema)
             
         Returns:
             Generated text content
@@ -68,9 +212,216 @@ class LLMClient:
             LLMTimeoutError: If request times out
             LLMResponseError: If response is invalid
         """
+        payload = self._build_payload(
+            prompt, system_prompt, max_tokens, temperature, response_format
+        )
+        if payload is None:
+            return ""
+
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                LLM_CACHE.labels("hit").inc()
+                logger.info("LLM cache hit")
+                return cached
+            LLM_CACHE.labels("miss").inc()
+
+        def attempt(endpoint: Endpoint) -> str:
+            url = f"{endpoint.url}/chat/completions"
+            try:
+                logger.debug("Sending request to LLM: %s", url)
+                response = self._http.post(url, json=payload)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                raise self._transport_error(e, endpoint.url) from e
+            return self._parse_response(response)
+
+        content = self.router.call(attempt)
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+        return content
+
+    async def agenerate(
+        self,
+        prompt: str,
+        system_prompt: str | None = None,
+        max_tokens: int = 512,
+        temperature: float | None = None,
+        response_format: dict | None = None,
+    ) -> str:
+        """
+        Async variant of ``generate``; awaits the LLM without holding a thread.
+
+        Takes the same arguments and raises the same errors as ``generate``.
+        """
+        payload = self._build_payload(
+            prompt, system_prompt, max_tokens, temperature, response_format
+        )
+        if payload is None:
+            return ""
+
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                LLM_CACHE.labels("hit").inc()
+                logger.info("LLM cache hit")
+                return cached
+            LLM_CACHE.labels("miss").inc()
+
+        async def attempt(endpoint: Endpoint) -> str:
+            url = f"{endpoint.url}/chat/completions"
+            try:
+                logger.debug("Sending async request to LLM: %s", url)
+                response = await self._async_http().post(url, json=payload)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                raise self._transport_error(e, endpoint.url) from e
+            return self._parse_response(response)
+
+        content = await self.router.acall(attempt)
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+        return content
+
+    def stream(
+        self,
+        prompt: str,
+        system_prompt: str | None = None,
+        max_tokens: int = 512,
+        temperature: float | None = None,
+        stop: list[str] | None = None,
+        max_chars: int | None = None,
+    ) -> Iterator[str]:
+        """
+        Stream generated text as it arrives (OpenAI-style SSE, ``stream=True``).
+        
+        Generation stops early once a ``stop`` sequence appears (it is not
+        emitted) or ``max_chars`` characters were produced; leaving the
+        stream closes the connection, which aborts generation server-side.
+        
+        Yields:
+            Text chunks in generation order
+            
+        Raises:
+            Same errors as ``generate``
+        """
+        payload = self._build_payload(prompt, system_prompt, max_tokens, temperature)
+        if payload is None:
+            return
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                LLM_CACHE.labels("hit").inc()
+                logger.info("LLM cache hit (stream)")
+                yield cached
+                return
+            LLM_CACHE.labels("miss").inc()
+        self._prepare_stream(payload, stop)
+
+        condition = _StopCondition(stop, max_chars)
+        # A stream is not retried or hedged once it has started producing text
+        endpoint = self.router.pick()
+        url = f"{endpoint.url}/chat/completions"
+        with self.router.track(endpoint):
+            try:
+                logger.debug("Streaming request to LLM: %s", url)
+                with self._http.stream("POST", url, json=payload) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        chunk = _parse_sse_line(line)
+                        if chunk is None:
+                            break
+                        text = condition.feed(chunk)
+                        if text:
+                            yield text
+                        if condition.done:
+                            break
+            except httpx.HTTPError as e:
+                raise self._transport_error(e, endpoint.url) from e
+
+        tail = condition.flush()
+        if tail:
+            yield tail
+        self._finish_stream(cache_key, condition)
+
+    async def astream(
+        self,
+        prompt: str,
+        system_prompt: str | None = None,
+        max_tokens: int = 512,
+        temperature: float | None = None,
+        stop: list[str] | None = None,
+        max_chars: int | None = None,
+    ) -> AsyncIterator[str]:
+        """Async variant of ``stream``"""
+        payload = self._build_payload(prompt, system_prompt, max_tokens, temperature)
+        if payload is None:
+            return
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                LLM_CACHE.labels("hit").inc()
+                logger.info("LLM cache hit (stream)")
+                yield cached
+                return
+            LLM_CACHE.labels("miss").inc()
+        self._prepare_stream(payload, stop)
+
+        condition = _StopCondition(stop, max_chars)
+        endpoint = self.router.pick()
+        url = f"{endpoint.url}/chat/completions"
+        with self.router.track(endpoint):
+            try:
+                logger.debug("Streaming async request to LLM: %s", url)
+                async with self._async_http().stream("POST", url, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        chunk = _parse_sse_line(line)
+                        if chunk is None:
+                            break
+                        text = condition.feed(chunk)
+                        if text:
+                            yield text
+                        if condition.done:
+                            break
+            except httpx.HTTPError as e:
+                raise self._transport_error(e, endpoint.url) from e
+
+        tail = condition.flush()
+        if tail:
+            yield tail
+        self._finish_stream(cache_key, condition)
+
+    @staticmethod
+    def _prepare_stream(payload: dict, stop: list[str] | None) -> None:
+        payload["stream"] = True
+        if stop:
+            # Servers that honour "stop" end generation themselves; the
+            # client-side check below covers those that don't
+            payload["stop"] = stop
+
+    def _finish_stream(self, cache_key: str | None, condition: "_StopCondition") -> None:
+        logger.info("Streamed LLM response (%s chars%s)",
+                    len(condition.text), ', stopped early' if condition.done else '')
+        # A max_chars cut depends on the caller, not the request; don't cache it
+        if cache_key is not None and not condition.truncated:
+            self.cache.set(cache_key, condition.text.strip())
+
+    def _build_payload(
+        self,
+        prompt: str,
+        system_prompt: str | None,
+        max_tokens: int,
+        temperature: float | None,
+        response_format: dict | None = None,
+    ) -> dict | None:
         if not prompt or not prompt.strip():
             logger.warning("Empty prompt provided to LLM")
-            return ""
+            return None
 
         messages: list[dict[str, str]] = []
         if system_prompt:
@@ -83,45 +434,157 @@ class LLMClient:
             "temperature": self.temperature if temperature is None else temperature,
             "max_tokens": max_tokens,
         }
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+        if response_format:
+            payload["response_format"] = response_format
+        return payload
 
-        try:
-            logger.info(f"Sending request to LLM: {self.base_url}/chat/completions")
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=self.timeout,
-            )
-            response.raise_for_status()
-            
-        except Timeout as e:
-            error_msg = f"LLM request timed out after {self.timeout}s"
-            logger.error(error_msg)
-            raise LLMTimeoutError(error_msg) from e
-            
-        except ConnectionError as e:
-            error_msg = f"Failed to connect to LLM server at {self.base_url}"
-            logger.error(error_msg)
-            raise LLMConnectionError(error_msg) from e
-            
-        except RequestException as e:
-            error_msg = f"LLM request failed: {str(e)}"
-            logger.error(error_msg)
-            raise LLMConnectionError(error_msg) from e
+    def _cache_key(self, payload: dict) -> str | None:
+        """Cache only deterministic, low-temperature requests"""
+        if self.cache is None or payload["temperature"] > self.cache_max_temperature:
+            return None
+        messages = payload["messages"]
+        system_prompt = messages[0]["content"] if messages[0]["role"] == "system" else None
+        return LLMCache.make_key(
+            payload["model"],
+            system_prompt,
+            messages[-1]["content"],
+            payload["temperature"],
+            payload["max_tokens"],
+            payload.get("response_format"),
+        )
+
+    def _transport_error(self, exc: httpx.HTTPError, base_url: str) -> LLMError:
+        """Map an httpx failure onto the LLMError hierarchy"""
+        if isinstance(exc, httpx.TimeoutException):
+            error = LLMTimeoutError(f"LLM request timed out after {self.timeout}s")
+        elif isinstance(exc, httpx.ConnectError):
+            error = LLMConnectionError(f"Failed to connect to LLM server at {base_url}")
+        elif isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code < 500:
+            error = LLMRequestError(f"LLM request rejected: {str(exc)}")
+        else:
+            error = LLMConnectionError(f"LLM request failed: {str(exc)}")
+        logger.error(str(error))
+        return error
 
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> str:
         try:
             data = response.json()
             if "choices" not in data or not data["choices"]:
                 raise LLMResponseError("Invalid response structure: missing 'choices'")
                 
             content = data["choices"][0]["message"]["content"]
-            logger.info(f"Successfully received LLM response ({len(content)} chars)")
+            usage = data.get("usage") or {}
+            for kind in ("prompt", "completion"):
+                if isinstance(usage.get(f"{kind}_tokens"), int):
+                    LLM_TOKENS.labels(kind).inc(usage[f"{kind}_tokens"])
+            logger.debug("Successfully received LLM response (%s chars)", len(content))
             return content.strip()
             
         except (KeyError, IndexError, ValueError) as e:
             error_msg = f"Failed to parse LLM response: {str(e)}"
             logger.error(error_msg)
             raise LLMResponseError(error_msg) from e
+
+
+def _parse_sse_line(line: str) -> str | None:
+    """
+    Extract the text delta from one SSE line.
+    
+    Returns "" for lines without content and None at the end of the stream.
+    """
+    line = line.strip()
+    if not line.startswith("data:"):
+        return ""
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    try:
+        choice = json.loads(data)["choices"][0]
+    except (ValueError, KeyError, IndexError) as e:
+        raise LLMResponseError(f"Failed to parse LLM stream chunk: {str(e)}") from e
+    return (choice.get("delta") or {}).get("content") or ""
+
+
+class _StopCondition:
+    """
+    Client-side stop sequences and length cap for streamed text.
+    
+    Text that could still be the start of a stop sequence is held back
+    until the next chunk settles it, so stop sequences are never emitted.
+    """
+
+    def __init__(self, stop: list[str] | None, max_chars: int | None) -> None:
+        self.stop = [sequence for sequence in stop or [] if sequence]
+        self.max_chars = max_chars
+        self.text = ""
+        self.done = False
+        self.truncated = False
+        self._emitted = 0
+        self._hold = max((len(sequence) for sequence in self.stop), default=1) - 1
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self.text += chunk
+        cuts = [
+            index
+            for index in (self.text.find(sequence, self._emitted) for sequence in self.stop)
+            if index >= 0
+        ]
+        if cuts:
+            self.text = self.text[:min(cuts)]
+            self.done = True
+        if self.max_chars and len(self.text) >= self.max_chars:
+            self.text = self.text[:self.max_chars]
+            self.done = self.truncated = True
+
+        end = len(self.text) if self.done else len(self.text) - self._hold
+        if end <= self._emitted:
+            return ""
+        emitted, self._emitted = self.text[self._emitted:end], end
+        return emitted
+
+    def flush(self) -> str:
+        rest, self._emitted = self.text[self._emitted:], len(self.text)
+        return rest
+
+
+def _http2_available(requested: bool) -> bool:
+    """HTTP/2 needs the optional ``h2`` package (``pip install httpx[http2]``)"""
+    if requested and importlib.util.find_spec("h2") is None:
+        logger.warning("LLM_HTTP2 is enabled but 'h2' is not installed; using HTTP/1.1")
+        return False
+    return requested
+
+
+_shared_client: LLMClient | None = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Return the process-wide LLMClient, creating it on first use"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                _shared_client = LLMClient()
+    return _shared_client
+
+
+def close_llm_client() -> None:
+    """Close and drop the process-wide LLMClient"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+            _shared_client = None
+
+
+async def aclose_llm_client() -> None:
+    """Async variant of ``close_llm_client`` that also drains the async pool"""
+    global _shared_client
+    with _shared_lock:
+        client, _shared_client = _shared_client, None
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,362 @@
+"""
+Routing across several OpenAI-compatible LLM endpoints.
+
+Requests go to the healthy endpoint with the fewest outstanding requests.
+Each endpoint has a circuit breaker; retryable failures are retried with
+jittered exponential backoff on another endpoint when possible. Optional
+hedging sends a duplicate request to a second endpoint once the first has
+been running longer than a latency percentile of its recent history;
+blocking hedged calls run on a bounded thread pool and are not hedged
+while it is full.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive failures; after
+    ``reset_timeout`` seconds one trial request is let through (half-open)
+    and its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """The request said nothing about health (e.g. it was cancelled): let another trial through"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Circuit breaker opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Endpoint:
+    def __init__(self, url: str, breaker: CircuitBreaker, window: int = 256) -> None:
+        self.url = url.rstrip("/")
+        self.breaker = breaker
+        self.outstanding = 0
+        self.requests = 0
+        self.errors: Counter[str] = Counter()
+        self.hedges = 0
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def percentile(self, percent: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percent / 100.0))
+        return samples[index]
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "state": self.breaker.state,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "hedges": self.hedges,
+            "latency_p50": self.percentile(50),
+            "latency_p95": self.percentile(95),
+            "latency_p99": self.percentile(99),
+        }
+
+    def _started(self) -> None:
+        with self._lock:
+            self.outstanding += 1
+            self.requests += 1
+
+    def _hedged(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+    def _finished(self, latency: float | None, error: BaseException | None) -> None:
+        with self._lock:
+            self.outstanding -= 1
+            if latency is not None:
+                self._latencies.append(latency)
+            if error is not None:
+                self.errors[type(error).__name__] += 1
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        urls: list[str],
+        retries: int = 1,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge_workers: int = 0,
+    ) -> None:
+        if not urls:
+            raise ValueError("LLMRouter needs at least one endpoint")
+        self.endpoints = [
+            Endpoint(url, CircuitBreaker(failure_threshold, reset_timeout)) for url in urls
+        ]
+        self.retries = max(0, retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_workers = max(1, hedge_workers or 8 * len(self.endpoints))
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        self._busy = 0  # pool threads taken by hedged calls
+
+    def pick(self, exclude: tuple[Endpoint, ...] = ()) -> Endpoint:
+        """Least-outstanding endpoint whose breaker admits a request"""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        if not candidates:
+            candidates = list(self.endpoints)
+        random.shuffle(candidates)  # spread ties
+        for endpoint in sorted(candidates, key=lambda e: e.outstanding):
+            if endpoint.breaker.allow():
+                return endpoint
+        # Every breaker is open: try the one that has been resting longest
+        return min(candidates, key=lambda e: e.breaker.opened_at)
+
+    @contextmanager
+    def track(self, endpoint: Endpoint) -> Iterator[Endpoint]:
+        """Account one request (outstanding count, latency, breaker) on an endpoint"""
+        started = time.monotonic()
+        endpoint._started()
+        try:
+            yield endpoint
+        except BaseException as e:
+            endpoint._finished(None, e)
+            # LLM errors say whether the endpoint is at fault; anything else
+            # (e.g. a cancelled hedge) says nothing about its health
+            if _is_retryable(e):
+                endpoint.breaker.record_failure()
+            elif hasattr(e, "retryable"):
+                endpoint.breaker.record_success()
+            else:
+                endpoint.breaker.release_trial()
+            raise
+        else:
+            endpoint._finished(time.monotonic() - started, None)
+            endpoint.breaker.record_success()
+
+    def call(self, request: Callable[[Endpoint], T]) -> T:
+        """Run a blocking request with retries, backoff and optional hedging"""
+        tried: tuple[Endpoint, ...] = ()
+        for attempt in range(self.retries + 1):
+            endpoint = self.pick(exclude=tried)
+            tried += (endpoint,)
+            try:
+                return self._call_hedged(request, endpoint)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning("LLM request to %s failed (%s); retrying in %.2fs",
+                               endpoint.url, e, delay)
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def acall(self, request: Callable[[Endpoint], Awaitable[T]]) -> T:
+        """Async variant of ``call``; the losing hedged request is cancelled"""
+        tried: tuple[Endpoint, ...] = ()
+        for attempt in range(self.retries + 1):
+            endpoint = self.pick(exclude=tried)
+            tried += (endpoint,)
+            try:
+                return await self._acall_hedged(request, endpoint)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning("LLM request to %s failed (%s); retrying in %.2fs",
+                               endpoint.url, e, delay)
+                await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def check_health(self, http: httpx.Client, timeout: float = 5.0) -> list[dict]:
+        """Probe every endpoint's /models; results feed the circuit breakers"""
+        report = []
+        for endpoint in self.endpoints:
+            started = time.monotonic()
+            try:
+                response = http.get(f"{endpoint.url}/models", timeout=timeout)
+                healthy = response.status_code < 500
+            except httpx.HTTPError:
+                healthy = False
+            if healthy:
+                endpoint.breaker.record_success()
+            else:
+                endpoint.breaker.record_failure()
+            report.append({
+                "url": endpoint.url,
+                "healthy": healthy,
+                "latency": round(time.monotonic() - started, 4),
+            })
+        return report
+
+    def stats(self) -> list[dict]:
+        return [endpoint.snapshot() for endpoint in self.endpoints]
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries from many workers from synchronising
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _hedge_delay(self, endpoint: Endpoint) -> float | None:
+        if self.hedge_percentile <= 0 or len(self.endpoints) < 2:
+            return None
+        if endpoint.samples < self.hedge_min_samples:
+            return None
+        return endpoint.percentile(self.hedge_percentile)
+
+    def _submit(self, fn: Callable[..., T], *args) -> Future | None:
+        """Run ``fn`` on a free pool thread, or return None when all are taken"""
+        with self._executor_lock:
+            if self._busy >= self.hedge_workers:
+                return None
+            self._busy += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.hedge_workers, thread_name_prefix="llm-hedge"
+                )
+            future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _: Future) -> None:
+        with self._executor_lock:
+            self._busy -= 1
+
+    def _call_hedged(self, request: Callable[[Endpoint], T], endpoint: Endpoint) -> T:
+        def tracked(target: Endpoint, started: threading.Event | None = None) -> T:
+            if started is not None:
+                started.set()
+            with self.track(target):
+                return request(target)
+
+        delay = self._hedge_delay(endpoint)
+        started = threading.Event()
+        primary = self._submit(tracked, endpoint, started) if delay is not None else None
+        if primary is None:
+            # No hedging configured, or the pool is saturated: a hedge would
+            # only queue behind the requests it is meant to overtake
+            return tracked(endpoint)
+
+        # The hedge delay counts from when the request is sent, not queued
+        started.wait()
+        done, pending = wait({primary}, timeout=delay)
+        if not done:
+            backup = self.pick(exclude=(endpoint,))
+            hedge = self._submit(tracked, backup) if backup is not endpoint else None
+            if hedge is not None:
+                backup._hedged()
+                logger.info("Hedging LLM request to %s after %.2fs", backup.url, delay)
+                pending.add(hedge)
+
+        error: BaseException | None = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    # The slower request finishes in the background; its result is dropped
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    async def _acall_hedged(
+        self, request: Callable[[Endpoint], Awaitable[T]], endpoint: Endpoint
+    ) -> T:
+        async def tracked(target: Endpoint) -> T:
+            with self.track(target):
+                return await request(target)
+
+        delay = self._hedge_delay(endpoint)
+        if delay is None:
+            return await tracked(endpoint)
+
+        pending = {asyncio.ensure_future(tracked(endpoint))}
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            backup = self.pick(exclude=(endpoint,))
+            if backup is not endpoint:
+                backup._hedged()
+                logger.info("Hedging LLM request to %s after %.2fs", backup.url, delay)
+                pending.add(asyncio.ensure_future(tracked(backup)))
+
+        error: BaseException | None = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """LLM errors carry a ``retryable`` flag (see app.services.llm)"""
+    return getattr(error, "retryable", False)
@@ -0,0 +1,72 @@
+"""
+Mail-loop protection: recognise auto-generated mail so it never gets an
+auto-reply (RFC 3834), and mark our own replies so other responders
+leave them alone.
+"""
+from __future__ import annotations
+
+import re
+from email.message import Message
+from email.utils import parseaddr
+
+from app.schemas.email_schema import EmailInbound
+
+# Headers stamped on every auto-reply we send
+AUTO_REPLY_HEADERS = {
+    "Auto-Submitted": "auto-replied",
+    # Exchange/Outlook: do not answer with out-of-office or delivery reports
+    "X-Auto-Response-Suppress": "All",
+}
+
+# Fetched alongside the usual headers so auto_generated_reason can see them
+LOOP_HEADER_FIELDS = (
+    "AUTO-SUBMITTED PRECEDENCE X-AUTOREPLY X-AUTORESPOND X-AUTO-RESPONSE-SUPPRESS "
+    "LIST-ID LIST-UNSUBSCRIBE RETURN-PATH"
+)
+
+_BULK_PRECEDENCE = {"bulk", "junk", "list", "auto_reply"}
+_SYSTEM_SENDER_RE = re.compile(
+    r"^(mailer-daemon|postmaster|no-?reply|do-?not-?reply|bounces?|auto-?reply)([+\-.@]|$)",
+    re.IGNORECASE,
+)
+_AUTO_SUBJECT_RE = re.compile(
+    r"^\s*(auto(matic)?[ -]?(reply|response)|out of (the )?office|autoreply|"
+    r"undeliverable|undelivered mail|delivery status notification|"
+    r"mail delivery (failed|failure|system))\b",
+    re.IGNORECASE,
+)
+
+
+def auto_generated_reason(email: EmailInbound) -> str | None:
+    """Why ``email`` looks machine-generated, or None for human mail"""
+    headers = {name.lower(): value for name, value in (email.headers or {}).items()}
+
+    auto_submitted = headers.get("auto-submitted", "").strip().lower()
+    if auto_submitted and auto_submitted != "no":
+        return f"Auto-Submitted: {auto_submitted}"
+    if headers.get("precedence", "").strip().lower() in _BULK_PRECEDENCE:
+        return f"Precedence: {headers['precedence'].strip()}"
+    for name in ("x-autoreply", "x-autorespond", "list-id", "list-unsubscribe"):
+        if headers.get(name):
+            return f"{name} header"
+    if headers.get("x-auto-response-suppress", "").strip().lower() in {"all", "oof", "autoreply"}:
+        return "X-Auto-Response-Suppress header"
+    if headers.get("return-path", "").strip() == "<>":
+        return "empty Return-Path"
+
+    address = parseaddr(email.from_address or "")[1]
+    if _SYSTEM_SENDER_RE.match(address):
+        return f"system sender {address}"
+    if _AUTO_SUBJECT_RE.match(email.subject or ""):
+        return "auto-reply subject"
+    return None
+
+
+def loop_headers(message: Message) -> dict[str, str]:
+    """The loop-relevant headers of a parsed message, for ``EmailInbound.headers``"""
+    found = {}
+    for name in LOOP_HEADER_FIELDS.split():
+        value = message.get(name)
+        if value is not None:
+            found[name.title()] = str(value)
+    return found
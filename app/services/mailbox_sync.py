@@ -0,0 +1,175 @@
+"""
+UID-checkpointed incremental mailbox sync.
+
+Per mailbox the database keeps the UIDVALIDITY and the highest UID already
+handled, so each cycle only asks the server for ``UID n+1:*``. A
+Message-ID keyed record of handled messages guarantees that a message is
+never sent through the crew twice, even after a crash, a UIDVALIDITY reset
+or a human reading the mail first.
+
+Until the first cycle for a mailbox completes, the UNSEEN set is used
+instead, and the checkpoint starts at the mailbox's highest UID. UIDs that
+were searched but never came back from FETCH (or failed to parse) count
+as failed attempts, so the checkpoint does not move past them.
+"""
+from __future__ import annotations
+
+import imaplib
+import logging
+import threading
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.session import SessionLocal
+from app.schemas.email_schema import EmailInbound
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MailboxSync:
+    def __init__(
+        self,
+        account: str,
+        mailbox: str = "INBOX",
+        max_attempts: int | None = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.account = account
+        self.mailbox = mailbox
+        self.max_attempts = max_attempts or settings.email_sync_max_attempts
+        self._session_factory = session_factory
+        self.uidvalidity = 0
+        self.last_uid = 0
+        self.initial = False
+        self._pending: list[int] = []
+        self._baseline = 0
+        self._retry: set[int] = set()
+        self._fetched: set[int] = set()
+        # record() may run on several pipeline workers at once
+        self._lock = threading.Lock()
+
+    def pending(self, mail: imaplib.IMAP4) -> list[int]:
+        """UIDs this cycle has to look at (mailbox must be selected)"""
+        self.uidvalidity = _uidvalidity(mail, self.mailbox)
+        with self._session_factory() as db:
+            state = crud.get_sync_state(db, self.account, self.mailbox)
+
+        if state is not None and state.uidvalidity == self.uidvalidity:
+            self.initial = False
+            self.last_uid = state.last_uid
+            status, data = mail.uid("SEARCH", None, f"UID {self.last_uid + 1}:*")
+        else:
+            if state is not None:
+                logger.warning(
+                    "UIDVALIDITY of %s/%s changed; resyncing from UNSEEN", self.account, self.mailbox
+                )
+            self.initial = True
+            self.last_uid = 0
+            self._baseline = _highest_uid(mail)
+            status, data = mail.uid("SEARCH", None, "UNSEEN")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+
+        # "n+1:*" always matches the newest message, even when its UID is <= n
+        self._pending = sorted(
+            uid for uid in (int(value) for value in data[0].split()) if uid > self.last_uid
+        )
+        self._retry.clear()
+        self._fetched.clear()
+        return self._pending
+
+    def filter_new(self, emails: list[EmailInbound]) -> list[EmailInbound]:
+        """Drop emails that were already handled (or given up on); every email passed counts as fetched"""
+        with self._lock:
+            self._fetched.update(email.uid for email in emails if email.uid is not None)
+        keys = {self.message_key(email): email for email in emails}
+        with self._session_factory() as db:
+            known = crud.get_processed_messages(db, self.account, list(keys))
+        fresh = [
+            email for key, email in keys.items()
+            if key not in known or known[key].action is None
+        ]
+        skipped = len(emails) - len(fresh)
+        if skipped:
+            logger.info("Skipping %s already processed email(s)", skipped)
+        return fresh
+
+    def record(self, email: EmailInbound, action: str | None) -> None:
+        """Persist the outcome for one email; ``action=None`` means it failed"""
+        if email.uid is not None:
+            with self._lock:
+                self._fetched.add(email.uid)
+        self._record(self.message_key(email), email.uid, action)
+
+    def _record(self, key: str, uid: int | None, action: str | None) -> None:
+        with self._session_factory() as db:
+            row = crud.record_processed_message(db, self.account, key, uid, action)
+            if action is not None:
+                return
+            if row.attempts >= self.max_attempts:
+                logger.error("Giving up on email %s after %s attempts", uid, row.attempts)
+                row.action = "FAILED"
+                db.commit()
+            elif uid is not None:
+                with self._lock:
+                    self._retry.add(uid)
+
+    def checkpoint(self) -> None:
+        """Advance the stored UID past everything handled this cycle"""
+        with self._lock:
+            missing = [uid for uid in self._pending if uid not in self._fetched]
+        # Never fetched (e.g. a failed header FETCH) or unparseable: a failed attempt
+        for uid in missing:
+            self._record(self._uid_key(uid), uid, None)
+        with self._lock:
+            retry = set(self._retry)
+        if retry:
+            if self.initial:
+                # Keep using UNSEEN until the first sync finishes cleanly
+                return
+            last_uid = min(retry) - 1
+        else:
+            last_uid = max([self.last_uid, self._baseline, *self._pending])
+        last_uid = max(last_uid, self.last_uid)
+        with self._session_factory() as db:
+            crud.save_sync_state(db, self.account, self.mailbox, self.uidvalidity, last_uid)
+        self.last_uid = last_uid
+
+    def message_key(self, email: EmailInbound) -> str:
+        if email.message_id:
+            return email.message_id[:500]
+        return self._uid_key(email.uid)
+
+    def _uid_key(self, uid: int | None) -> str:
+        return f"uid:{self.mailbox}:{self.uidvalidity}:{uid}"
+
+
+def _uidvalidity(mail: imaplib.IMAP4, mailbox: str) -> int:
+    # SELECT leaves "[UIDVALIDITY n]" in the untagged responses; peek at it
+    # without popping so a long-lived (watcher) connection keeps it
+    values = [value for value in mail.untagged_responses.get("UIDVALIDITY", []) if value]
+    if values:
+        return int(values[-1])
+    status, data = mail.status(mailbox, "(UIDVALIDITY)")
+    if status == "OK" and data and data[0]:
+        text = data[0].decode() if isinstance(data[0], bytes) else str(data[0])
+        return int(text.rsplit("UIDVALIDITY", 1)[1].strip(" )"))
+    raise imaplib.IMAP4.error(f"No UIDVALIDITY for {mailbox}")
+
+
+def _highest_uid(mail: imaplib.IMAP4) -> int:
+    try:
+        status, data = mail.uid("FETCH", "*", "(UID)")
+    except imaplib.IMAP4.error:
+        return 0  # empty mailbox
+    if status != "OK":
+        return 0
+    uids = []
+    for item in data:
+        text = item[0] if isinstance(item, tuple) else item
+        if isinstance(text, bytes) and b"UID" in text:
+            uids.append(int(text.split(b"UID", 1)[1].strip(b" ()").split()[0]))
+    return max(uids, default=0)
@@ -0,0 +1,434 @@
+"""
+In-process metrics exposed in the Prometheus text format (GET /metrics).
+
+Counters, gauges and fixed-bucket histograms are kept in dicts keyed by
+label values; an update is a dict lookup and an add under the metric's
+lock. Every metric the application records is defined at the bottom of
+this module, so all processes agree on names, labels and buckets.
+
+Several processes (API workers, job workers, mailbox workers): with
+METRICS_DIR set, each process writes a snapshot of its values to
+``METRICS_DIR/<pid>-<token>.json`` every METRICS_FLUSH_INTERVAL seconds
+and at shutdown, and /metrics adds up the snapshots of all processes on
+the host. Counters and histograms of processes that exited (or whose file
+was not rewritten for ``_STALE_FLUSHES`` intervals, e.g. left over from
+before a restart) are merged into ``archive.json`` so totals never go
+backwards; their gauges are dropped. Processes sharing the directory
+must share a PID namespace.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+from app.utils.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead processes' files are summed but not archived
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds; wide enough for a local LLM that takes a minute per reply
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_ARCHIVE = "archive.json"
+# A snapshot not rewritten for this many flush intervals belongs to a dead process
+_STALE_FLUSHES = 12
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: tuple) -> None:
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> "_Bound":
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return _Bound(self, tuple(str(value) for value in values))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {json.dumps(key): _copy(value) for key, value in self._values.items()}
+
+
+class _Bound:
+    """A metric with its label values filled in"""
+
+    __slots__ = ("metric", "key")
+
+    def __init__(self, metric: _Metric, key: tuple) -> None:
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.metric._inc(self.key, amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.metric._inc(self.key, -amount)
+
+    def set(self, value: float) -> None:
+        self.metric._set(self.key, value)
+
+    def observe(self, value: float) -> None:
+        self.metric._observe(self.key, value)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metric._observe(self.key, time.perf_counter() - started)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc((), amount)
+
+    def _inc(self, key: tuple, amount: float) -> None:
+        self.registry.ensure_flushing()
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Counter):
+    """
+    Across processes a gauge is summed (e.g. queue depths per process) or,
+    with ``mode="max"``, the largest value wins (a value every process
+    reads from the same source)
+    """
+    kind = "gauge"
+
+    def __init__(self, registry, name, documentation, labelnames, mode: str = "sum") -> None:
+        super().__init__(registry, name, documentation, labelnames)
+        self.mode = mode
+
+    def set(self, value: float) -> None:
+        self._set((), value)
+
+    def _set(self, key: tuple, value: float) -> None:
+        self.registry.ensure_flushing()
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=LATENCY_BUCKETS) -> None:
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float) -> None:
+        self._observe((), value)
+
+    def time(self):
+        return _Bound(self, ()).time()
+
+    def _observe(self, key: tuple, value: float) -> None:
+        self.registry.ensure_flushing()
+        index = bisect_left(self.buckets, value)  # le is inclusive
+        with self._lock:
+            # Per-bucket counts (the last one is +Inf), then sum
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+
+class MetricsRegistry:
+    def __init__(self, directory: str | Path | None = None, flush_interval: float | None = None) -> None:
+        # None: read METRICS_DIR / METRICS_FLUSH_INTERVAL on first use
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop = threading.Event()
+        self._path: Path | None = None
+
+    # -- definitions -------------------------------------------------------
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = (), mode: str = "sum") -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames, mode))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """Run ``collect`` (e.g. to set gauges) before every snapshot and render"""
+        self._collectors.append(collect)
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already defined")
+        self._metrics[metric.name] = metric
+        return metric
+
+    # -- snapshots -----------------------------------------------------------
+
+    @property
+    def directory(self) -> Path | None:
+        directory = settings.metrics_dir if self._directory is None else self._directory
+        return Path(directory) if directory else None
+
+    def ensure_flushing(self) -> None:
+        """Start the snapshot thread on the first update (cheap after that)"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            if self.directory is None:
+                return
+            interval = self._flush_interval or settings.metrics_flush_interval
+            threading.Thread(target=self._flush_loop, args=(interval,), name="metrics-flush", daemon=True).start()
+            atexit.register(self.flush)
+
+    def snapshot(self) -> dict:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.error("Metrics collector failed: %s", e)
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def flush(self) -> None:
+        """Write this process's snapshot to METRICS_DIR"""
+        directory = self.directory
+        if directory is None:
+            return
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            if self._path is None:
+                self._path = directory / f"{os.getpid()}-{secrets.token_hex(4)}.json"
+            tmp = self._path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"pid": os.getpid(), "metrics": self.snapshot()}))
+            os.replace(tmp, self._path)
+        except OSError as e:
+            logger.error("Could not write metrics snapshot: %s", e)
+
+    def _flush_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._started:
+            self.flush()
+
+    # -- exposition ----------------------------------------------------------
+
+    def collect(self) -> dict[str, dict]:
+        """This process's values plus those of the other processes in METRICS_DIR"""
+        merged = self.snapshot()
+        directory = self.directory
+        if directory is None or not directory.is_dir():
+            return merged
+
+        for path in sorted(directory.glob("*.json")):
+            if path == self._path or path.name == _ARCHIVE:
+                continue  # ours is fresher in memory; the archive comes last
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if _alive(data.get("pid")) and not self._stale(path):
+                self._merge(merged, data.get("metrics", {}), gauges=True)
+            elif not self._archive(directory, path):
+                self._merge(merged, data.get("metrics", {}), gauges=False)
+        # Read last, after the dead processes above were added to it
+        try:
+            archive = json.loads((directory / _ARCHIVE).read_text())
+        except (OSError, ValueError):
+            archive = {}
+        self._merge(merged, archive.get("metrics", {}), gauges=False)
+        return merged
+
+    def _stale(self, path: Path) -> bool:
+        interval = self._flush_interval or settings.metrics_flush_interval
+        try:
+            return time.time() - path.stat().st_mtime > max(60.0, interval * _STALE_FLUSHES)
+        except OSError:
+            return True
+
+    def _merge(self, into: dict, values: dict, gauges: bool) -> None:
+        for name, series in values.items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.kind == "gauge" and not gauges):
+                continue
+            target = into.setdefault(name, {})
+            for key, value in series.items():
+                current = target.get(key)
+                if current is None:
+                    target[key] = _copy(value)
+                elif isinstance(current, list):
+                    if len(current) == len(value):
+                        target[key] = [a + b for a, b in zip(current, value)]
+                elif getattr(metric, "mode", "sum") == "max":
+                    target[key] = max(current, value)
+                else:
+                    target[key] = current + value
+
+    def _archive(self, directory: Path, path: Path) -> bool:
+        """Fold an exited process's counters into the archive; False if it cannot"""
+        if fcntl is None:
+            return False
+        try:
+            with open(directory / ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not path.exists():
+                    return True  # another process archived it meanwhile
+                archive_path = directory / _ARCHIVE
+                archive = json.loads(archive_path.read_text()) if archive_path.exists() else {"metrics": {}}
+                self._merge(archive["metrics"], json.loads(path.read_text()).get("metrics", {}), gauges=False)
+                tmp = archive_path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(archive))
+                os.replace(tmp, archive_path)
+                path.unlink()
+            return True
+        except (OSError, ValueError) as e:
+            logger.error("Could not archive metrics of %s: %s", path.name, e)
+            return False
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        values = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(values.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, json.loads(key)))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _copy(value):
+    return list(value) if isinstance(value, list) else value
+
+
+def _alive(pid) -> bool:
+    if not isinstance(pid, int):
+        return False
+    if os.name != "posix":
+        return True  # os.kill would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+
+# LLM
+LLM_STEP_SECONDS = registry.histogram(
+    "emailcleaner_llm_step_seconds", "LLM call latency per crew step", ("step",)
+)
+LLM_ERRORS = registry.counter(
+    "emailcleaner_llm_errors_total", "Failed LLM calls by crew step and exception class", ("step", "error")
+)
+LLM_TOKENS = registry.counter(
+    "emailcleaner_llm_tokens_total", "Tokens reported by the LLM server", ("kind",)
+)
+LLM_CACHE = registry.counter(
+    "emailcleaner_llm_cache_lookups_total", "LLM response cache lookups", ("result",)
+)
+
+# Mail in and out
+IMAP_FETCH_SECONDS = registry.histogram(
+    "emailcleaner_imap_fetch_seconds", "IMAP FETCH round trips", ("part",)
+)
+IMAP_MESSAGES = registry.counter(
+    "emailcleaner_imap_messages_total", "Messages fetched over IMAP"
+)
+MIME_PARSE_SECONDS = registry.histogram(
+    "emailcleaner_mime_parse_seconds", "Parsing one message (headers, body part, HTML to text)",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+SMTP_SEND_SECONDS = registry.histogram(
+    "emailcleaner_smtp_send_seconds", "Sending one message, retries included", ("outcome",)
+)
+SMTP_QUEUE_DEPTH = registry.gauge(
+    "emailcleaner_smtp_queue_depth", "Messages waiting in the outbound SMTP queues"
+)
+
+# Processing
+EMAIL_STAGE_SECONDS = registry.histogram(
+    "emailcleaner_email_stage_seconds", "Time per email in each processing stage", ("source", "stage")
+)
+EMAILS_PROCESSED = registry.counter(
+    "emailcleaner_emails_processed_total", "Processed emails by source and action", ("source", "action")
+)
+EMAIL_ERRORS = registry.counter(
+    "emailcleaner_email_errors_total", "Failed processing stages by exception class", ("stage", "error")
+)
+PIPELINE_QUEUE_DEPTH = registry.gauge(
+    "emailcleaner_pipeline_queue_depth", "Emails waiting for a monitor pipeline stage", ("stage",)
+)
+WEBHOOK_IN_FLIGHT = registry.gauge(
+    "emailcleaner_webhook_in_flight", "Emails processed synchronously by the webhook right now"
+)
+JOBS = registry.gauge(
+    "emailcleaner_jobs", "Webhook jobs in the durable queue by status", ("status",), mode="max"
+)
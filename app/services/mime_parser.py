@@ -0,0 +1,234 @@
+"""
+Size-bounded parsing of whole RFC 5322 messages (.eml files, mbox archives).
+
+``parse_message`` feeds at most ``max_message_bytes`` of the message to
+the stdlib ``BytesFeedParser`` with the modern ``email.policy.default``,
+so a huge attachment never has to be read, let alone split into lines.
+Only the chosen body part is decoded, and only its first ``max_bytes``;
+headers are decoded on first access. When a message has no text/plain
+part, its HTML is converted to text with ``html_to_text``, which streams
+the markup through ``HTMLParser`` and stops once it has enough text.
+"""
+from __future__ import annotations
+
+import re
+import time
+from email.feedparser import BytesFeedParser
+from email.message import EmailMessage
+from email.policy import default as default_policy
+from functools import cached_property
+from html.parser import HTMLParser
+from typing import BinaryIO, Iterable
+
+from app.schemas.email_schema import EmailInbound
+from app.services.imap_fetch import decode_part
+from app.services.loop_guard import loop_headers
+from app.services.metrics import MIME_PARSE_SECONDS
+
+MAX_MESSAGE_BYTES = 1 << 20
+MAX_BODY_BYTES = 65536
+_READ_SIZE = 65536
+_HTML_CHUNK = 8192
+
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+_SPACES_RE = re.compile(r"[ \t\r\f\v\xa0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Markup whose text is never shown
+_SKIP_TAGS = {"script", "style", "head", "title", "template", "noscript"}
+# Elements that start a new line
+_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li",
+    "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+}
+
+
+class ParsedMessage:
+    """A parsed message: headers decode on first access, ``body`` is ready"""
+
+    def __init__(self, message: EmailMessage, body: str, truncated: bool) -> None:
+        self.message = message
+        self.body = body
+        # The message or its body part was cut at a byte cap
+        self.truncated = truncated
+
+    @cached_property
+    def subject(self) -> str:
+        return self._header("Subject")
+
+    @cached_property
+    def from_address(self) -> str:
+        return self._header("From")
+
+    @cached_property
+    def to_address(self) -> str:
+        return self._header("To")
+
+    @cached_property
+    def message_id(self) -> str:
+        return self._header("Message-ID")
+
+    @cached_property
+    def references(self) -> str:
+        return self._header("References")
+
+    def to_inbound(self, uid: int | None = None) -> EmailInbound:
+        return EmailInbound(
+            subject=self.subject,
+            body=self.body,
+            from_address=self.from_address or None,
+            to_address=self.to_address or None,
+            message_id=self.message_id or None,
+            references=self.references or None,
+            uid=uid,
+            headers=loop_headers(self.message) or None,
+        )
+
+    def _header(self, name: str) -> str:
+        try:
+            value = self.message.get(name)
+        except Exception:  # malformed header: fall back to the raw value
+            value = dict(self.message.raw_items()).get(name)
+        return str(value).strip() if value is not None else ""
+
+
+def parse_message(
+    source: bytes | BinaryIO,
+    max_bytes: int = MAX_BODY_BYTES,
+    max_message_bytes: int = MAX_MESSAGE_BYTES,
+) -> ParsedMessage:
+    """
+    Parse raw message bytes or a binary file, reading at most
+    ``max_message_bytes`` and decoding at most ``max_bytes`` of the body.
+    """
+    started = time.perf_counter()
+    parser = BytesFeedParser(policy=default_policy)
+    truncated = False
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        raw = bytes(source[:max_message_bytes])
+        truncated = len(source) > max_message_bytes
+        parser.feed(raw)
+    else:
+        remaining = max_message_bytes
+        while remaining > 0:
+            data = source.read(min(_READ_SIZE, remaining))
+            if not data:
+                break
+            parser.feed(data)
+            remaining -= len(data)
+        truncated = remaining <= 0 and bool(source.read(1))
+    message = parser.close()
+
+    part = find_body_part(message)
+    body, cut = decode_body(part, max_bytes) if part is not None else ("", False)
+    MIME_PARSE_SECONDS.observe(time.perf_counter() - started)
+    return ParsedMessage(message, body, truncated or cut)
+
+
+def find_body_part(message: EmailMessage) -> EmailMessage | None:
+    """First inline text/plain part, else the first inline text/html part"""
+    html = None
+    for part in message.walk():
+        if part.is_multipart() or part.get_content_maintype() != "text":
+            continue
+        if part.is_attachment():
+            continue
+        subtype = part.get_content_subtype()
+        if subtype == "plain":
+            return part
+        if subtype == "html" and html is None:
+            html = part
+    return html
+
+
+def decode_body(part: EmailMessage, max_bytes: int = MAX_BODY_BYTES) -> tuple[str, bool]:
+    """Text of a body part (HTML converted) from at most ``max_bytes`` of it"""
+    encoding = str(part.get("Content-Transfer-Encoding", "7bit")).strip().lower()
+    if encoding in ("base64", "quoted-printable"):
+        # ASCII by definition; sliced before decoding so only the head is decoded
+        payload = part.get_payload().encode("ascii", "replace")
+    else:
+        payload = part.get_payload(decode=True) or b""
+
+    # base64 needs 4 encoded bytes per 3 decoded ones
+    limit = max_bytes * 4 // 3 + 4 if encoding == "base64" else max_bytes
+    truncated = len(payload) > limit
+    raw = payload[:limit]
+
+    charset = part.get_content_charset()
+    is_html = part.get_content_subtype() == "html"
+    if charset is None and is_html:
+        match = _META_CHARSET_RE.search(raw[:2048])
+        charset = match.group(1).decode("ascii") if match else None
+    text = decode_part(raw, encoding, charset or "utf-8")
+    return (html_to_text(text) if is_html else text), truncated
+
+
+def html_to_text(html: str | Iterable[str], max_chars: int | None = None) -> str:
+    """
+    Readable text of an HTML document or a stream of HTML chunks. Scripts,
+    styles and the head are dropped, block elements become line breaks and
+    whitespace is collapsed. Parsing stops after ``max_chars`` of text.
+    """
+    if isinstance(html, str):
+        chunks: Iterable[str] = (
+            html[start:start + _HTML_CHUNK] for start in range(0, len(html), _HTML_CHUNK)
+        )
+    else:
+        chunks = html
+    converter = _TextExtractor()
+    for chunk in chunks:
+        converter.feed(chunk)
+        if max_chars is not None and converter.size >= max_chars:
+            break
+    else:
+        converter.close()
+    text = converter.text()
+    return text[:max_chars] if max_chars is not None else text
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self._parts: list[str] = []
+        self._skip = 0
+        self._pre = 0
+        self.size = 0
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "li":
+            self._emit("\n- ")
+        elif tag in _BLOCK_TAGS:
+            self._emit("\n")
+            if tag == "pre":
+                self._pre += 1
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        if tag in _BLOCK_TAGS:
+            self._emit("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS and tag != "li":  # the next item starts its own line
+            self._emit("\n")
+            if tag == "pre":
+                self._pre = max(0, self._pre - 1)
+
+    def handle_data(self, data: str) -> None:
+        if self._skip:
+            return
+        if not self._pre:
+            data = _SPACES_RE.sub(" ", data.replace("\n", " "))
+        self._emit(data)
+
+    def _emit(self, text: str) -> None:
+        self._parts.append(text)
+        self.size += len(text)
+
+    def text(self) -> str:
+        lines = (line.strip() for line in "".join(self._parts).split("\n"))
+        return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
@@ -0,0 +1,189 @@
+"""
+Staged email processing: triage and action stages connected by bounded queues.
+
+Each stage has its own worker threads. The bounded queues provide
+backpressure: ``submit`` blocks while the triage stage is saturated, and
+triage workers block while the action stage is, so memory stays flat and
+a slow action (SMTP, escalation) never stalls the LLM workers beyond the
+action queue's capacity. ``close`` stops intake and drains everything that
+was accepted.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Callable
+
+from app.schemas.email_schema import EmailInbound
+from app.services.metrics import EMAIL_ERRORS, PIPELINE_QUEUE_DEPTH, registry
+from app.utils.logger import current_log_context, log_context
+
+logger = logging.getLogger(__name__)
+
+Triage = Callable[[EmailInbound], dict]
+Act = Callable[[EmailInbound, dict], bool]
+OnDone = Callable[[dict, bool], None]
+
+_STOP = None
+
+# Open pipelines, for the queue depth gauges
+_pipelines: "weakref.WeakSet[EmailPipeline]" = weakref.WeakSet()
+
+
+class EmailPipeline:
+    """
+    ``triage(email) -> result`` runs on the triage stage and
+    ``act(email, result) -> handled`` on the action stage. Every submitted
+    email gets a Future resolving to ``(result, handled)``; it fails with
+    the exception if triage raised. ``submit`` may override ``triage``
+    and ``act`` for one email (e.g. to triage within that email's tenant
+    and reply from its own mailbox), and an
+    ``on_done(result, handled)`` hook runs on the action worker before the
+    Future resolves, e.g. to persist the outcome right after the side effect.
+    Each stage's wall time is added to the result as
+    ``stage_ms = {"triage": ..., "action": ...}``.
+    """
+
+    def __init__(
+        self,
+        triage: Triage,
+        act: Act | None = None,
+        triage_workers: int = 4,
+        action_workers: int = 2,
+        queue_size: int = 32,
+    ) -> None:
+        self._triage = triage
+        self._act = act
+        self._triage_queue: queue.Queue = queue.Queue(max(1, queue_size))
+        self._action_queue: queue.Queue = queue.Queue(max(1, queue_size))
+        self._counters = {"submitted": 0, "triaged": 0, "handled": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._triage_threads = _start(self._triage_worker, "pipeline-triage", triage_workers)
+        self._action_threads = _start(self._action_worker, "pipeline-action", action_workers)
+        _pipelines.add(self)
+
+    def submit(
+        self,
+        email: EmailInbound,
+        on_done: OnDone | None = None,
+        timeout: float | None = None,
+        act: Act | None = None,
+        triage: Triage | None = None,
+    ) -> Future:
+        """Queue an email; blocks (up to ``timeout``) while the triage stage is full"""
+        if self._closed:
+            raise RuntimeError("Pipeline is closed")
+        act = act or self._act
+        if act is None:
+            raise ValueError("No action handler for this email")
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+        # The workers log with the submitter's context (e.g. its tenant)
+        context = {**current_log_context(), "email_id": email.message_id or email.uid}
+        item = (email, triage or self._triage, act, on_done, future, context)
+        self._triage_queue.put(item, timeout=timeout)
+        self._count("submitted")
+        return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "triage_queue": self._triage_queue.qsize(),
+                "action_queue": self._action_queue.qsize(),
+            }
+
+    def close(self, timeout: float | None = None) -> None:
+        """Stop accepting emails and wait until every accepted one went through"""
+        if self._closed:
+            return
+        self._closed = True
+        _pipelines.discard(self)
+        # Stop markers queue up behind accepted work, so both stages drain
+        for _ in self._triage_threads:
+            self._triage_queue.put(_STOP)
+        for thread in self._triage_threads:
+            thread.join(timeout)
+        for _ in self._action_threads:
+            self._action_queue.put(_STOP)
+        for thread in self._action_threads:
+            thread.join(timeout)
+        logger.info("Pipeline drained: %s", self.stats())
+
+    def _triage_worker(self) -> None:
+        while True:
+            item = self._triage_queue.get()
+            if item is _STOP:
+                return
+            email, triage, act, on_done, future, context = item
+            started = time.perf_counter()
+            try:
+                with log_context(**context, stage="triage"):
+                    result = triage(email)
+            except Exception as e:
+                logger.error("Triage failed for %s: %s", email.subject, e)
+                EMAIL_ERRORS.labels("triage", type(e).__name__).inc()
+                self._count("failed")
+                future.set_exception(e)
+                continue
+            self._count("triaged")
+            if isinstance(result, dict):
+                result.setdefault("stage_ms", {})["triage"] = _ms_since(started)
+            # Blocks while the action stage is saturated (backpressure)
+            self._action_queue.put((email, result, act, on_done, future, context))
+
+    def _action_worker(self) -> None:
+        while True:
+            item = self._action_queue.get()
+            if item is _STOP:
+                return
+            email, result, act, on_done, future, context = item
+            started = time.perf_counter()
+            try:
+                with log_context(**context, stage="action"):
+                    handled = bool(act(email, result))
+            except Exception as e:
+                logger.error("Action failed for %s: %s", email.subject, e)
+                EMAIL_ERRORS.labels("action", type(e).__name__).inc()
+                handled = False
+            if isinstance(result, dict):
+                result.setdefault("stage_ms", {})["action"] = _ms_since(started)
+            self._count("handled" if handled else "failed")
+            if on_done is not None:
+                try:
+                    on_done(result, handled)
+                except Exception as e:
+                    logger.error("Completion hook failed for %s: %s", email.subject, e)
+            future.set_result((result, handled))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+
+def _collect_queue_depth() -> None:
+    pipelines = list(_pipelines)
+    PIPELINE_QUEUE_DEPTH.labels("triage").set(sum(p._triage_queue.qsize() for p in pipelines))
+    PIPELINE_QUEUE_DEPTH.labels("action").set(sum(p._action_queue.qsize() for p in pipelines))
+
+
+registry.add_collector(_collect_queue_depth)
+
+
+def _ms_since(started: float) -> int:
+    return int((time.perf_counter() - started) * 1000)
+
+
+def _start(target: Callable[[], None], name: str, count: int) -> list[threading.Thread]:
+    threads = [
+        threading.Thread(target=target, name=f"{name}-{index}", daemon=True)
+        for index in range(max(1, count))
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
@@ -0,0 +1,146 @@
+"""
+Email body preprocessing to bound prompt size.
+
+Quoted reply history, signatures and legal footers are stripped, then the
+remaining text is truncated to a token budget. Token counts use tiktoken
+when it is installed and a fast character-based estimate otherwise.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # optional dependency (or its data files) unavailable
+    _ENCODING = None
+
+# Rough average for English mail when no tokenizer is installed
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "\n[...]"
+
+# A line that starts the quoted history; it and everything after are dropped
+_HISTORY_MARKERS = [
+    re.compile(r"^\s*On .{0,200}wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*Forwarded message\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^\s*_{10,}\s*$"),
+]
+# Outlook-style header block: "From:" followed closely by "Sent:" or "Date:"
+_OUTLOOK_FROM = re.compile(r"^\s*From:\s", re.IGNORECASE)
+_OUTLOOK_SENT = re.compile(r"^\s*(Sent|Date):\s", re.IGNORECASE)
+_SIGNATURE_MARKERS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^\s*Sent from my \w+", re.IGNORECASE),
+    re.compile(r"^\s*Get Outlook for \w+", re.IGNORECASE),
+]
+# Paragraphs of legal/compliance boilerplate; a match must stay within one sentence
+_BOILERPLATE = [
+    re.compile(r"\b(confidential|privileged)\b[^.!?]{0,200}?\b(intended (solely )?for|recipient)\b", re.IGNORECASE),
+    re.compile(r"\bthis (e-?mail|message) and any (files|attachments)\b", re.IGNORECASE),
+    re.compile(r"\bplease consider the environment before printing\b", re.IGNORECASE),
+]
+
+
+@dataclass(frozen=True)
+class PreparedBody:
+    text: str
+    original_chars: int
+    original_tokens: int
+    tokens: int
+    truncated: bool
+
+    @property
+    def removed_chars(self) -> int:
+        return self.original_chars - len(self.text)
+
+    @property
+    def removed_tokens(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, budget: int) -> tuple[str, bool]:
+    """Keep the head of ``text`` within ``budget`` tokens"""
+    if budget <= 0 or count_tokens(text) <= budget:
+        return text, False
+    budget = max(1, budget - count_tokens(TRUNCATION_MARKER))
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        head = _ENCODING.decode(tokens[:budget])
+    else:
+        head = text[:budget * CHARS_PER_TOKEN]
+        # Avoid cutting in the middle of a word
+        cut = head.rfind(" ")
+        if cut > len(head) // 2:
+            head = head[:cut]
+    return head.rstrip() + TRUNCATION_MARKER, True
+
+
+def strip_quoted_history(text: str) -> str:
+    lines = text.splitlines()
+    kept: list[str] = []
+    for index, line in enumerate(lines):
+        if any(marker.match(line) for marker in _HISTORY_MARKERS):
+            break
+        if _OUTLOOK_FROM.match(line) and any(
+            _OUTLOOK_SENT.match(following) for following in lines[index + 1:index + 4]
+        ):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def strip_signature(text: str) -> str:
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        if index > 0 and any(marker.match(line) for marker in _SIGNATURE_MARKERS):
+            return "\n".join(lines[:index])
+    return text
+
+
+def strip_boilerplate(text: str) -> str:
+    """Drop the disclaimer paragraphs at the end; the same words earlier are the sender's own"""
+    paragraphs = re.split(r"\n\s*\n", text)
+    while paragraphs and any(pattern.search(paragraphs[-1]) for pattern in _BOILERPLATE):
+        paragraphs.pop()
+    return "\n\n".join(paragraphs)
+
+
+def prepare_body(body: str, token_budget: int) -> PreparedBody:
+    """
+    Clean an email body and cap it at ``token_budget`` tokens.
+
+    Falls back to the original text if stripping would leave nothing
+    (e.g. a mail that is only a forwarded message).
+    """
+    original = body or ""
+    original_tokens = count_tokens(original)
+
+    text = strip_boilerplate(strip_signature(strip_quoted_history(original)))
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    if not text:
+        text = original.strip()
+
+    text, truncated = truncate_to_tokens(text, token_budget)
+    return PreparedBody(
+        text=text,
+        original_chars=len(original),
+        original_tokens=original_tokens,
+        tokens=count_tokens(text),
+        truncated=truncated,
+    )
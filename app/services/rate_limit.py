@@ -0,0 +1,171 @@
+"""
+Admission control for the webhook.
+
+Every email takes one token from its tenant's bucket and one from its
+sender's bucket (token buckets: ``rate`` tokens per minute, up to
+``burst`` saved up), and synchronous processing additionally needs one of
+``max_in_flight`` slots. A request that is refused gets the number of
+seconds until it would be admitted, which the API returns as Retry-After.
+
+Bucket state is kept in memory by default. With a SQLite path, all API
+worker processes on the host share the buckets; the in-flight ceiling is
+always per process.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parseaddr
+
+from app.services.metrics import WEBHOOK_IN_FLIGHT, registry
+from app.utils.config import settings
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float) -> None:
+        super().__init__(f"Rate limit exceeded for {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class MemoryBuckets:
+    """Token buckets in a bounded LRU map (idle senders fall out first)"""
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Take a token: 0 if granted, else seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, wait = _refill_and_take(tokens, now - updated, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file shared by the processes of one host"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        db = self._connect()
+        now = time.time()  # wall clock: shared across processes
+        with db:
+            db.execute("BEGIN IMMEDIATE")  # serialize the read-modify-write
+            row = db.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, wait = _refill_and_take(tokens, max(0.0, now - updated), rate, burst)
+            db.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+        return wait
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+
+def _refill_and_take(tokens: float, elapsed: float, rate: float, burst: float) -> tuple[float, float]:
+    per_second = rate / 60.0
+    tokens = min(burst, tokens + elapsed * per_second)
+    if tokens >= 1.0:
+        return tokens - 1.0, 0.0
+    return tokens, (1.0 - tokens) / per_second
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        tenant_rate: float = 0,
+        tenant_burst: float = 0,
+        sender_rate: float = 0,
+        sender_burst: float = 0,
+        max_in_flight: int = 0,
+        buckets: MemoryBuckets | SQLiteBuckets | None = None,
+    ) -> None:
+        # A rate of 0 disables that limit
+        self.tenant_rate = tenant_rate
+        self.tenant_burst = max(1.0, tenant_burst or tenant_rate)
+        self.sender_rate = sender_rate
+        self.sender_burst = max(1.0, sender_burst or sender_rate)
+        self.max_in_flight = max_in_flight
+        self.buckets = buckets or MemoryBuckets()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def check(self, tenant: str | None, sender: str | None) -> None:
+        """Take the tenant's and the sender's tokens or raise ``RateLimited``"""
+        if self.tenant_rate > 0:
+            wait = self.buckets.take(f"tenant:{tenant or '-'}", self.tenant_rate, self.tenant_burst)
+            if wait:
+                raise RateLimited("tenant", wait)
+        address = parseaddr(sender or "")[1].lower()
+        if self.sender_rate > 0 and address:
+            wait = self.buckets.take(f"sender:{tenant or '-'}:{address}", self.sender_rate, self.sender_burst)
+            if wait:
+                raise RateLimited("sender", wait)
+
+    def acquire(self) -> None:
+        """Take one of the ``max_in_flight`` processing slots or raise ``RateLimited``"""
+        with self._lock:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                raise RateLimited("server", 1.0)
+            self._in_flight += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+
+_shared: AdmissionController | None = None
+_shared_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                path = settings.rate_limit_sqlite_path
+                _shared = AdmissionController(
+                    tenant_rate=settings.rate_limit_tenant_per_minute,
+                    tenant_burst=settings.rate_limit_tenant_burst,
+                    sender_rate=settings.rate_limit_sender_per_minute,
+                    sender_burst=settings.rate_limit_sender_burst,
+                    max_in_flight=settings.webhook_max_in_flight,
+                    buckets=SQLiteBuckets(path) if path else MemoryBuckets(),
+                )
+    return _shared
+
+
+def _collect_in_flight() -> None:
+    WEBHOOK_IN_FLIGHT.set(_shared.in_flight if _shared is not None else 0)
+
+
+registry.add_collector(_collect_in_flight)
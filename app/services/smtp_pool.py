@@ -0,0 +1,307 @@
+"""
+Pooled SMTP sending with a background outbound queue.
+
+``SMTPPool`` keeps a few authenticated SMTP sessions open and hands them out
+one at a time; sessions that have been idle too long or have sent many
+messages are recycled, and a send that fails on a dropped session is
+retried once on a fresh one. ``OutboundQueue`` drains messages to the pool
+from worker threads so callers never wait on SMTP.
+"""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import logging
+import queue
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from email.message import Message
+from typing import Iterator
+
+from app.services.metrics import SMTP_QUEUE_DEPTH, SMTP_SEND_SECONDS, registry
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a session cannot be trusted any more
+_SESSION_ERRORS = (smtplib.SMTPServerDisconnected, OSError)
+
+
+class _Session:
+    def __init__(self, smtp: smtplib.SMTP) -> None:
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str | None = None,
+        password: str | None = None,
+        size: int = 2,
+        starttls: bool = True,
+        timeout: float = 30.0,
+        max_idle: float = 60.0,
+        max_messages: int = 100,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = max(1, size)
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_messages = max(1, max_messages)
+        self._idle: queue.LifoQueue[_Session] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._closed = False
+
+    def send(self, msg: Message) -> None:
+        """Send one message; a dropped session is replaced and the send retried once"""
+        for attempt in range(2):
+            with self._session(fresh=attempt > 0) as session:
+                try:
+                    session.smtp.send_message(msg)
+                    session.sent += 1
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    session.sent = self.max_messages  # discard on release
+                    if attempt:
+                        raise
+                    logger.info("SMTP session dropped; retrying on a new connection")
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._quit(session)
+
+    @contextmanager
+    def _session(self, fresh: bool = False) -> Iterator[_Session]:
+        if self._closed:
+            raise RuntimeError("SMTP pool is closed")
+        self._slots.acquire()
+        session = None
+        try:
+            session = None if fresh else self._checkout()
+            if session is None:
+                session = self._connect()
+            yield session
+        except _SESSION_ERRORS:
+            if session is not None:
+                self._quit(session)
+                session = None
+            raise
+        finally:
+            if session is not None:
+                if session.sent >= self.max_messages or self._closed:
+                    self._quit(session)
+                else:
+                    session.last_used = time.monotonic()
+                    self._idle.put(session)
+            self._slots.release()
+
+    def _checkout(self) -> _Session | None:
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - session.last_used < self.max_idle:
+                return session
+            # Servers drop idle sessions; a NOOP tells us without sending
+            try:
+                if session.smtp.noop()[0] == 250:
+                    return session
+            except _SESSION_ERRORS:
+                pass
+            self._quit(session)
+
+    def _connect(self) -> _Session:
+        logger.info("Connecting to SMTP server: %s:%s", self.host, self.port)
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                # Fail rather than fall back: a missing STARTTLS may have been
+                # stripped on the way, and the login would go out in plaintext
+                if not smtp.has_extn("starttls"):
+                    raise smtplib.SMTPNotSupportedError(
+                        f"{self.host}:{self.port} does not offer STARTTLS"
+                    )
+                smtp.starttls()
+                smtp.ehlo()
+                if self.user and self.password and smtp.has_extn("auth"):
+                    smtp.login(self.user, self.password)
+            elif self.user and self.password:
+                logger.warning("SMTP_STARTTLS is off; not sending credentials to %s unencrypted", self.host)
+        except Exception:
+            smtp.close()
+            raise
+        return _Session(smtp)
+
+    @staticmethod
+    def _quit(session: _Session) -> None:
+        try:
+            session.smtp.quit()
+        except Exception:
+            session.smtp.close()
+
+
+class OutboundQueue:
+    """Bounded queue of outgoing messages drained by worker threads"""
+
+    def __init__(
+        self,
+        pool: SMTPPool,
+        workers: int = 2,
+        maxsize: int = 1000,
+        retries: int = 3,
+        backoff: float = 2.0,
+    ) -> None:
+        self.pool = pool
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self._queue: queue.Queue[tuple[Message, Future] | None] = queue.Queue(maxsize)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"smtp-send-{index}", daemon=True)
+            for index in range(max(1, workers))
+        ]
+        self._stopped = False
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, msg: Message, timeout: float | None = None) -> Future:
+        """
+        Queue a message. Blocks (up to ``timeout``) while the queue is full,
+        which pushes back on producers instead of growing without bound.
+        """
+        if self._stopped:
+            raise RuntimeError("Outbound queue is closed")
+        future: Future = Future()
+        self._queue.put((msg, future), timeout=timeout)
+        return future
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, drain: bool = True, timeout: float | None = 30.0) -> None:
+        """Stop the workers, by default after the queued messages were sent"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if not drain:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[1].cancel()
+        for _ in self._workers:
+            self._queue.put(None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self.pool.close()
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            msg, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                self._send(msg)
+            except Exception as e:
+                SMTP_SEND_SECONDS.labels("failed").observe(time.perf_counter() - started)
+                logger.error("❌ Failed to send email to %s: %s", msg["To"], e)
+                future.set_exception(e)
+            else:
+                SMTP_SEND_SECONDS.labels("sent").observe(time.perf_counter() - started)
+                logger.info("✅ Successfully sent reply to %s", msg["To"])
+                future.set_result(None)
+
+    def _send(self, msg: Message) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                self.pool.send(msg)
+                return
+            except smtplib.SMTPAuthenticationError:
+                raise
+            except (smtplib.SMTPException, OSError) as e:
+                permanent = isinstance(e, smtplib.SMTPResponseException) and 500 <= e.smtp_code < 600
+                if permanent or attempt == self.retries:
+                    raise
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                logger.warning("SMTP send failed (%s); retrying in %.1fs", e, delay)
+                time.sleep(delay)
+
+
+_outbound: dict[tuple, OutboundQueue] = {}
+_outbound_lock = threading.Lock()
+
+
+def get_outbound_queue(
+    host: str, port: int, user: str | None, password: str | None
+) -> OutboundQueue:
+    """Return the process-wide outbound queue for one SMTP account"""
+    # A changed password gets a queue (and sessions) of its own; the key
+    # holds a digest so the password itself is not kept around twice
+    digest = hashlib.sha256((password or "").encode()).hexdigest()
+    key = (host, port, user, digest)
+    outbound = _outbound.get(key)
+    if outbound is None:
+        with _outbound_lock:
+            outbound = _outbound.get(key)
+            if outbound is None:
+                pool = SMTPPool(
+                    host,
+                    port,
+                    user,
+                    password,
+                    size=settings.smtp_pool_size,
+                    starttls=settings.smtp_starttls,
+                    max_idle=settings.smtp_max_idle,
+                    max_messages=settings.smtp_max_messages,
+                )
+                outbound = _outbound[key] = OutboundQueue(
+                    pool,
+                    workers=settings.smtp_send_workers,
+                    maxsize=settings.smtp_queue_size,
+                    retries=settings.smtp_send_retries,
+                )
+                if len(_outbound) == 1:
+                    # Flush pending replies when the process exits normally
+                    atexit.register(close_outbound_queue)
+    return outbound
+
+
+def _collect_queue_depth() -> None:
+    SMTP_QUEUE_DEPTH.set(sum(outbound.depth for outbound in list(_outbound.values())))
+
+
+registry.add_collector(_collect_queue_depth)
+
+
+def close_outbound_queue(drain: bool = True) -> None:
+    with _outbound_lock:
+        queues = list(_outbound.values())
+        _outbound.clear()
+    for outbound in queues:
+        outbound.close(drain=drain)
@@ -0,0 +1,228 @@
+"""
+Time-bucketed stats rollups: EmailLog counts per minute, hour and day.
+
+Rows are added to minute buckets in the same transaction that inserts
+them into EmailLog. ``compact_rollups`` folds closed hours into hour
+buckets and closed days into day buckets; a watermark per size records
+how far that went, and moving it is a compare-and-set, so concurrent
+workers never fold a bucket twice. Rows that arrive after their hour was
+folded go straight into the hour (or day) bucket.
+
+Queries read the requested size before its watermark and fill in the
+recent part from the finer size: a 30-day chart by hour reads ~720 hour
+buckets per tenant/action/intent plus at most a couple of hours of
+minutes. Minute buckets are kept ROLLUP_MINUTE_RETENTION_HOURS and hour
+buckets ROLLUP_HOUR_RETENTION_DAYS (both only once folded); day buckets
+are kept forever.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Iterable
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.crud import ROLLUP_MEASURES
+from app.db.session import SessionLocal
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ("minute", "hour", "day")
+GROUP_BY = ("tenant", "action", "intent")
+# Points (buckets) one query may return; beyond that use a coarser bucket
+MAX_POINTS = 5000
+
+_FINER = {"hour": "minute", "day": "hour"}
+_COARSER = {"minute": "hour", "hour": "day"}
+# A bucket is folded this long after it closed, so rows still in a
+# writer's buffer (EMAIL_LOG_FLUSH_INTERVAL) land in the minutes first
+_FOLD_GRACE = timedelta(minutes=5)
+_DIMENSIONS = {"tenant": "tenant_id", "action": "action", "intent": "intent"}
+_GROUP_COLUMNS = tuple(_DIMENSIONS.values())
+
+
+def bucket_start(moment: datetime, bucket: str) -> datetime:
+    moment = moment.replace(second=0, microsecond=0)
+    if bucket == "minute":
+        return moment
+    moment = moment.replace(minute=0)
+    return moment if bucket == "hour" else moment.replace(hour=0)
+
+
+def bucket_delta(bucket: str) -> timedelta:
+    return {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}[bucket]
+
+
+def add_email_logs(db: Session, rows: Iterable[dict]) -> None:
+    """
+    Count EmailLog rows (dicts as inserted) into the rollups, in ``db``'s
+    transaction: minute buckets, or the first size not folded yet.
+    """
+    watermarks = {bucket: crud.get_rollup_watermark(db, bucket) for bucket in _FINER}
+    totals: dict[tuple, dict] = {}
+    for row in rows:
+        created_at = row.get("created_at") or datetime.utcnow()
+        bucket = "minute"
+        while bucket in _COARSER:
+            folded_until = watermarks[_COARSER[bucket]]
+            if folded_until is None or bucket_start(created_at, _COARSER[bucket]) >= folded_until:
+                break
+            bucket = _COARSER[bucket]
+        key = (
+            bucket,
+            bucket_start(created_at, bucket),
+            row.get("tenant_id") or 0,
+            row.get("action") or "",
+            (row.get("intent") or "")[:100],
+        )
+        measures = totals.setdefault(key, dict.fromkeys(ROLLUP_MEASURES, 0))
+        measures["emails"] += 1
+        measures["errors"] += 1 if row.get("error") else 0
+        if row.get("chars_trimmed") is not None:
+            measures["trimmed"] += 1
+            measures["chars_trimmed"] += row["chars_trimmed"]
+        if row.get("triage_ms") is not None:
+            measures["triaged"] += 1
+            measures["triage_ms"] += row["triage_ms"]
+        if row.get("action_ms") is not None:
+            measures["acted"] += 1
+            measures["action_ms"] += row["action_ms"]
+
+    crud.add_to_stats_rollup(db, [
+        dict(zip(crud.ROLLUP_KEY, key), **measures) for key, measures in totals.items()
+    ])
+
+
+def compact_rollups(
+    now: datetime | None = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> None:
+    """Fold closed minutes into hours and closed hours into days, then expire old buckets"""
+    now = now or datetime.utcnow()
+    for bucket in ("hour", "day"):
+        with session_factory() as db:
+            _fold(db, bucket, now)
+
+    with session_factory() as db:
+        # Only what was folded may go
+        minute_cutoff = min(
+            crud.get_rollup_watermark(db, "hour") or datetime.min,
+            bucket_start(now - timedelta(hours=settings.rollup_minute_retention_hours), "hour"),
+        )
+        hour_cutoff = min(
+            crud.get_rollup_watermark(db, "day") or datetime.min,
+            bucket_start(now - timedelta(days=settings.rollup_hour_retention_days), "day"),
+        )
+        crud.delete_stats_rollup(db, "minute", minute_cutoff)
+        crud.delete_stats_rollup(db, "hour", hour_cutoff)
+
+
+def _fold(db: Session, bucket: str, now: datetime) -> None:
+    finer = _FINER[bucket]
+    folded_until = crud.get_rollup_watermark(db, bucket)
+    start = folded_until
+    if start is None:
+        first = crud.first_stats_rollup_start(db, finer)
+        start = bucket_start(first if first is not None else now, bucket)
+    end = bucket_start(now - _FOLD_GRACE, bucket)
+    if finer in _FINER:
+        # Only what is complete at the finer size
+        end = min(end, crud.get_rollup_watermark(db, finer) or start)
+    if end <= start:
+        return
+
+    values = _aggregate(crud.stats_rollup_rows(db, finer, start, end), bucket, _GROUP_COLUMNS)
+    if not crud.move_rollup_watermark(db, bucket, folded_until, end):
+        db.rollback()
+        return  # another process folded this range
+    crud.add_to_stats_rollup(db, [
+        {"bucket": bucket, "bucket_start": key[0], **dict(zip(_GROUP_COLUMNS, key[1:])), **measures}
+        for key, measures in values.items()
+    ])
+    db.commit()
+    logger.info("Folded %s %s rollup group(s) into %s buckets up to %s", len(values), finer, bucket, end)
+
+
+def _aggregate(rows: Iterable[dict], bucket: str, columns: tuple[str, ...]) -> dict[tuple, dict]:
+    """Sum rows per (bucket start, *columns)"""
+    totals: dict[tuple, dict] = defaultdict(lambda: dict.fromkeys(ROLLUP_MEASURES, 0))
+    for row in rows:
+        measures = totals[(bucket_start(row["bucket_start"], bucket), *(row[name] for name in columns))]
+        for name in ROLLUP_MEASURES:
+            measures[name] += row[name]
+    return totals
+
+
+def _rows(db: Session, bucket: str, start: datetime, end: datetime, tenant_id: int | None) -> list[dict]:
+    """Rows covering [start, end) at ``bucket`` size, the unfolded part from the finer size"""
+    if bucket not in _FINER:
+        return crud.stats_rollup_rows(db, bucket, start, end, tenant_id)
+    folded_until = crud.get_rollup_watermark(db, bucket) or start
+    rows = crud.stats_rollup_rows(db, bucket, start, min(end, max(start, folded_until)), tenant_id)
+    if folded_until < end:
+        rows += _rows(db, _FINER[bucket], max(start, folded_until), end, tenant_id)
+    return rows
+
+
+def query_stats(
+    start: datetime,
+    end: datetime,
+    bucket: str = "hour",
+    group_by: Iterable[str] = (),
+    tenant_id: int | None = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> dict:
+    """
+    A time series of counts in [start, end) per ``bucket``, split by the
+    ``group_by`` dimensions (tenant, action, intent). Raises ValueError
+    for an unknown bucket or dimension, or too many points.
+    """
+    group_by = tuple(dict.fromkeys(group_by))
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    unknown = [name for name in group_by if name not in _DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(unknown)}; use {', '.join(GROUP_BY)}")
+    start = bucket_start(start, bucket)
+    if end <= start:
+        raise ValueError("'to' must be after 'from'")
+    if (end - start) / bucket_delta(bucket) > MAX_POINTS:
+        raise ValueError(f"More than {MAX_POINTS} {bucket} buckets; use a coarser bucket or a shorter range")
+
+    with session_factory() as db:
+        rows = _rows(db, bucket, start, end, tenant_id)
+
+    columns = tuple(_DIMENSIONS[name] for name in group_by)
+    totals = dict.fromkeys(ROLLUP_MEASURES, 0)
+    series = []
+    for key, measures in sorted(_aggregate(rows, bucket, columns).items()):
+        point = {"bucket_start": key[0].isoformat()}
+        for name, value in zip(group_by, key[1:]):
+            point[name] = value or None  # 0 / "" were stored for missing values
+        series.append(point | _public(measures))
+        for name in ROLLUP_MEASURES:
+            totals[name] += measures[name]
+
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "bucket": bucket,
+        "group_by": list(group_by),
+        "totals": _public(totals),
+        "series": series,
+    }
+
+
+def _public(measures: dict) -> dict:
+    return {
+        "emails": measures["emails"],
+        "errors": measures["errors"],
+        "trimmed": measures["trimmed"],
+        "chars_trimmed": measures["chars_trimmed"],
+        "avg_triage_ms": round(measures["triage_ms"] / measures["triaged"], 1) if measures["triaged"] else None,
+        "avg_action_ms": round(measures["action_ms"] / measures["acted"], 1) if measures["acted"] else None,
+    }
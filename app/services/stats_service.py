@@ -1,43 +1,83 @@
 from __future__ import annotations
 
-from pathlib import Path
+import hashlib
+import json
+import os
 import re
-from typing import Iterable
+import threading
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+COUNTERS = ("processed", "auto_replies", "tagged", "escalations", "trimmed", "chars_trimmed")
+
+# Bytes at the start of a file that identify it when its inode is reused
+_HEAD_BYTES = 128
 
 
 class StatsService:
-    def __init__(self, log_dir: Path | None = None) -> None:
+    """
+    Counts pipeline events in ``logs/email_cleaner.log*`` incrementally.
+
+    Each file is tracked by device/inode, so the renames done by
+    ``RotatingFileHandler`` keep its counts and offset; only bytes appended
+    since the last call are parsed. A file that shrank or whose first bytes
+    changed (inode reused) is recounted from zero, and files that were
+    deleted drop out of the totals. Offsets and per-file counts are saved
+    to a checkpoint next to the logs, so a restart does not reparse
+    everything.
+    """
+
+    def __init__(self, log_dir: Path | None = None, checkpoint_path: Path | None = None) -> None:
         self._log_dir = log_dir or (Path(__file__).resolve().parents[2] / "logs")
+        self._checkpoint_path = checkpoint_path or self._log_dir / ".stats_checkpoint.json"
+        self._files: dict[str, dict] | None = None
+        self._lock = threading.Lock()
 
         self._processed_patterns = [
-            re.compile(r"Processing email:\s", re.IGNORECASE),
-            re.compile(r"\bProcessing:\s", re.IGNORECASE),
+            re.compile(rb"Processing email:\s", re.IGNORECASE),
+            re.compile(rb"\bProcessing:\s", re.IGNORECASE),
         ]
         self._auto_reply_patterns = [
-            re.compile(r"Sent auto-reply for:\s", re.IGNORECASE),
-            re.compile(r"Sent auto-reply to:\s", re.IGNORECASE),
+            re.compile(rb"Sent auto-reply for:\s", re.IGNORECASE),
+            re.compile(rb"Sent auto-reply to:\s", re.IGNORECASE),
         ]
         self._tagged_patterns = [
-            re.compile(r"Tagged email with:\s", re.IGNORECASE),
-            re.compile(r"Tagged with:\s", re.IGNORECASE),
+            re.compile(rb"Tagged email with:\s", re.IGNORECASE),
+            re.compile(rb"Tagged with:\s", re.IGNORECASE),
         ]
         self._escalation_patterns = [
-            re.compile(r"Escalated email:\s", re.IGNORECASE),
-            re.compile(r"Escalated to human", re.IGNORECASE),
+            re.compile(rb"Escalated email:\s", re.IGNORECASE),
+            re.compile(rb"Escalated to human", re.IGNORECASE),
         ]
+        self._trimmed_pattern = re.compile(rb"Trimmed email body: removed (\d+) chars")
 
     def get_stats(self) -> dict:
-        stats = {
-            "processed": 0,
-            "auto_replies": 0,
-            "tagged": 0,
-            "escalations": 0,
-        }
+        with self._lock:
+            if self._files is None:
+                self._files = self._load_checkpoint()
 
-        for log_file in self._iter_log_files():
-            self._accumulate_from_file(log_file, stats)
+            current: dict[str, dict] = {}
+            changed = False
+            for log_file in self._iter_log_files():
+                try:
+                    with log_file.open("rb") as handle:
+                        info = os.fstat(handle.fileno())
+                        key = f"{info.st_dev}:{info.st_ino}"
+                        state, updated = self._update_file(handle, info.st_size, self._files.get(key))
+                except OSError:
+                    continue
+                current[key] = state
+                changed = changed or updated
+            changed = changed or current.keys() != self._files.keys()
+            self._files = current
+            if changed:
+                self._save_checkpoint()
 
-        return stats
+            stats = dict.fromkeys(COUNTERS, 0)
+            for state in current.values():
+                for name in COUNTERS:
+                    stats[name] += state["counts"].get(name, 0)
+            return stats
 
     def _iter_log_files(self) -> Iterable[Path]:
         if not self._log_dir.exists():
@@ -50,24 +90,87 @@ class StatsService:
         ]
         return sorted(files)
 
-    def _accumulate_from_file(self, log_file: Path, stats: dict) -> None:
+    def _update_file(self, handle: BinaryIO, size: int, state: dict | None) -> tuple[dict, bool]:
+        """Bring one file's state up to date; returns (state, whether it changed)"""
+        if state is not None and size == state["offset"]:
+            return state, False  # nothing appended (every rotated file)
+
+        if state is not None and size > state["offset"]:
+            head = handle.read(state["head_len"])
+            if _digest(head) != state["head"]:
+                state = None  # same inode, different file
+        else:
+            state = None  # new file, or truncated
+
+        if state is None:
+            state = {"offset": 0, "head_len": 0, "head": _digest(b""), "counts": dict.fromkeys(COUNTERS, 0)}
+
+        handle.seek(state["offset"])
+        offset = state["offset"]
+        counts = state["counts"]
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break  # still being written; picked up next time
+            offset += len(line)
+            self._count_line(line, counts)
+        state["offset"] = offset
+
+        if state["head_len"] < _HEAD_BYTES:
+            handle.seek(0)
+            head = handle.read(min(_HEAD_BYTES, offset))
+            state["head_len"], state["head"] = len(head), _digest(head)
+        return state, True
+
+    def _count_line(self, line: bytes, stats: dict) -> None:
+        if self._matches_any(line, self._processed_patterns):
+            stats["processed"] += 1
+            return
+        if self._matches_any(line, self._auto_reply_patterns):
+            stats["auto_replies"] += 1
+            return
+        if self._matches_any(line, self._tagged_patterns):
+            stats["tagged"] += 1
+            return
+        if self._matches_any(line, self._escalation_patterns):
+            stats["escalations"] += 1
+            return
+        trimmed = self._trimmed_pattern.search(line)
+        if trimmed:
+            stats["trimmed"] += 1
+            stats["chars_trimmed"] += int(trimmed.group(1))
+
+    def _load_checkpoint(self) -> dict[str, dict]:
         try:
-            with log_file.open("r", encoding="utf-8", errors="ignore") as handle:
-                for line in handle:
-                    if self._matches_any(line, self._processed_patterns):
-                        stats["processed"] += 1
-                        continue
-                    if self._matches_any(line, self._auto_reply_patterns):
-                        stats["auto_replies"] += 1
-                        continue
-                    if self._matches_any(line, self._tagged_patterns):
-                        stats["tagged"] += 1
-                        continue
-                    if self._matches_any(line, self._escalation_patterns):
-                        stats["escalations"] += 1
+            return json.loads(self._checkpoint_path.read_text())["files"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _save_checkpoint(self) -> None:
+        try:
+            tmp = self._checkpoint_path.with_name(self._checkpoint_path.name + ".tmp")
+            tmp.write_text(json.dumps({"files": self._files}))
+            os.replace(tmp, self._checkpoint_path)
         except OSError:
-            return
+            return  # counting still works, only the restart is slower
 
     @staticmethod
-    def _matches_any(line: str, patterns: list[re.Pattern[str]]) -> bool:
+    def _matches_any(line: bytes, patterns: list[re.Pattern[bytes]]) -> bool:
         return any(pattern.search(line) for pattern in patterns)
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+_shared: StatsService | None = None
+_shared_lock = threading.Lock()
+
+
+def get_stats_service() -> StatsService:
+    """Return the process-wide stats service (keeps its offsets between requests)"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = StatsService()
+    return _shared
@@ -0,0 +1,138 @@
+"""
+Supervised worker processes, and sharding mailbox watchers across them.
+
+Every mailbox is owned by exactly one worker process, chosen by rendezvous
+(highest-random-weight) hashing of the mailbox id, so a tenant with many
+mailboxes is spread over the workers. Adding or removing a worker only
+moves the mailboxes that hash to it. A tenant's limits (``TenantGate``) are
+split evenly between the workers holding its mailboxes, without
+cross-process coordination. ``WorkerSupervisor`` restarts workers
+that die and stops them all on shutdown; the job queue workers use it too.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+def rendezvous_owner(key: str, workers: int) -> int:
+    """Index of the worker (0..workers-1) that owns ``key``"""
+    def weight(worker: int) -> bytes:
+        return hashlib.blake2b(f"{key}:{worker}".encode(), digest_size=8).digest()
+
+    return max(range(max(1, workers)), key=weight)
+
+
+class TenantGate:
+    """
+    Admission control for one tenant: at most ``max_concurrency`` emails in
+    flight, and no more than ``per_minute`` emails handed to the LLM per
+    minute (token bucket, 0 = unlimited). Callers block in ``acquire``, so
+    a hot tenant queues behind its own limits instead of filling the
+    shared pipeline.
+    """
+
+    def __init__(self, max_concurrency: int, per_minute: int = 0) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_minute = max(0, per_minute)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._tokens = float(self.per_minute)
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop: threading.Event | None = None) -> bool:
+        """Wait for a slot and a rate token; False if ``stop`` was set first"""
+        stop = stop or threading.Event()
+        while not self._slots.acquire(timeout=1.0):
+            if stop.is_set():
+                return False
+        while self.per_minute:
+            delay = self._take_token()
+            if delay <= 0:
+                break
+            if stop.wait(delay):
+                self._slots.release()
+                return False
+        return True
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def _take_token(self) -> float:
+        """Consume a token, or return how long until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            rate = self.per_minute / 60.0
+            self._tokens = min(float(self.per_minute), self._tokens + (now - self._refilled) * rate)
+            self._refilled = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / rate
+
+
+class WorkerSupervisor:
+    """
+    Run ``target(index, count, stop)`` in ``count`` worker processes and
+    keep them alive until ``stop`` is set.
+    """
+
+    def __init__(
+        self,
+        target: Callable,
+        count: int,
+        restart_delay: float = 5.0,
+        name: str = "worker",
+    ) -> None:
+        self.target = target
+        self.name = name
+        self.count = max(1, count)
+        self.restart_delay = restart_delay
+        self._ctx = multiprocessing.get_context("spawn")
+        self.stop_event = self._ctx.Event()
+        self._processes: list = [None] * self.count
+
+    def run(self, stop: threading.Event) -> None:
+        try:
+            while not stop.is_set():
+                for index, process in enumerate(self._processes):
+                    if process is not None and process.is_alive():
+                        continue
+                    if process is not None:
+                        logger.warning(
+                            "%s %s exited with %s; restarting", self.name, index, process.exitcode
+                        )
+                    self._processes[index] = self._spawn(index)
+                stop.wait(self.restart_delay)
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout: float = 60.0) -> None:
+        """Ask workers to drain and exit; terminate those that do not"""
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                logger.warning("%s %s did not stop; terminating", self.name, index)
+                process.terminate()
+                process.join(5)
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=self.target,
+            args=(index, self.count, self.stop_event),
+            name=f"{self.name}-{index}",
+            daemon=False,
+        )
+        process.start()
+        logger.info("Started %s %s (pid %s)", self.name, index, process.pid)
+        return process
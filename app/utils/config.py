@@ -1,6 +1,27 @@
 ﻿import os
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
 class Settings:
     @property
     def app_name(self) -> str:
@@ -39,6 +60,324 @@ class Settings:
         except ValueError:
             return 30
 
+    @property
+    def llm_base_urls(self) -> list[str]:
+        urls = [url.strip() for url in os.getenv("LLM_BASE_URLS", "").split(",") if url.strip()]
+        return urls or [self.llm_base_url]
+
+    @property
+    def llm_retries(self) -> int:
+        return max(0, _env_int("LLM_RETRIES", 1))
+
+    @property
+    def llm_retry_backoff(self) -> float:
+        return _env_float("LLM_RETRY_BACKOFF", 0.5)
+
+    @property
+    def llm_hedge_percentile(self) -> float:
+        return _env_float("LLM_HEDGE_PERCENTILE", 0.0)
+
+    @property
+    def llm_hedge_min_samples(self) -> int:
+        return _env_int("LLM_HEDGE_MIN_SAMPLES", 20)
+
+    @property
+    def llm_breaker_failures(self) -> int:
+        return _env_int("LLM_BREAKER_FAILURES", 5)
+
+    @property
+    def llm_breaker_reset(self) -> float:
+        return _env_float("LLM_BREAKER_RESET", 30.0)
+
+    @property
+    def llm_health_check_interval(self) -> float:
+        return _env_float("LLM_HEALTH_CHECK_INTERVAL", 0.0)
+
+    @property
+    def llm_pool_size(self) -> int:
+        return max(1, _env_int("LLM_POOL_SIZE", 10))
+
+    @property
+    def llm_keepalive_expiry(self) -> float:
+        return _env_float("LLM_KEEPALIVE_EXPIRY", 30.0)
+
+    @property
+    def llm_http2(self) -> bool:
+        return _env_bool("LLM_HTTP2")
+
+    @property
+    def llm_cache_enabled(self) -> bool:
+        return _env_bool("LLM_CACHE_ENABLED", True)
+
+    @property
+    def llm_cache_size(self) -> int:
+        return _env_int("LLM_CACHE_SIZE", 1024)
+
+    @property
+    def llm_cache_ttl(self) -> float:
+        return _env_float("LLM_CACHE_TTL", 3600.0)
+
+    @property
+    def llm_cache_path(self) -> str | None:
+        path = os.getenv("LLM_CACHE_PATH", "").strip()
+        return path or None
+
+    @property
+    def llm_cache_max_temperature(self) -> float:
+        return _env_float("LLM_CACHE_MAX_TEMPERATURE", 0.3)
+
+    @property
+    def crew_triage_mode(self) -> bool:
+        return _env_bool("CREW_TRIAGE_MODE")
+
+    @property
+    def crew_rules_fast_path(self) -> bool:
+        return _env_bool("CREW_RULES_FAST_PATH", True)
+
+    @property
+    def crew_rules_threshold(self) -> float:
+        return _env_float("CREW_RULES_THRESHOLD", 0.9)
+
+    @property
+    def crew_batch_concurrency(self) -> int:
+        return max(1, _env_int("CREW_BATCH_CONCURRENCY", 8))
+
+    @property
+    def crew_batch_pack(self) -> bool:
+        return _env_bool("CREW_BATCH_PACK")
+
+    @property
+    def crew_batch_pack_size(self) -> int:
+        return _env_int("CREW_BATCH_PACK_SIZE", 8)
+
+    @property
+    def crew_batch_pack_max_chars(self) -> int:
+        return _env_int("CREW_BATCH_PACK_MAX_CHARS", 800)
+
+    @property
+    def crew_reply_stop(self) -> list[str]:
+        value = os.getenv("CREW_REPLY_STOP", "")
+        # "\n" in the env value stands for a newline
+        return [part.replace("\\n", "\n") for part in value.split("|") if part]
+
+    @property
+    def crew_reply_max_chars(self) -> int:
+        return _env_int("CREW_REPLY_MAX_CHARS", 2000)
+
+    @property
+    def crew_dedup_enabled(self) -> bool:
+        return _env_bool("CREW_DEDUP_ENABLED", True)
+
+    @property
+    def crew_dedup_window(self) -> float:
+        return _env_float("CREW_DEDUP_WINDOW", 3600.0)
+
+    @property
+    def crew_dedup_max_distance(self) -> int:
+        return _env_int("CREW_DEDUP_MAX_DISTANCE", 3)
+
+    @property
+    def crew_dedup_max_entries(self) -> int:
+        return _env_int("CREW_DEDUP_MAX_ENTRIES", 5000)
+
+    @property
+    def crew_dedup_regenerate(self) -> bool:
+        return _env_bool("CREW_DEDUP_REGENERATE", True)
+
+    @property
+    def crew_preprocess(self) -> bool:
+        return _env_bool("CREW_PREPROCESS", True)
+
+    @property
+    def crew_body_token_budget(self) -> int:
+        return _env_int("CREW_BODY_TOKEN_BUDGET", 1024)
+
+    @property
+    def email_idle_enabled(self) -> bool:
+        return _env_bool("EMAIL_IDLE_ENABLED", True)
+
+    @property
+    def email_idle_timeout(self) -> float:
+        # Servers may drop IDLE after 30 minutes of inactivity (RFC 2177)
+        return _env_float("EMAIL_IDLE_TIMEOUT", 1500.0)
+
+    @property
+    def email_poll_interval(self) -> float:
+        return _env_float("EMAIL_POLL_INTERVAL", 60.0)
+
+    @property
+    def email_poll_min(self) -> float:
+        return _env_float("EMAIL_POLL_MIN", 5.0)
+
+    @property
+    def email_poll_max(self) -> float:
+        return _env_float("EMAIL_POLL_MAX", 120.0)
+
+    @property
+    def email_sync_max_attempts(self) -> int:
+        return max(1, _env_int("EMAIL_SYNC_MAX_ATTEMPTS", 3))
+
+    @property
+    def monitor_triage_workers(self) -> int:
+        return max(1, _env_int("MONITOR_TRIAGE_WORKERS", 4))
+
+    @property
+    def monitor_action_workers(self) -> int:
+        return max(1, _env_int("MONITOR_ACTION_WORKERS", 2))
+
+    @property
+    def monitor_queue_size(self) -> int:
+        return max(1, _env_int("MONITOR_QUEUE_SIZE", 32))
+
+    @property
+    def monitor_processes(self) -> int:
+        return max(0, _env_int("MONITOR_PROCESSES", 0))
+
+    @property
+    def monitor_refresh_interval(self) -> float:
+        return _env_float("MONITOR_REFRESH_INTERVAL", 60.0)
+
+    @property
+    def tenant_max_concurrency(self) -> int:
+        return max(1, _env_int("TENANT_MAX_CONCURRENCY", 4))
+
+    @property
+    def tenant_emails_per_minute(self) -> int:
+        return max(0, _env_int("TENANT_EMAILS_PER_MINUTE", 0))
+
+    @property
+    def webhook_async(self) -> bool:
+        return _env_bool("WEBHOOK_ASYNC")
+
+    @property
+    def rate_limit_tenant_per_minute(self) -> float:
+        return _env_float("RATE_LIMIT_TENANT_PER_MINUTE", 0.0)
+
+    @property
+    def rate_limit_tenant_burst(self) -> float:
+        return _env_float("RATE_LIMIT_TENANT_BURST", 0.0)
+
+    @property
+    def rate_limit_sender_per_minute(self) -> float:
+        return _env_float("RATE_LIMIT_SENDER_PER_MINUTE", 30.0)
+
+    @property
+    def rate_limit_sender_burst(self) -> float:
+        return _env_float("RATE_LIMIT_SENDER_BURST", 0.0)
+
+    @property
+    def rate_limit_sqlite_path(self) -> str:
+        return os.getenv("RATE_LIMIT_SQLITE_PATH", "")
+
+    @property
+    def webhook_max_in_flight(self) -> int:
+        return max(0, _env_int("WEBHOOK_MAX_IN_FLIGHT", 32))
+
+    @property
+    def job_workers(self) -> int:
+        return max(1, _env_int("JOB_WORKERS", 2))
+
+    @property
+    def job_visibility_timeout(self) -> float:
+        return _env_float("JOB_VISIBILITY_TIMEOUT", 300.0)
+
+    @property
+    def job_max_attempts(self) -> int:
+        return max(1, _env_int("JOB_MAX_ATTEMPTS", 3))
+
+    @property
+    def job_retry_backoff(self) -> float:
+        return _env_float("JOB_RETRY_BACKOFF", 30.0)
+
+    @property
+    def job_poll_interval(self) -> float:
+        return _env_float("JOB_POLL_INTERVAL", 1.0)
+
+    @property
+    def email_log_enabled(self) -> bool:
+        return _env_bool("EMAIL_LOG_ENABLED", True)
+
+    @property
+    def email_log_batch_size(self) -> int:
+        return max(1, _env_int("EMAIL_LOG_BATCH_SIZE", 200))
+
+    @property
+    def email_log_flush_interval(self) -> float:
+        return _env_float("EMAIL_LOG_FLUSH_INTERVAL", 1.0)
+
+    @property
+    def email_log_buffer_size(self) -> int:
+        return max(1, _env_int("EMAIL_LOG_BUFFER_SIZE", 10000))
+
+    @property
+    def rollup_minute_retention_hours(self) -> int:
+        return max(1, _env_int("ROLLUP_MINUTE_RETENTION_HOURS", 48))
+
+    @property
+    def rollup_hour_retention_days(self) -> int:
+        return max(2, _env_int("ROLLUP_HOUR_RETENTION_DAYS", 90))
+
+    @property
+    def rollup_compact_interval(self) -> float:
+        return _env_float("ROLLUP_COMPACT_INTERVAL", 60.0)
+
+    @property
+    def metrics_dir(self) -> str:
+        return os.getenv("METRICS_DIR", "").strip()
+
+    @property
+    def metrics_flush_interval(self) -> float:
+        return _env_float("METRICS_FLUSH_INTERVAL", 5.0)
+
+    @property
+    def log_level(self) -> str:
+        return os.getenv("LOG_LEVEL", "INFO").strip().upper()
+
+    @property
+    def log_format(self) -> str:
+        # "text" or "json" (one JSON object per line)
+        return os.getenv("LOG_FORMAT", "text").strip().lower()
+
+    @property
+    def log_queue_enabled(self) -> bool:
+        return _env_bool("LOG_QUEUE_ENABLED", False)
+
+    @property
+    def log_queue_size(self) -> int:
+        return max(1, _env_int("LOG_QUEUE_SIZE", 10000))
+
+    @property
+    def log_debug_sample_rate(self) -> float:
+        return min(1.0, max(0.0, _env_float("LOG_DEBUG_SAMPLE_RATE", 1.0)))
+
+    @property
+    def smtp_pool_size(self) -> int:
+        return max(1, _env_int("SMTP_POOL_SIZE", 2))
+
+    @property
+    def smtp_starttls(self) -> bool:
+        return _env_bool("SMTP_STARTTLS", True)
+
+    @property
+    def smtp_max_idle(self) -> float:
+        return _env_float("SMTP_MAX_IDLE", 60.0)
+
+    @property
+    def smtp_max_messages(self) -> int:
+        return _env_int("SMTP_MAX_MESSAGES", 100)
+
+    @property
+    def smtp_send_workers(self) -> int:
+        return max(1, _env_int("SMTP_SEND_WORKERS", 2))
+
+    @property
+    def smtp_queue_size(self) -> int:
+        return max(1, _env_int("SMTP_QUEUE_SIZE", 1000))
+
+    @property
+    def smtp_send_retries(self) -> int:
+        return max(0, _env_int("SMTP_SEND_RETRIES", 3))
+
     @property
     def database_url(self) -> str:
         return os.getenv("DATABASE_URL", "sqlite:///./emailcleaner.db")
@@ -1,37 +1,185 @@
-﻿import logging
+﻿"""
+Logging setup: console and rotating file handlers on the root logger.
 
+With LOG_QUEUE_ENABLED=true the root logger only gets a queue handler and
+a ``QueueListener`` thread formats records and writes them out, so a log
+call on a request or worker thread costs a record copy and a queue put.
+The queue holds LOG_QUEUE_SIZE records; when it is full, records are
+dropped (and counted) rather than blocking the caller.
 
-def setup_logging(level: str = "INFO") -> None:
-    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(message)s")
-import os
+LOG_FORMAT=json writes one compact JSON object per line. Fields bound
+with ``log_context`` (email id, tenant, stage) are added to every record
+logged inside it: as JSON keys, and as ``record.log_context`` for other
+handlers. LOG_DEBUG_SAMPLE_RATE keeps that fraction of DEBUG records.
+"""
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Iterator
+
+from app.utils.config import settings
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_context: ContextVar[dict] = ContextVar("log_context", default={})
+_listener: QueueListener | None = None
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Add ``fields`` (None values skipped) to the records logged in this block"""
+    token = _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_log_context() -> dict:
+    """The fields bound here, e.g. to carry them to another thread"""
+    return _context.get()
+
+
+class ContextFilter(logging.Filter):
+    """Attach the bound ``log_context`` fields to the record (on the logging thread)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "log_context"):  # set before the queue already
+            record.log_context = _context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep ``rate`` of the DEBUG records; other levels always pass"""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if not hasattr(record, "sampled"):  # one decision for all handlers
+            record.sampled = random.random() < self.rate
+        return record.sampled
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, the bound fields, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **getattr(record, "log_context", {}),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without blocking. Only the
+    message is merged here; formatting happens on the listener.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Arguments may change after the call returns; tracebacks pin frames
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
 
 def setup_logging():
     """Configure logging for the application"""
-    log_level = os.getenv("LOG_LEVEL", "INFO").upper()
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return  # configured already (e.g. by the test runner)
+
     # Create logs directory
     os.makedirs("logs", exist_ok=True)
-    
-    # Configure root logger
-    logging.basicConfig(
-        level=getattr(logging, log_level, logging.INFO),
-        format=log_format,
-        handlers=[
-            # Console handler
-            logging.StreamHandler(),
-            # File handler with rotation
-            RotatingFileHandler(
-                "logs/email_cleaner.log",
-                maxBytes=10*1024*1024,  # 10MB
-                backupCount=5
-            )
-        ]
-    )
-    
+
+    formatter = JsonFormatter() if settings.log_format == "json" else logging.Formatter(LOG_FORMAT)
+    handlers = [
+        # Console handler
+        logging.StreamHandler(),
+        # File handler with rotation
+        RotatingFileHandler(
+            "logs/email_cleaner.log",
+            maxBytes=10*1024*1024,  # 10MB
+            backupCount=5
+        ),
+    ]
+    sampler = SamplingFilter(settings.log_debug_sample_rate)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(ContextFilter())
+        handler.addFilter(sampler)
+
+    if settings.log_queue_enabled:
+        # Records that pass here pass the handlers' filters on the listener as-is
+        queue_handler = LogQueueHandler(settings.log_queue_size)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(sampler)
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        handlers = [queue_handler]
+
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(getattr(logging, settings.log_level, logging.INFO))
+
     # Set specific loggers
     logging.getLogger("uvicorn").setLevel(logging.WARNING)
     logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def stop_logging() -> None:
+    """Write the queued records and stop the listener thread (LOG_QUEUE_ENABLED)"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    listener.stop()
+    # Records logged from here on are written directly
+    root = logging.getLogger()
+    dropped = 0
+    for handler in list(root.handlers):
+        if isinstance(handler, LogQueueHandler):
+            root.removeHandler(handler)
+            dropped += handler.dropped
+    for handler in listener.handlers:
+        root.addHandler(handler)
+    if dropped:
+        logging.getLogger(__name__).warning("Dropped %s log record(s): the log queue was full", dropped)
@@ -1,5 +1,7 @@
 ﻿import os
+from datetime import datetime, timedelta
 
+import pandas as pd
 import requests
 import streamlit as st
 
@@ -14,6 +16,15 @@ def _coerce_int(value: object) -> int:
         return 0
 
 
+# Range label -> (length, bucket)
+RANGES = {
+    "Last hour": (timedelta(hours=1), "minute"),
+    "Last 24 hours": (timedelta(days=1), "hour"),
+    "Last 7 days": (timedelta(days=7), "hour"),
+    "Last 30 days": (timedelta(days=30), "hour"),
+}
+
+
 @st.cache_data(ttl=5)
 def load_stats() -> tuple[dict, str | None]:
     try:
@@ -42,6 +53,31 @@ def load_stats() -> tuple[dict, str | None]:
     )
 
 
+@st.cache_data(ttl=30)
+def load_series(range_label: str, group_by: str) -> tuple[list[dict], str | None]:
+    length, bucket = RANGES[range_label]
+    end = datetime.utcnow()
+    params = {
+        "from": (end - length).isoformat(),
+        "to": end.isoformat(),
+        "bucket": bucket,
+        "group_by": group_by,
+    }
+    try:
+        response = requests.get(STATS_URL, params=params, timeout=5)
+        response.raise_for_status()
+        return response.json().get("series", []), None
+    except requests.RequestException as e:
+        return [], f"Cannot load the {range_label.lower()} series: {e}"
+
+
+def _pivot(series: list[dict], column: str, value: str, aggfunc: str = "sum") -> pd.DataFrame:
+    frame = pd.DataFrame(series)
+    frame["bucket_start"] = pd.to_datetime(frame["bucket_start"])
+    frame[column] = frame[column].fillna("none")
+    return frame.pivot_table(index="bucket_start", columns=column, values=value, aggfunc=aggfunc)
+
+
 st.set_page_config(page_title="EmailCleaner Pro", layout="wide")
 st.title("EmailCleaner Pro Dashboard")
 
@@ -55,6 +91,32 @@ col_auto.metric("Auto Replies", stats["auto_replies"])
 col_tagged.metric("Tagged", stats["tagged"])
 col_escalations.metric("Escalations", stats["escalations"])
 
+st.subheader("Activity")
+range_label = st.selectbox("Range", list(RANGES), index=1)
+
+by_action, series_error = load_series(range_label, "action")
+if series_error:
+    st.warning(series_error)
+elif not by_action:
+    st.info("No emails processed in this range.")
+else:
+    st.caption("Emails by action")
+    st.area_chart(_pivot(by_action, "action", "emails").fillna(0))
+
+    col_errors, col_latency = st.columns(2)
+    frame = pd.DataFrame(by_action)
+    frame["bucket_start"] = pd.to_datetime(frame["bucket_start"])
+    col_errors.caption("Errors")
+    col_errors.bar_chart(frame.groupby("bucket_start")["errors"].sum())
+    col_latency.caption("Average triage latency (ms)")
+    col_latency.line_chart(_pivot(by_action, "action", "avg_triage_ms", "mean"))
+
+    by_intent, _ = load_series(range_label, "intent")
+    if by_intent:
+        st.caption("Emails by intent")
+        intents = pd.DataFrame(by_intent).fillna({"intent": "none"}).groupby("intent")["emails"].sum()
+        st.bar_chart(intents.sort_values(ascending=False).head(15))
+
 if st.button("Refresh"):
     st.cache_data.clear()
     st.rerun()
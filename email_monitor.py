@@ -1,94 +1,371 @@
 ﻿"""
 Email Monitor - Automatically checks inbox and processes emails.
 """
+import imaplib
 import logging
-import time
+import math
+import signal
+import threading
+from concurrent.futures import wait
+from functools import lru_cache, partial
 
 from dotenv import load_dotenv
 
-from app.crew.crew import build_crew
+# Before the app imports: the database engine reads DATABASE_URL on import
+load_dotenv()
+
+from app.crew.crew import SimpleCrew, build_crew
+from app.db.crud import list_mailboxes, list_tenants
+from app.db.models import Mailbox, Tenant
+from app.db.session import SessionLocal, init_db
+from app.schemas.email_schema import EmailInbound
+from app.services.email_log import close_email_log_writer, record_email
 from app.services.email_service import EmailService
+from app.services.imap_fetch import chunked
+from app.services.metrics import registry as metrics_registry
 from app.services.escalation_service import EscalationService
+from app.services.imap_watcher import ImapWatcher
+from app.services.loop_guard import auto_generated_reason
+from app.services.mailbox_sync import MailboxSync
+from app.services.pipeline import EmailPipeline
+from app.services.supervisor import TenantGate, WorkerSupervisor, rendezvous_owner
 from app.services.tagging_service import TaggingService
-from app.utils.logger import setup_logging
+from app.utils.config import settings
+from app.utils.logger import log_context, setup_logging, stop_logging
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-load_dotenv()
 
+@lru_cache(maxsize=None)
+def monitor_crew() -> SimpleCrew:
+    """One crew per process; its prompts are loaded once."""
+    return build_crew()
+
+
+def triage_email(crew: SimpleCrew, tenant_id: int | None, email: EmailInbound) -> dict:
+    """Run the crew on one email; near-duplicate reuse stays within the tenant."""
+    return crew.kickoff({"subject": email.subject, "body": email.body, "tenant_id": tenant_id})
+
+
+def build_pipeline() -> EmailPipeline:
+    """Triage (LLM) and action stages, each with its own worker pool."""
+    return EmailPipeline(
+        triage=partial(triage_email, monitor_crew(), None),
+        triage_workers=settings.monitor_triage_workers,
+        action_workers=settings.monitor_action_workers,
+        queue_size=settings.monitor_queue_size,
+    )
 
-def process_unread_emails() -> None:
-    """Fetch and process unread emails."""
-    logger.info("Checking for unread emails...")
 
-    email_service = EmailService()
-    unread_emails = email_service.fetch_unread()
+def process_unread_emails(
+    mail: imaplib.IMAP4 | None = None,
+    pipeline: EmailPipeline | None = None,
+    email_service: EmailService | None = None,
+    gate: TenantGate | None = None,
+    stop: threading.Event | None = None,
+) -> None:
+    """
+    Fetch new emails of one mailbox (over ``mail`` when given) and run them
+    through ``pipeline``, admitting each through the tenant's ``gate``.
+    """
+    email_service = email_service or EmailService()
+    logger.info("Checking for unread emails in %s/%s...", email_service.email_user, email_service.imap_folder)
 
-    if not unread_emails:
-        logger.info("No unread emails found")
+    if not email_service.email_user or not email_service.email_password:
+        logger.error("Cannot fetch emails - credentials not configured")
         return
 
-    logger.info("Found %s unread email(s)", len(unread_emails))
+    own_pipeline = pipeline is None
+    if own_pipeline:
+        pipeline = build_pipeline()
+    act = partial(handle_email, email_service)
+    triage = partial(triage_email, monitor_crew(), email_service.tenant_id)
+
+    try:
+        with email_service.imap_session(mail) as conn:
+            sync = MailboxSync(email_service.email_user, mailbox=email_service.imap_folder)
+            uids = sync.pending(conn)
+
+            # Fetch chunk by chunk so triage starts while later chunks download;
+            # submit() blocks while the pipeline is full
+            queued = []
+            stopping = False
+            for chunk in chunked(uids, email_service.fetch_chunk):
+                for email in sync.filter_new(email_service.fetch_messages(conn, chunk)):
+                    if gate is not None and not gate.acquire(stop):
+                        stopping = True
+                        break
+                    on_done = partial(record_outcome, sync, email, tenant_id=email_service.tenant_id)
+                    with log_context(tenant_id=email_service.tenant_id):
+                        future = pipeline.submit(email, on_done=on_done, act=act, triage=triage)
+                    if gate is not None:
+                        future.add_done_callback(lambda _: gate.release())
+                    queued.append((email, future))
+                if stopping:
+                    break
+
+            if not queued:
+                logger.info("No new emails found")
+                if not stopping:
+                    sync.checkpoint()
+                return
+
+            logger.info("Queued %s new email(s)", len(queued))
+            wait([future for _, future in queued])
+
+            handled = []
+            for email, future in queued:
+                if future.exception() is not None:
+                    # Triage failed: retried next cycle, up to EMAIL_SYNC_MAX_ATTEMPTS times
+                    sync.record(email, None)
+                    record_email(email, None, email_service.tenant_id, "monitor", error=str(future.exception()))
+                elif future.result()[1] and email.uid is not None:
+                    handled.append(email.uid)
+            email_service.mark_seen(conn, handled)
+            # Stopping: keep the checkpoint so the emails not submitted are
+            # fetched next run (the handled ones are skipped by Message-ID)
+            if not stopping:
+                sync.checkpoint()
+
+    except (imaplib.IMAP4.abort, OSError):
+        if mail is not None:
+            raise  # the watcher reconnects
+        logger.exception("IMAP connection failed")
 
-    for email in unread_emails:
-        try:
-            logger.info("Processing email: %s", email.subject)
+    finally:
+        if own_pipeline:
+            pipeline.close()
 
-            crew = build_crew()
-            result = crew.kickoff(inputs={
-                "subject": email.subject,
-                "body": email.body,
-            })
 
-            action = result.get("action")
-            logger.info("Action decided: %s", action)
+def record_outcome(
+    sync: MailboxSync, email: EmailInbound, result: dict, handled: bool, tenant_id: int | None = None
+) -> None:
+    """Persist an email's outcome as soon as its action ran."""
+    sync.record(email, (result.get("action") or "UNKNOWN") if handled else None)
+    record_email(email, result, tenant_id, "monitor")
 
-            if action == "AUTO_REPLY":
-                reply = result.get("reply", "")
-                if reply:
-                    email_service.send_reply(email, reply)
+
+def handle_email(email_service: EmailService, email: EmailInbound, result: dict) -> bool:
+    """Carry out the crew's decision; returns whether the email was handled."""
+    try:
+        logger.info("Processing email: %s", email.subject)
+
+        if result.get("error"):
+            logger.warning("Crew reported error for %s: %s", email.subject, result["error"])
+
+        action = result.get("action")
+        logger.info("Action decided: %s", action)
+
+        loop_reason = auto_generated_reason(email) if action == "AUTO_REPLY" else None
+        if loop_reason:
+            # Answering an auto-responder starts a mail loop
+            logger.info("Suppressed auto-reply to auto-generated mail (%s): %s", loop_reason, email.subject)
+
+        elif action == "AUTO_REPLY":
+            reply = result.get("reply", "")
+            if reply:
+                # Wait for SMTP: a failed send leaves the email unseen and
+                # pending, so the next cycle retries it
+                if email_service.send_reply(email, reply, wait=True) is not None:
                     logger.info("Sent auto-reply for: %s", email.subject)
-                else:
-                    logger.warning("Auto-reply action but no reply generated")
+            else:
+                logger.warning("Auto-reply action but no reply generated")
 
-            elif action == "TAG_ARCHIVE":
-                tags = result.get("tags", [])
-                TaggingService().tag_and_archive(email, tags)
-                logger.info("Tagged email with: %s", tags)
+        elif action == "TAG_ARCHIVE":
+            tags = result.get("tags", [])
+            TaggingService().tag_and_archive(email, tags)
+            logger.info("Tagged email with: %s", tags)
 
-            elif action == "ESCALATE":
-                summary = result.get("summary", "No summary available")
-                EscalationService().notify_human(email, summary)
-                logger.info("Escalated email: %s", email.subject)
+        elif action == "ESCALATE":
+            summary = result.get("summary", "No summary available")
+            EscalationService().notify_human(email, summary)
+            logger.info("Escalated email: %s", email.subject)
+
+        else:
+            logger.warning("Unknown action: %s", action)
+
+        logger.info("Completed processing: %s", email.subject)
+        return True
+
+    except Exception as exc:
+        logger.error("Error processing email: %s", exc)
+        result["action_error"] = str(exc)
+        return False
+
+
+def watch_inbox(
+    pipeline: EmailPipeline,
+    stop: threading.Event,
+    email_service: EmailService | None = None,
+    gate: TenantGate | None = None,
+) -> None:
+    """Process mail as soon as the server reports it (IMAP IDLE)."""
+    email_service = email_service or EmailService()
+    if not email_service.email_user or not email_service.email_password:
+        logger.error("Cannot watch inbox - credentials not configured")
+        return
 
+    logger.info("Waiting for new mail in %s/%s (IMAP IDLE, polling fallback)",
+                email_service.email_user, email_service.imap_folder)
+    ImapWatcher(email_service.connect_imap, mailbox=email_service.imap_folder).run(
+        lambda mail: process_unread_emails(mail, pipeline, email_service, gate, stop), stop
+    )
+
+
+def poll_inbox(pipeline: EmailPipeline, stop: threading.Event) -> None:
+    """Fixed-interval polling with a fresh connection per cycle."""
+    check_interval = settings.email_poll_interval
+    logger.info("Checking inbox every %s seconds", check_interval)
+
+    while not stop.is_set():
+        process_unread_emails(pipeline=pipeline)
+        logger.info("Waiting %s seconds...", check_interval)
+        logger.info("=" * 50)
+        stop.wait(check_interval)
+
+
+def tenant_gate(tenant: Tenant | None, shares: int = 1) -> TenantGate:
+    """
+    Admission limits of a tenant, falling back to the TENANT_* defaults.
+    A tenant whose mailboxes are spread over ``shares`` worker processes
+    gets an even share of its limits in each of them.
+    """
+    max_concurrency = tenant.max_concurrency if tenant is not None else None
+    per_minute = tenant.llm_emails_per_minute if tenant is not None else None
+    if max_concurrency is None:
+        max_concurrency = settings.tenant_max_concurrency
+    if per_minute is None:
+        per_minute = settings.tenant_emails_per_minute
+    return TenantGate(math.ceil(max_concurrency / shares), math.ceil(per_minute / shares))
+
+
+def owned_mailboxes(index: int, count: int) -> tuple[list[Mailbox], dict[int, Tenant], dict[int, int]]:
+    """
+    Enabled mailboxes that worker ``index`` of ``count`` owns, the tenants,
+    and over how many workers each tenant's mailboxes are spread.
+    """
+    db = SessionLocal()
+    try:
+        tenants = {tenant.id: tenant for tenant in list_tenants(db)}
+        owners: dict[int, set[int]] = {}
+        mailboxes = []
+        for mailbox in list_mailboxes(db):
+            owner = rendezvous_owner(str(mailbox.id), count)
+            owners.setdefault(mailbox.tenant_id, set()).add(owner)
+            if owner == index:
+                mailboxes.append(mailbox)
+        return mailboxes, tenants, {tenant_id: len(workers) for tenant_id, workers in owners.items()}
+    finally:
+        db.close()
+
+
+class _MailboxRunner:
+    """One watcher thread for one mailbox, with its own stop event."""
+
+    def __init__(self, mailbox: Mailbox, pipeline: EmailPipeline, gate: TenantGate) -> None:
+        self.updated_at = mailbox.updated_at
+        self.gate = gate
+        self.stop = threading.Event()
+        self.thread = threading.Thread(
+            target=watch_inbox,
+            args=(pipeline, self.stop, EmailService(mailbox), gate),
+            name=f"mailbox-{mailbox.id}",
+        )
+        self.thread.start()
+
+
+def run_mailbox_worker(index: int, count: int, stop) -> None:
+    """
+    Worker process entry point: watch every mailbox this worker owns,
+    sharing one pipeline, until the supervisor sets ``stop``.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor coordinates shutdown
+    logger.info("Mailbox worker %s/%s started", index, count)
+
+    pipeline = build_pipeline()
+    runners: dict[int, _MailboxRunner] = {}
+    gates: dict[int, tuple[tuple, TenantGate]] = {}
+    try:
+        while not stop.is_set():
+            try:
+                mailboxes, tenants, shares = owned_mailboxes(index, count)
+            except Exception:
+                logger.exception("Could not load mailboxes")
             else:
-                logger.warning("Unknown action: %s", action)
+                # One gate per tenant, shared by its mailboxes here; replaced when its
+                # limits or the number of workers sharing them change
+                for tenant_id in {mailbox.tenant_id for mailbox in mailboxes}:
+                    tenant = tenants.get(tenant_id)
+                    limits = (tenant.max_concurrency, tenant.llm_emails_per_minute) if tenant else ()
+                    limits += (shares[tenant_id],)
+                    if tenant_id not in gates or gates[tenant_id][0] != limits:
+                        gates[tenant_id] = (limits, tenant_gate(tenant, shares[tenant_id]))
+
+                # Stop removed or reconfigured mailboxes, then start the missing ones
+                wanted = {mailbox.id: mailbox for mailbox in mailboxes}
+                for mailbox_id, runner in list(runners.items()):
+                    mailbox = wanted.get(mailbox_id)
+                    if (
+                        mailbox is None
+                        or mailbox.updated_at != runner.updated_at
+                        or gates[mailbox.tenant_id][1] is not runner.gate
+                    ):
+                        runner.stop.set()
+                        runner.thread.join()
+                        del runners[mailbox_id]
+                for mailbox_id, mailbox in wanted.items():
+                    if mailbox_id not in runners:
+                        runners[mailbox_id] = _MailboxRunner(mailbox, pipeline, gates[mailbox.tenant_id][1])
+                logger.info("Mailbox worker %s watching %s mailbox(es)", index, len(runners))
 
-            logger.info("Completed processing: %s", email.subject)
+            stop.wait(settings.monitor_refresh_interval)
 
-        except Exception as exc:
-            logger.error("Error processing email: %s", exc)
-            continue
+    finally:
+        for runner in runners.values():
+            runner.stop.set()
+        for runner in runners.values():
+            runner.thread.join()
+        pipeline.close()
+        close_email_log_writer()
+        metrics_registry.close()
+        logger.info("Mailbox worker %s stopped", index)
+        stop_logging()
 
 
 def main() -> None:
     """Main monitoring loop."""
     logger.info("Email Monitor Started")
     logger.info("=" * 50)
-
-    check_interval = 60
-    logger.info("Checking inbox every %s seconds", check_interval)
     logger.info("Press Ctrl+C to stop")
 
+    init_db()
+
+    # Finish the current cycle and drain the pipeline on Ctrl+C / SIGTERM
+    stop = threading.Event()
+
+    def request_stop(signum, frame) -> None:
+        logger.info("Stopping after the current cycle...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    if settings.monitor_processes > 0:
+        logger.info("Watching the mailboxes table with %s worker process(es)", settings.monitor_processes)
+        WorkerSupervisor(run_mailbox_worker, settings.monitor_processes, name="mailbox-worker").run(stop)
+        logger.info("Email Monitor Stopped")
+        return
+
+    pipeline = build_pipeline()
     try:
-        while True:
-            process_unread_emails()
-            logger.info("Waiting %s seconds...", check_interval)
-            logger.info("=" * 50)
-            time.sleep(check_interval)
+        if settings.email_idle_enabled:
+            watch_inbox(pipeline, stop)
+        else:
+            poll_inbox(pipeline, stop)
 
-    except KeyboardInterrupt:
+    finally:
+        pipeline.close()
         logger.info("Email Monitor Stopped")
         logger.info("Goodbye!")
 
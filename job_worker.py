@@ -0,0 +1,104 @@
+"""
+Job Worker - Processes emails queued by the webhook (POST /api/email/jobs).
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# Before the app imports: the database engine reads DATABASE_URL on import
+load_dotenv()
+
+from app.crew.crew import SimpleCrew, build_crew
+from app.db.session import init_db
+from app.schemas.email_schema import EmailInbound
+from app.services.actions import execute_action
+from app.services.email_log import close_email_log_writer, elapsed_ms, record_email
+from app.services.job_queue import JobQueue
+from app.services.metrics import registry as metrics_registry
+from app.services.supervisor import WorkerSupervisor
+from app.utils.config import settings
+from app.utils.logger import log_context, setup_logging, stop_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def run_job_worker(index: int, count: int, stop) -> None:
+    """Worker process entry point: lease and process jobs until ``stop`` is set."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor coordinates shutdown
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Job worker %s/%s started as %s", index, count, worker_id)
+
+    queue = JobQueue()
+    crew = build_crew()
+    while not stop.is_set():
+        try:
+            claimed = queue.claim(worker_id)
+        except Exception:
+            logger.exception("Could not claim a job")
+            claimed = None
+        if claimed is None:
+            stop.wait(settings.job_poll_interval)
+            continue
+
+        job_id, email, tenant_id = claimed
+        with log_context(job_id=job_id, email_id=email.message_id, tenant_id=tenant_id):
+            process_job(queue, worker_id, crew, job_id, email, tenant_id)
+
+    close_email_log_writer()
+    # Spawned workers skip atexit; write the last metrics snapshot here
+    metrics_registry.close()
+    logger.info("Job worker %s stopped", index)
+    stop_logging()
+
+
+def process_job(
+    queue: JobQueue, worker_id: str, crew: SimpleCrew, job_id: int, email: EmailInbound, tenant_id: int | None
+) -> None:
+    """Run the crew and the action for one leased job and record the outcome"""
+    logger.info("Processing job %s: %s", job_id, email.subject)
+    started = time.perf_counter()
+    try:
+        with log_context(stage="triage"):
+            result = crew.kickoff({"subject": email.subject, "body": email.body, "tenant_id": tenant_id})
+    except Exception as exc:
+        # Every failed attempt gets its row; the job itself may be retried
+        record_email(email, None, tenant_id, "job", error=str(exc))
+        queue.fail(job_id, worker_id, str(exc))
+        return
+    stage_ms = {"triage": elapsed_ms(started)}
+    # Action failures are reported in the result, never retried: the
+    # reply may already have gone out
+    started = time.perf_counter()
+    with log_context(stage="action"):
+        execute_action(email, result)
+    stage_ms["action"] = elapsed_ms(started)
+    result["stage_ms"] = stage_ms
+    record_email(email, result, tenant_id, "job")
+    queue.complete(job_id, worker_id, result)
+
+
+def main() -> None:
+    logger.info("Job Worker Started with %s process(es)", settings.job_workers)
+    init_db()
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame) -> None:
+        logger.info("Stopping after the current jobs...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    WorkerSupervisor(run_job_worker, settings.job_workers, name="job-worker").run(stop)
+    logger.info("Job Worker Stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Backfill historical mail into EmailLog.
+
+Streams an mbox file, a maildir or a directory of .eml files, parses and
+triages the messages in a process pool (each worker runs its own crew),
+and writes the results to EmailLog one batch per transaction. After every
+committed batch the position in the source is saved to a checkpoint file,
+so an interrupted run resumes where it stopped (at most the batch in
+flight when it crashed is logged twice).
+
+Dry run is the default: the crew decides, the decision is logged, and no
+reply, tag or escalation is carried out. ``--execute`` performs the
+actions, which sends mail:
+
+    python -m scripts.backfill archive.mbox --tenant-id 3
+    python -m scripts.backfill ~/Maildir --tenant-id 3 --workers 8 --execute
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import insert
+
+from app.db.models import EmailLog
+from app.db.session import SessionLocal, init_db
+from app.services.mime_parser import MAX_BODY_BYTES, MAX_MESSAGE_BYTES, parse_message
+from app.services.stats_rollup import add_email_logs, compact_rollups
+
+CHECKPOINT_DIR = Path("data/backfill")
+
+_crew = None
+
+
+def iter_mbox(path: Path, start: int = 0, max_bytes: int = MAX_MESSAGE_BYTES) -> Iterator[tuple[int, bytes]]:
+    """
+    ``(end_offset, raw)`` per message, reading the file line by line from
+    byte ``start``; at most ``max_bytes`` of each message are kept.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        lines: list[bytes] = []
+        size = 0
+        in_message = False
+        for line in f:
+            if line.startswith(b"From "):
+                if in_message:
+                    yield position, b"".join(lines)
+                lines, size, in_message = [], 0, True
+            elif in_message and size < max_bytes:
+                lines.append(line[:max_bytes - size])
+                size += len(lines[-1])
+            position += len(line)
+        if in_message:
+            yield position, b"".join(lines)
+
+
+def iter_files(root: Path, after: str | None = None, max_bytes: int = MAX_MESSAGE_BYTES) -> Iterator[tuple[str, bytes]]:
+    """
+    ``(key, raw)`` per message file, in sorted key order, skipping keys up
+    to ``after``. Maildirs are read from cur/ and new/, other directories
+    for *.eml files.
+    """
+    if (root / "cur").is_dir() or (root / "new").is_dir():
+        paths = [p for sub in ("cur", "new") if (root / sub).is_dir() for p in (root / sub).iterdir()]
+    else:
+        paths = list(root.rglob("*.eml"))
+    for key in sorted(str(p.relative_to(root)) for p in paths if p.is_file()):
+        if after is not None and key <= after:
+            continue
+        with open(root / key, "rb") as f:
+            yield key, f.read(max_bytes)
+
+
+def batched(items: Iterator, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _init_worker() -> None:
+    global _crew
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl+C
+    from app.crew.crew import build_crew
+
+    _crew = build_crew()
+
+
+def process_batch(raws: list[bytes], execute: bool, max_body_bytes: int) -> list[dict]:
+    """Parse and triage one batch in a worker process; one row per message"""
+    emails = []
+    for raw in raws:
+        try:
+            emails.append(parse_message(raw, max_bytes=max_body_bytes).to_inbound())
+        except Exception as e:
+            emails.append(e)
+    parsed = [email for email in emails if not isinstance(email, Exception)]
+    results = iter(_crew.kickoff_batch([{"subject": e.subject, "body": e.body} for e in parsed]))
+
+    rows = []
+    for email in emails:
+        if isinstance(email, Exception):
+            rows.append({"error": f"parse failed: {email}"})
+            continue
+        result = next(results)
+        if execute and not result.get("error"):
+            from app.services.actions import execute_action
+
+            execute_action(email, result)
+        rows.append({
+            "subject": email.subject[:500],
+            "body": email.body,
+            "intent": (result.get("intent") or "")[:100] or None,
+            "action": result.get("action"),
+            "tags": ",".join(str(tag) for tag in result.get("tags") or [])[:500] or None,
+            "chars_trimmed": (result.get("preprocess") or {}).get("removed_chars"),
+            "error": result.get("error") or result.get("action_error"),
+        })
+    return rows
+
+
+class Progress:
+    def __init__(self, total_bytes: int | None, every: float) -> None:
+        self.total_bytes = total_bytes
+        self.every = every
+        self.started = self.last_report = time.monotonic()
+        self.done = self.last_done = 0
+        self.errors = 0
+        self.actions: Counter = Counter()
+
+    def add(self, rows: list[dict], position) -> None:
+        self.done += len(rows)
+        for row in rows:
+            if row.get("error"):
+                self.errors += 1
+            if row.get("action"):
+                self.actions[row["action"]] += 1
+        if time.monotonic() - self.last_report >= self.every:
+            self.report(position)
+
+    def report(self, position=None, final: bool = False) -> None:
+        now = time.monotonic()
+        overall = self.done / max(now - self.started, 1e-9)
+        recent = (self.done - self.last_done) / max(now - self.last_report, 1e-9)
+        parts = [f"{self.done} emails", f"{overall:.1f}/s overall"]
+        if not final:
+            parts.append(f"{recent:.1f}/s now")
+        if self.total_bytes and isinstance(position, int):
+            parts.append(f"{100 * position / self.total_bytes:.1f}% of input")
+        parts.append(f"errors {self.errors}")
+        parts.append(", ".join(f"{action} {count}" for action, count in self.actions.most_common()))
+        print(("Done: " if final else "") + " | ".join(parts), flush=True)
+        self.last_report, self.last_done = now, self.done
+
+
+def load_checkpoint(path: Path, source: Path) -> dict:
+    if not path.exists():
+        return {}
+    checkpoint = json.loads(path.read_text())
+    if checkpoint.get("source") != str(source):
+        raise SystemExit(f"Checkpoint {path} belongs to {checkpoint.get('source')}")
+    return checkpoint
+
+
+def save_checkpoint(path: Path, source: Path, position, processed: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({
+        "source": str(source),
+        "position": position,
+        "processed": processed,
+        "updated_at": datetime.utcnow().isoformat(),
+    }))
+    os.replace(tmp, path)  # atomic: a crash leaves the old or the new checkpoint
+
+
+def write_rows(tenant_id: int, rows: list[dict]) -> None:
+    records = [
+        {key: row[key] for key in ("subject", "body", "intent", "action", "tags", "chars_trimmed", "error")}
+        | {"tenant_id": tenant_id, "source": "backfill", "created_at": datetime.utcnow()}
+        for row in rows
+        if "subject" in row
+    ]
+    if not records:
+        return
+    with SessionLocal() as db:
+        db.execute(insert(EmailLog), records)
+        add_email_logs(db, records)
+        db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Triage an mbox, maildir or .eml directory into EmailLog")
+    parser.add_argument("source", type=Path, help="mbox file, maildir, or directory of .eml files")
+    parser.add_argument("--tenant-id", type=int, required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=50, help="Emails per worker task and DB write")
+    parser.add_argument("--checkpoint", type=Path, help="Default: data/backfill/<tenant>-<source hash>.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--limit", type=int, help="Stop after this many emails")
+    parser.add_argument("--max-bytes", type=int, default=MAX_BODY_BYTES, help="Body bytes decoded per email")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress lines")
+    parser.add_argument("--execute", action="store_true", help="Carry out the actions (sends replies!)")
+    args = parser.parse_args()
+
+    source = args.source.resolve()
+    digest = hashlib.sha1(str(source).encode()).hexdigest()[:12]
+    checkpoint_path = args.checkpoint or CHECKPOINT_DIR / f"{args.tenant_id}-{digest}.json"
+    checkpoint = {} if args.restart else load_checkpoint(checkpoint_path, source)
+    processed = checkpoint.get("processed", 0)
+
+    if source.is_file():
+        messages = iter_mbox(source, start=checkpoint.get("position", 0))
+        total_bytes = source.stat().st_size
+    elif source.is_dir():
+        messages = iter_files(source, after=checkpoint.get("position"))
+        total_bytes = None
+    else:
+        raise SystemExit(f"No such mbox or directory: {source}")
+    if args.limit:
+        messages = (item for _, item in zip(range(args.limit), messages))
+
+    if checkpoint:
+        print(f"Resuming after {processed} emails ({checkpoint_path})")
+    print("Mode: " + ("EXECUTE - actions are carried out" if args.execute else "dry run - no mail is sent"))
+    init_db()
+
+    progress = Progress(total_bytes, args.report_every)
+    # A bounded window of in-flight batches keeps memory flat; results are
+    # consumed in order so the checkpoint only ever moves forward
+    window: deque = deque()
+    executor = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker)
+    position = checkpoint.get("position")
+    try:
+        batches = batched(messages, args.batch_size)
+        exhausted = False
+        while not exhausted or window:
+            while not exhausted and len(window) < args.workers * 2:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                raws = [raw for _, raw in batch]
+                window.append((batch[-1][0], executor.submit(process_batch, raws, args.execute, args.max_bytes)))
+            if not window:
+                break
+            end, future = window.popleft()
+            rows = future.result()
+            write_rows(args.tenant_id, rows)
+            position = end
+            processed += len(rows)
+            save_checkpoint(checkpoint_path, source, position, processed)
+            progress.add(rows, position)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; rerun the same command to resume from {checkpoint_path}", file=sys.stderr)
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise SystemExit(130)
+    executor.shutdown()
+    compact_rollups()
+    progress.report(position, final=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark MIME parsing on a corpus of .eml files.
+
+Compares the bounded parser (app.services.mime_parser) with the naive
+approach of parsing the whole message and decoding every text part:
+
+    python scripts/bench_mime.py path/to/corpus --repeat 3
+"""
+from __future__ import annotations
+
+import argparse
+import email
+import time
+from pathlib import Path
+
+from app.services.mime_parser import MAX_BODY_BYTES, MAX_MESSAGE_BYTES, parse_message
+
+
+def naive(raw: bytes) -> str:
+    message = email.message_from_bytes(raw)
+    for part in message.walk():
+        if part.get_content_type() == "text/plain":
+            return part.get_payload(decode=True).decode(part.get_content_charset() or "utf-8", "replace")
+    return ""
+
+
+def bounded(raw: bytes, max_bytes: int, max_message_bytes: int) -> str:
+    parsed = parse_message(raw, max_bytes=max_bytes, max_message_bytes=max_message_bytes)
+    parsed.subject, parsed.from_address  # what the monitor reads per message
+    return parsed.body
+
+
+def run(name: str, parse, corpus: list[bytes], repeat: int) -> None:
+    total_bytes = sum(len(raw) for raw in corpus) * repeat
+    empty = failed = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for raw in corpus:
+            try:
+                if not parse(raw).strip():
+                    empty += 1
+            except Exception:
+                failed += 1
+    elapsed = time.perf_counter() - started
+    count = len(corpus) * repeat
+    print(
+        f"{name:8} {count / elapsed:10.0f} msg/s {total_bytes / elapsed / 1e6:8.1f} MB/s "
+        f"{elapsed * 1e6 / count:8.0f} us/msg  empty bodies: {empty // repeat}  errors: {failed // repeat}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark MIME parsing on .eml files")
+    parser.add_argument("corpus", type=Path, help="Directory searched recursively for *.eml")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-bytes", type=int, default=MAX_BODY_BYTES)
+    parser.add_argument("--max-message-bytes", type=int, default=MAX_MESSAGE_BYTES)
+    args = parser.parse_args()
+
+    corpus = [path.read_bytes() for path in sorted(args.corpus.rglob("*.eml"))]
+    if not corpus:
+        raise SystemExit(f"No .eml files under {args.corpus}")
+    print(f"{len(corpus)} messages, {sum(map(len, corpus)) / 1e6:.1f} MB, x{args.repeat}")
+
+    run("naive", naive, corpus, args.repeat)
+    run("bounded", lambda raw: bounded(raw, args.max_bytes, args.max_message_bytes), corpus, args.repeat)
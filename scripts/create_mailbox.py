@@ -0,0 +1,27 @@
+﻿from app.db.session import SessionLocal, init_db
+from app.db.crud import create_mailbox
+import argparse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Register a mailbox for email_monitor (MONITOR_PROCESSES>0)")
+    parser.add_argument("tenant_id", type=int)
+    parser.add_argument("username")
+    parser.add_argument("password", help='App password, or "env:NAME" to read it from the environment')
+    parser.add_argument("--imap-host", default="imap.gmail.com")
+    parser.add_argument("--smtp-host", default="smtp.gmail.com")
+    parser.add_argument("--folder", default="INBOX")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    mailbox = create_mailbox(
+        db,
+        args.tenant_id,
+        username=args.username,
+        password=args.password,
+        imap_host=args.imap_host,
+        smtp_host=args.smtp_host,
+        folder=args.folder,
+    )
+    print(f"Created mailbox {mailbox.id} for tenant {mailbox.tenant_id}")
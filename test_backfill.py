@@ -0,0 +1,42 @@
+"""
+Unit checks for the backfill readers (mbox offsets and maildir ordering).
+"""
+
+from __future__ import annotations
+
+from scripts.backfill import iter_files, iter_mbox
+
+MBOX = (
+    b"From a@example.com Mon Jan  1 00:00:00 2024\n"
+    b"Subject: one\n\nfirst body\n\n"
+    b"From b@example.com Mon Jan  1 00:00:01 2024\n"
+    b"Subject: two\n\n" + b"x" * 5000 + b"\n\n"
+    b"From c@example.com Mon Jan  1 00:00:02 2024\n"
+    b"Subject: three\n\n>From the archive\n"
+)
+
+
+def test_mbox_is_streamed_with_resumable_offsets(tmp_path) -> None:
+    path = tmp_path / "archive.mbox"
+    path.write_bytes(MBOX)
+
+    messages = list(iter_mbox(path, max_bytes=100))
+    assert [raw.split(b"\n")[0] for _, raw in messages] == [b"Subject: one", b"Subject: two", b"Subject: three"]
+    assert len(messages[1][1]) < 200  # capped, the rest of the message is skipped
+    assert messages[-1][0] == len(MBOX)
+
+    # Resuming from a checkpointed end offset yields the remaining messages
+    resumed = list(iter_mbox(path, start=messages[0][0]))
+    assert [end for end, _ in resumed] == [end for end, _ in messages[1:]]
+
+
+def test_maildir_in_key_order_after_checkpoint(tmp_path) -> None:
+    for sub, name in [("new", "3.host"), ("cur", "2.host:2,S"), ("cur", "1.host:2,S")]:
+        (tmp_path / sub).mkdir(exist_ok=True)
+        (tmp_path / sub / name).write_bytes(f"Subject: {name}\n\nbody\n".encode())
+    (tmp_path / "tmp").mkdir()
+    (tmp_path / "tmp" / "4.host").write_bytes(b"Subject: partial\n\n")
+
+    keys = [key for key, _ in iter_files(tmp_path)]
+    assert keys == ["cur/1.host:2,S", "cur/2.host:2,S", "new/3.host"]
+    assert [key for key, _ in iter_files(tmp_path, after=keys[0])] == keys[1:]
@@ -0,0 +1,209 @@
+"""
+Unit checks for the crew workflow.
+Uses a scripted LLM client, so no model server is needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.crew.crew import SimpleCrew, _parse_triage
+from app.crew.rules import RULES
+from app.services.dedup import NearDuplicateIndex
+from app.services.llm import LLMClient, LLMConnectionError
+
+
+@pytest.fixture(autouse=True)
+def _isolated_crew(monkeypatch) -> None:
+    # The shared near-duplicate index would leak results between tests
+    monkeypatch.setenv("CREW_DEDUP_ENABLED", "false")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+
+
+class ScriptedLLM(LLMClient):
+    """LLM client that answers from a list of canned responses"""
+
+    def __init__(self, responses: list[str | Exception]) -> None:
+        super().__init__(base_url="http://llm.invalid/v1")
+        self.responses = list(responses)
+        self.calls: list[dict] = []
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        self.calls.append({"prompt": prompt, **kwargs})
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        return self.generate(prompt, **kwargs)
+
+
+def test_two_step_kickoff() -> None:
+    llm = ScriptedLLM(["order_status", "AUTO_REPLY", "Your order ships today."])
+    result = SimpleCrew(llm, triage_mode=False, rules_fast_path=False).kickoff(
+        {"subject": "Where is my order?", "body": "Any tracking number?"}
+    )
+    assert result["intent"] == "order_status"
+    assert result["action"] == "AUTO_REPLY"
+    assert result["reply"] == "Your order ships today."
+    assert len(llm.calls) == 3
+
+
+def test_akickoff_matches_kickoff() -> None:
+    llm = ScriptedLLM(["spam", "TAG_ARCHIVE", "promo, newsletter"])
+    result = asyncio.run(SimpleCrew(llm, triage_mode=False, rules_fast_path=False).akickoff(
+        {"subject": "Big sale", "body": "50% off everything"}
+    ))
+    assert result == {"intent": "spam", "action": "TAG_ARCHIVE", "tags": ["promo", "newsletter"]}
+
+
+def test_llm_failure_falls_back_to_rules() -> None:
+    error = LLMConnectionError("down")
+    llm = ScriptedLLM([error, error, "Summary"])
+    result = SimpleCrew(llm, triage_mode=False, rules_fast_path=False).kickoff(
+        {"subject": "Worst service ever", "body": "I demand to speak to a manager"}
+    )
+    assert result["intent"] == "unknown"
+    assert result["action"] == "ESCALATE"
+    assert result["summary"] == "Summary"
+
+
+def test_triage_mode_uses_single_call() -> None:
+    triage = '{"intent": "newsletter", "action": "TAG_ARCHIVE", "confidence": 0.9, "tags": ["news"]}'
+    llm = ScriptedLLM([triage])
+    result = SimpleCrew(llm, triage_mode=True, rules_fast_path=False).kickoff(
+        {"subject": "Weekly digest", "body": "Our top stories this week"}
+    )
+    assert result["action"] == "TAG_ARCHIVE"
+    assert result["tags"] == ["news"]
+    assert result["confidence"] == 0.9
+    assert len(llm.calls) == 1
+    assert llm.calls[0]["response_format"]["type"] == "json_schema"
+
+
+def test_triage_mode_falls_back_on_invalid_json() -> None:
+    llm = ScriptedLLM(["not json", "order_status", "AUTO_REPLY", "On its way."])
+    result = SimpleCrew(llm, triage_mode=True, rules_fast_path=False).kickoff(
+        {"subject": "Where is my order?", "body": "Any tracking number?"}
+    )
+    assert result["action"] == "AUTO_REPLY"
+    assert len(llm.calls) == 4
+
+
+def test_parse_triage_validates_fields() -> None:
+    assert _parse_triage('{"intent": "spam", "action": "DELETE", "confidence": 1, "tags": []}') is None
+    parsed = _parse_triage('```json\n{"intent": "Spam", "action": "tag_archive", "confidence": 3, "tags": ["a"]}\n```')
+    assert parsed == {"intent": "spam", "action": "TAG_ARCHIVE", "confidence": 1.0, "tags": ["a"]}
+
+
+def test_rule_fast_path_skips_triage_calls() -> None:
+    llm = ScriptedLLM(["It shipped yesterday."])
+    result = SimpleCrew(llm, triage_mode=False, rules_fast_path=True, rules_threshold=0.9).kickoff(
+        {"subject": "Where is my order?", "body": "Please send the tracking number."}
+    )
+    assert result["action"] == "AUTO_REPLY"
+    assert result["intent"] == "order_status"
+    assert result["source"] == "rules"
+    assert len(llm.calls) == 1
+
+
+def test_rule_fast_path_defers_risky_mail_to_llm() -> None:
+    llm = ScriptedLLM(["complaint", "ESCALATE", "Customer is angry."])
+    result = SimpleCrew(llm, triage_mode=False, rules_fast_path=True, rules_threshold=0.9).kickoff(
+        {"subject": "Where is my order?", "body": "This is the worst, I want a refund now."}
+    )
+    assert "source" not in result
+    assert len(llm.calls) == 3
+
+
+def test_keyword_automaton_reports_overlapping_keywords() -> None:
+    matches = RULES.match("Tracking", "where is my order? my lawyer will sue")
+    assert matches.substrings["order_status"] == {"tracking", "where is my order"}
+    assert matches.has("legal")
+    assert RULES.classify("unknown", "Re: issue", "shipping delay") == "AUTO_REPLY"
+
+
+class PromptLLM(LLMClient):
+    """LLM client that answers by calling a function of the prompt"""
+
+    def __init__(self, respond) -> None:
+        super().__init__(base_url="http://llm.invalid/v1")
+        self.respond = respond
+        self.calls: list[dict] = []
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        self.calls.append({"prompt": prompt, **kwargs})
+        return self.respond(prompt, kwargs)
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        await asyncio.sleep(0)
+        return self.generate(prompt, **kwargs)
+
+
+def test_kickoff_batch_keeps_order_and_per_email_errors() -> None:
+    def respond(prompt: str, kwargs: dict) -> str:
+        if "explode" in prompt:
+            raise LLMConnectionError("down")
+        step = "intent" if prompt.endswith("intent label.") else "other"
+        return "spam" if step == "intent" else "TAG_ARCHIVE"
+
+    crew = SimpleCrew(PromptLLM(respond), triage_mode=False, rules_fast_path=False)
+    inputs = [{"subject": f"Promo {i}", "body": "explode" if i == 1 else "sale"} for i in range(4)]
+    results = crew.kickoff_batch(inputs, max_concurrency=2, pack=False)
+    assert [r["action"] for r in results] == ["TAG_ARCHIVE", "ESCALATE", "TAG_ARCHIVE", "TAG_ARCHIVE"]
+    assert "error" in results[1]
+
+
+def test_kickoff_batch_packs_short_emails() -> None:
+    packed = (
+        '{"items": ['
+        '{"id": 0, "intent": "spam", "action": "TAG_ARCHIVE", "confidence": 0.9, "tags": ["promo"]},'
+        '{"id": 1, "intent": "spam", "action": "TAG_ARCHIVE", "confidence": 0.8, "tags": ["promo"]}'
+        ']}'
+    )
+    llm = PromptLLM(lambda prompt, kwargs: packed)
+    crew = SimpleCrew(llm, triage_mode=False, rules_fast_path=False)
+    results = crew.kickoff_batch(
+        [{"subject": "Sale", "body": "50% off"}, {"subject": "Deal", "body": "Buy now"}],
+        pack=True,
+    )
+    assert [r["tags"] for r in results] == [["promo"], ["promo"]]
+    assert all(r["source"] == "llm_batch_triage" for r in results)
+    assert len(llm.calls) == 1
+
+
+def test_near_duplicates_reuse_cluster_decision(monkeypatch) -> None:
+    monkeypatch.setenv("CREW_DEDUP_REGENERATE", "false")
+    llm = ScriptedLLM(["newsletter", "TAG_ARCHIVE", "news, weekly"])
+    crew = SimpleCrew(llm, triage_mode=False, rules_fast_path=False, dedup=NearDuplicateIndex())
+    body = (
+        "Hi {name},\nHere are this week's product updates, release notes and "
+        "upcoming webinars for your account number {number}. See you next week."
+    )
+    first = crew.kickoff({"subject": "Weekly update", "body": body.format(name="Ana", number=1234)})
+    second = crew.kickoff({"subject": "Weekly update", "body": body.format(name="Bo", number=98765)})
+    assert second["tags"] == first["tags"] == ["news", "weekly"]
+    assert second["source"] == "dedup"
+    assert len(llm.calls) == 3
+
+
+def test_near_duplicates_are_not_reused_across_tenants(monkeypatch) -> None:
+    monkeypatch.setenv("CREW_DEDUP_REGENERATE", "false")
+    llm = ScriptedLLM(["newsletter", "TAG_ARCHIVE", "news, weekly"] * 2)
+    crew = SimpleCrew(llm, triage_mode=False, rules_fast_path=False, dedup=NearDuplicateIndex())
+    body = "Hi,\nHere are this week's product updates, release notes and upcoming webinars. See you next week."
+    crew.kickoff({"subject": "Weekly update", "body": body, "tenant_id": 1})
+    other = crew.kickoff({"subject": "Weekly update", "body": body, "tenant_id": 2})
+    assert other.get("source") != "dedup" and len(llm.calls) == 6
+    again = crew.kickoff({"subject": "Weekly update", "body": body, "tenant_id": 2})
+    assert again["source"] == "dedup" and len(llm.calls) == 6
+
+
+def test_near_duplicate_index_separates_different_mail() -> None:
+    index = NearDuplicateIndex()
+    index.add("Refund for order 1", "The blender arrived broken, please refund me.", {"intent": "refund_request"})
+    assert index.lookup("Refund for order 2", "The blender arrived broken, please refund me.") is not None
+    assert index.lookup("Shipping question", "Do you ship to Canada and how long does it take?") is None
@@ -0,0 +1,78 @@
+"""
+Unit checks for the batched EmailLog writer and the SQL-aggregated stats.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base, EmailLog
+from app.schemas.email_schema import EmailInbound
+from app.services.email_log import EmailLogWriter, email_log_row, email_stats
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'logs.db'}")
+    Base.metadata.create_all(engine)
+    commits: list[int] = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    factory = sessionmaker(bind=engine)
+    factory.commits = commits
+    return factory
+
+
+def _row(action: str, tenant_id: int = 1, **result) -> dict:
+    email = EmailInbound(subject=f"{action} mail", body="body")
+    return email_log_row(email, {"action": action, **result}, tenant_id=tenant_id, source="test")
+
+
+def test_rows_are_written_in_batches(session_factory) -> None:
+    writer = EmailLogWriter(batch_size=10, flush_interval=60, session_factory=session_factory)
+    for _ in range(25):
+        assert writer.add(_row("TAG_ARCHIVE", tags=["billing", "invoice"]))
+    writer.close()
+
+    with session_factory() as db:
+        rows = db.query(EmailLog).all()
+    assert len(rows) == 25
+    assert rows[0].tags == "billing,invoice" and rows[0].source == "test"
+    assert len(session_factory.commits) == 3  # 10 + 10 + 5, not one per email
+    assert writer.stats() == {"written": 25, "dropped": 0, "failed_batches": 0, "buffered": 0}
+
+
+def test_full_buffer_drops_instead_of_blocking(session_factory) -> None:
+    writer = EmailLogWriter(batch_size=100, flush_interval=60, max_buffer=3, session_factory=session_factory)
+    results = [writer.add(_row("ESCALATE")) for _ in range(5)]
+    assert results == [True, True, True, False, False]
+    assert writer.flush() == 3
+    assert writer.stats()["dropped"] == 2
+
+
+def test_stats_aggregate_by_action_tenant_and_time(session_factory) -> None:
+    writer = EmailLogWriter(session_factory=session_factory)
+    old = _row("AUTO_REPLY")
+    old["created_at"] = datetime.utcnow() - timedelta(days=2)
+    rows = [
+        old,
+        _row("AUTO_REPLY", stage_ms={"triage": 100, "action": 20}),
+        _row("TAG_ARCHIVE", stage_ms={"triage": 300}, preprocess={"removed_chars": 40}),
+        _row("ESCALATE", error="model down"),
+        _row("ESCALATE", tenant_id=2),
+    ]
+    for row in rows:
+        writer.add(row)
+    writer.close()
+
+    stats = email_stats(tenant_id=1, session_factory=session_factory)
+    assert (stats["processed"], stats["auto_replies"], stats["tagged"], stats["escalations"]) == (4, 2, 1, 1)
+    assert (stats["errors"], stats["trimmed"], stats["chars_trimmed"]) == (1, 1, 40)
+    assert (stats["avg_triage_ms"], stats["avg_action_ms"]) == (200.0, 20.0)
+
+    recent = email_stats(tenant_id=1, since=datetime.utcnow() - timedelta(days=1), session_factory=session_factory)
+    assert recent["auto_replies"] == 1
+    assert email_stats(session_factory=session_factory)["processed"] == 5
@@ -39,7 +39,7 @@ try:
     # Send to yourself for testing
     test_email.from_address = os.getenv("EMAIL_USER")
     
-    service.send_reply(test_email, reply_text)
+    service.send_reply(test_email, reply_text, wait=True)
     print("✅ Email sent successfully!")
     print("\n📬 Check your inbox - you should receive a test email.")
     
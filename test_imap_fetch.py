@@ -0,0 +1,100 @@
+"""
+Unit checks for bulk IMAP FETCH parsing and partial-body retrieval.
+"""
+
+from __future__ import annotations
+
+import base64
+
+from app.services.email_service import EmailService
+from app.services.imap_fetch import decode_part, find_text_part, parse_fetch_response, uid_set
+
+# multipart/mixed: (multipart/alternative: text/plain, text/html), application/pdf
+MIXED = (
+    b'((("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 20 1 NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 40 1 NIL NIL NIL) "ALTERNATIVE" '
+    b'("BOUNDARY" "b2") NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "invoice.pdf") NIL NIL "BASE64" 3000000 NIL '
+    b'("ATTACHMENT" ("FILENAME" "invoice.pdf")) NIL) "MIXED" ("BOUNDARY" "b1") NIL NIL)'
+)
+SINGLE = b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "BASE64" 24 1 NIL NIL NIL)'
+HEADERS_7 = b"Subject: =?utf-8?q?Caf=C3=A9_order?=\r\nFrom: Ana <ana@example.com>\r\nMessage-ID: <m7@example.com>\r\n\r\n"
+HEADERS_9 = b"Subject: Refund\r\nFrom: bob@example.com\r\n\r\n"
+
+
+def _header_response() -> list:
+    return [
+        (b"1 (UID 7 BODYSTRUCTURE " + MIXED + b" BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {%d}" % len(HEADERS_7), HEADERS_7),
+        b")",
+        (b"2 (UID 9 BODYSTRUCTURE " + SINGLE + b" BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {%d}" % len(HEADERS_9), HEADERS_9),
+        b")",
+        b"3 (FLAGS (\\Seen))",
+    ]
+
+
+def test_uid_set_compacts_ranges() -> None:
+    assert uid_set([7, 1, 2, 3, 9, 10]) == "1:3,7,9:10"
+    assert uid_set([]) == ""
+
+
+def test_parse_fetch_response_and_find_text_part() -> None:
+    messages = parse_fetch_response(_header_response())
+    assert sorted(messages) == [7, 9]
+
+    part = find_text_part(messages[7]["BODYSTRUCTURE"])
+    assert (part.section, part.encoding, part.charset) == ("1.1", "quoted-printable", "iso-8859-1")
+    assert find_text_part(messages[7]["BODYSTRUCTURE"], "html").section == "1.2"
+
+    part = find_text_part(messages[9]["BODYSTRUCTURE"])
+    assert (part.section, part.encoding) == ("1", "base64")
+
+
+def test_decode_part_handles_truncated_base64_and_charsets() -> None:
+    encoded = base64.b64encode("Where is my order?".encode())
+    assert decode_part(encoded[:10], "base64", "utf-8") == "Where "  # 10 chars -> two whole quads
+    assert decode_part(b"Caf=E9", "quoted-printable", "iso-8859-1") == "Café"
+    assert decode_part(b"hi", "7bit", "x-unknown") == "hi"
+
+
+class FakeImap:
+    """Answers UID commands with canned responses and records them"""
+
+    def __init__(self) -> None:
+        self.commands: list[tuple] = []
+
+    def uid(self, command: str, *args):
+        self.commands.append((command, *args))
+        if command == "SEARCH":
+            return "OK", [b"7 9"]
+        if command == "FETCH" and "BODYSTRUCTURE" in args[1]:
+            return "OK", _header_response()
+        if command == "FETCH" and "BODY.PEEK[1.1]" in args[1]:
+            body = b"Caf=E9 order is late"
+            return "OK", [(b"1 (UID 7 BODY[1.1]<0> {%d}" % len(body), body), b")"]
+        if command == "FETCH" and "BODY.PEEK[1]" in args[1]:
+            body = base64.b64encode(b"I want a refund")
+            return "OK", [(b"2 (UID 9 BODY[1]<0> {%d}" % len(body), body), b")"]
+        return "OK", [None]
+
+
+def test_fetch_unread_peeks_text_parts_only(monkeypatch) -> None:
+    monkeypatch.setenv("EMAIL_USER", "user")
+    monkeypatch.setenv("EMAIL_PASSWORD", "secret")
+    monkeypatch.setenv("EMAIL_FETCH_MAX_BYTES", "4096")
+    service = EmailService()
+    imap = FakeImap()
+
+    emails = service.fetch_unread(imap)
+
+    assert [(e.uid, e.subject, e.body) for e in emails] == [
+        (7, "Café order", "Café order is late"),
+        (9, "Refund", "I want a refund"),
+    ]
+    assert emails[0].message_id == "<m7@example.com>"
+    fetches = [args[1] for command, *args in imap.commands if command == "FETCH"]
+    assert len(fetches) == 3  # one structure pass + one per distinct section
+    assert all("PEEK" in items and "RFC822" not in items for items in fetches)
+    assert any("<0.4096>" in items for items in fetches)
+
+    service.mark_seen(imap, [9, 7])
+    assert imap.commands[-1] == ("STORE", "7,9", "+FLAGS.SILENT", r"(\Seen)")
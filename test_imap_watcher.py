@@ -0,0 +1,138 @@
+"""
+IMAP watcher checks against a minimal local IMAP server.
+"""
+
+from __future__ import annotations
+
+import imaplib
+import socketserver
+import threading
+import time
+
+import pytest
+
+from app.services.imap_watcher import ImapWatcher
+
+
+class FakeMailbox:
+    def __init__(self, idle: bool) -> None:
+        self.idle = idle
+        self.messages = 1
+        self.idling: list = []
+        self.lock = threading.Lock()
+
+    def deliver(self) -> None:
+        """Add a message and notify every idling session"""
+        with self.lock:
+            self.messages += 1
+            for wfile in self.idling:
+                wfile.write(b"* %d EXISTS\r\n" % self.messages)
+
+
+class FakeImapHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        box: FakeMailbox = self.server.mailbox
+        caps = b"IMAP4rev1 IDLE" if box.idle else b"IMAP4rev1"
+        self.wfile.write(b"* OK fake server ready\r\n")
+        for raw in self.rfile:
+            tag, _, rest = raw.strip().partition(b" ")
+            command = rest.split(b" ")[0].upper()
+            if command == b"CAPABILITY":
+                self.wfile.write(b"* CAPABILITY " + caps + b"\r\n")
+            elif command == b"SELECT":
+                self.wfile.write(b"* %d EXISTS\r\n" % box.messages)
+            elif command == b"NOOP":
+                self.wfile.write(b"* %d EXISTS\r\n" % box.messages)
+            elif command == b"IDLE":
+                self.wfile.write(b"+ idling\r\n")
+                with box.lock:
+                    box.idling.append(self.wfile)
+                done = self.rfile.readline()
+                with box.lock:
+                    box.idling.remove(self.wfile)
+                if done.strip().upper() != b"DONE":
+                    self.wfile.write(tag + b" BAD expected DONE\r\n")
+                    continue
+            elif command == b"LOGOUT":
+                self.wfile.write(b"* BYE\r\n" + tag + b" OK LOGOUT completed\r\n")
+                return
+            self.wfile.write(tag + b" OK " + command + b" completed\r\n")
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture(params=[True, False], ids=["idle", "poll"])
+def imap_server(request):
+    server = FakeImapServer(("127.0.0.1", 0), FakeImapHandler)
+    server.mailbox = FakeMailbox(idle=request.param)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _connect(server) -> imaplib.IMAP4:
+    conn = imaplib.IMAP4("127.0.0.1", server.server_address[1])
+    conn.login("user", "secret")
+    return conn
+
+
+def test_new_mail_wakes_watcher(imap_server) -> None:
+    watcher = ImapWatcher(
+        lambda: _connect(imap_server), idle_timeout=0.3, poll_min=0.05, poll_max=0.2
+    )
+    calls = []
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(calls.append, stop), daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 3
+    while not calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 1  # initial sweep
+    assert watcher.supports_idle is imap_server.mailbox.idle
+
+    time.sleep(0.5)  # idles past at least one renewal without spurious wake-ups
+    assert len(calls) == 1
+
+    imap_server.mailbox.deliver()
+    deadline = time.monotonic() + 3
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 2
+
+    stop.set()
+    thread.join(timeout=3)
+    assert not thread.is_alive()
+    assert watcher.connection is None
+
+
+def test_mail_reported_during_handler_is_not_missed(imap_server) -> None:
+    # Long renewals: the second sweep must come from the pending EXISTS, not a timeout
+    watcher = ImapWatcher(
+        lambda: _connect(imap_server), idle_timeout=30, poll_min=0.05, poll_max=0.2
+    )
+    calls = []
+
+    def on_change(conn: imaplib.IMAP4) -> None:
+        calls.append(conn)
+        if len(calls) == 1:
+            imap_server.mailbox.deliver()  # arrives mid-fetch...
+            conn.noop()  # ...and is reported on the fetch's own responses
+
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(on_change, stop), daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 3
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 2
+
+    time.sleep(0.3)  # the count was taken in: no further sweeps
+    assert len(calls) == 2
+    stop.set()
+    thread.join(timeout=3)
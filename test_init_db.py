@@ -0,0 +1,51 @@
+"""
+Schema upgrade checks: init_db against a database created by an older release.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from app.db import crud
+from app.db.models import EmailLog
+from app.db.session import init_db
+from app.schemas.email_schema import EmailInbound
+from app.services.email_log import EmailLogWriter, email_log_row
+
+# The tables as the first release created them
+BASELINE_SCHEMA = (
+    "CREATE TABLE tenants (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, created_at DATETIME)",
+    "CREATE TABLE email_logs (id INTEGER PRIMARY KEY, tenant_id INTEGER, subject VARCHAR(500), body TEXT, "
+    "intent VARCHAR(100), action VARCHAR(50), created_at DATETIME)",
+    "CREATE INDEX ix_email_logs_tenant_id ON email_logs (tenant_id)",
+    "INSERT INTO tenants (id, name) VALUES (1, 'acme')",
+    "INSERT INTO email_logs (tenant_id, subject, action) VALUES (1, 'old', 'ESCALATE')",
+)
+
+
+def test_init_db_upgrades_baseline_tables(tmp_path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+
+    init_db(engine)
+    init_db(engine)  # nothing left to do the second time
+    session_factory = sessionmaker(bind=engine)
+
+    with session_factory() as db:
+        tenant = crud.list_tenants(db)[0]
+        assert (tenant.name, tenant.max_concurrency, tenant.llm_emails_per_minute) == ("acme", None, None)
+
+    writer = EmailLogWriter(session_factory=session_factory)
+    email = EmailInbound(subject="new", body="b")
+    writer.add(email_log_row(email, {"action": "AUTO_REPLY", "stage_ms": {"triage": 5}}, tenant_id=1, source="test"))
+    writer.close()
+    assert writer.stats()["written"] == 1
+
+    with session_factory() as db:
+        rows = db.query(EmailLog).order_by(EmailLog.id).all()
+    assert [(row.subject, row.source, row.triage_ms) for row in rows] == [("old", None, None), ("new", "test", 5)]
+    indexes = {index["name"] for index in inspect(engine).get_indexes("email_logs")}
+    assert "ix_email_logs_tenant_created_action" in indexes
@@ -0,0 +1,106 @@
+"""
+Unit checks for the durable webhook job queue.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base
+from app.schemas.email_schema import EmailInbound
+from app.services.job_queue import JobQueue
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def _queue(session_factory, **kwargs) -> JobQueue:
+    kwargs.setdefault("visibility_timeout", 60)
+    kwargs.setdefault("max_attempts", 2)
+    kwargs.setdefault("retry_backoff", 0)
+    return JobQueue(session_factory=session_factory, **kwargs)
+
+
+def test_enqueue_claim_complete(session_factory) -> None:
+    queue = _queue(session_factory)
+    job_id = queue.enqueue(EmailInbound(subject="Refund", body="please"), tenant_id=3)
+    assert queue.status(job_id)["status"] == "queued"
+
+    claimed_id, email, tenant_id = queue.claim("w1")
+    assert (claimed_id, email.subject, tenant_id) == (job_id, "Refund", 3)
+    assert queue.claim("w2") is None  # leased
+
+    assert queue.complete(job_id, "w1", {"action": "AUTO_REPLY"})
+    status = queue.status(job_id)
+    assert (status["status"], status["result"], status["tenant_id"]) == ("done", {"action": "AUTO_REPLY"}, 3)
+    assert status["finished_at"] is not None
+
+
+def test_failures_are_retried_then_failed(session_factory) -> None:
+    queue = _queue(session_factory)
+    job_id = queue.enqueue(EmailInbound(subject="s", body="b"))
+
+    queue.claim("w1")
+    queue.fail(job_id, "w1", "model down")
+    assert queue.status(job_id)["status"] == "queued"
+
+    assert queue.claim("w1")[0] == job_id
+    queue.fail(job_id, "w1", "model down again")
+    status = queue.status(job_id)
+    assert (status["status"], status["attempts"], status["error"]) == ("failed", 2, "model down again")
+    assert queue.claim("w1") is None
+
+
+def test_expired_lease_moves_job_to_another_worker(session_factory) -> None:
+    queue = _queue(session_factory, visibility_timeout=0.2)
+    job_id = queue.enqueue(EmailInbound(subject="s", body="b"))
+    queue.claim("crashed")
+    time.sleep(0.3)
+
+    assert queue.claim("w2")[0] == job_id
+    assert not queue.complete(job_id, "crashed", {})  # the old lease holder lost the job
+    assert queue.complete(job_id, "w2", {"action": "ESCALATE"})
+
+    # A job whose leases keep expiring is eventually given up on
+    job_id = queue.enqueue(EmailInbound(subject="s", body="b"))
+    for _ in range(2):
+        queue.claim("crashed")
+        time.sleep(0.3)
+    assert queue.claim("w2") is None
+    assert queue.status(job_id)["status"] == "failed"
+
+
+def test_concurrent_workers_never_share_a_job(session_factory) -> None:
+    queue = _queue(session_factory)
+    for n in range(30):
+        queue.enqueue(EmailInbound(subject=str(n), body="b"))
+
+    claimed: list[int] = []
+    lock = threading.Lock()
+
+    def work(worker_id: str) -> None:
+        idle = 0
+        while idle < 3:
+            job = queue.claim(worker_id)
+            if job is None:
+                idle += 1
+                continue
+            with lock:
+                claimed.append(job[0])
+            queue.complete(job[0], worker_id, {})
+
+    threads = [threading.Thread(target=work, args=(f"w{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == list(range(1, 31))
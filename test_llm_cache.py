@@ -0,0 +1,57 @@
+"""
+Unit checks for the LLM response cache.
+"""
+
+from __future__ import annotations
+
+import time
+
+from app.services.llm_cache import LLMCache
+
+
+def _key(prompt: str) -> str:
+    return LLMCache.make_key("local-model", "system", prompt, 0.2, 32)
+
+
+def test_key_depends_on_all_request_fields() -> None:
+    base = LLMCache.make_key("m", "s", "p", 0.2, 32)
+    assert base == LLMCache.make_key("m", "s", "p", 0.2, 32)
+    assert base != LLMCache.make_key("other", "s", "p", 0.2, 32)
+    assert base != LLMCache.make_key("m", None, "p", 0.2, 32)
+    assert base != LLMCache.make_key("m", "s", "p", 0.3, 32)
+    assert base != LLMCache.make_key("m", "s", "p", 0.2, 64)
+
+
+def test_lru_eviction_and_counters() -> None:
+    cache = LLMCache(max_entries=2)
+    cache.set(_key("a"), "A")
+    cache.set(_key("b"), "B")
+    assert cache.get(_key("a")) == "A"  # "a" is now most recent
+    cache.set(_key("c"), "C")           # evicts "b"
+    assert cache.get(_key("b")) is None
+    assert cache.get(_key("c")) == "C"
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["memory_entries"] == 2
+
+
+def test_ttl_expiry() -> None:
+    cache = LLMCache(ttl=0.05)
+    cache.set(_key("a"), "A")
+    time.sleep(0.1)
+    assert cache.get(_key("a")) is None
+
+
+def test_sqlite_tier_survives_restart(tmp_path) -> None:
+    path = tmp_path / "llm_cache.db"
+    cache = LLMCache(path=path)
+    cache.set(_key("a"), "A")
+    cache.close()
+
+    reopened = LLMCache(path=path)
+    assert reopened.get(_key("a")) == "A"
+    assert reopened.stats()["disk_hits"] == 1
+    assert reopened.get(_key("a")) == "A"
+    assert reopened.stats()["memory_hits"] == 1
+    reopened.close()
@@ -0,0 +1,119 @@
+"""
+Unit checks for LLM endpoint routing (failover, circuit breaking, hedging).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from app.services.llm import LLMConnectionError, LLMRequestError
+from app.services.llm_router import CircuitBreaker, LLMRouter
+
+
+def test_retryable_error_fails_over_to_other_endpoint() -> None:
+    router = LLMRouter(["http://a", "http://b"], retries=1, backoff_base=0.0)
+    seen = []
+
+    def request(endpoint):
+        seen.append(endpoint.url)
+        if len(seen) == 1:
+            raise LLMConnectionError("down")
+        return endpoint.url
+
+    result = router.call(request)
+    assert len(seen) == 2 and seen[0] != seen[1]
+    assert result == seen[1]
+
+
+def test_client_errors_are_not_retried() -> None:
+    router = LLMRouter(["http://a", "http://b"], retries=3, backoff_base=0.0)
+    calls = []
+
+    def request(endpoint):
+        calls.append(endpoint.url)
+        raise LLMRequestError("bad request")
+
+    with pytest.raises(LLMRequestError):
+        router.call(request)
+    assert len(calls) == 1
+    # A rejected request says nothing bad about the endpoint
+    assert all(endpoint.breaker.state == CircuitBreaker.CLOSED for endpoint in router.endpoints)
+
+
+def test_breaker_opens_and_half_opens() -> None:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()       # single trial request
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_half_open_trial_lets_another_through() -> None:
+    router = LLMRouter(["http://a"], failure_threshold=1, reset_timeout=0.0)
+    endpoint = router.endpoints[0]
+    endpoint.breaker.record_failure()
+
+    async def request(endpoint):
+        await asyncio.sleep(1.0)
+
+    async def cancel_trial() -> None:
+        task = asyncio.ensure_future(router.acall(request))
+        await asyncio.sleep(0.01)  # the trial is in flight
+        assert endpoint.breaker.state == CircuitBreaker.HALF_OPEN and not endpoint.breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert endpoint.breaker.state == CircuitBreaker.HALF_OPEN
+    assert endpoint.breaker.allow()  # not stuck waiting for the cancelled trial
+
+
+def test_open_endpoint_is_skipped() -> None:
+    router = LLMRouter(["http://a", "http://b"], failure_threshold=1)
+    router.endpoints[0].breaker.record_failure()
+    for _ in range(5):
+        assert router.pick() is router.endpoints[1]
+
+
+def test_async_hedge_returns_fastest_endpoint() -> None:
+    router = LLMRouter(["http://slow", "http://fast"], hedge_percentile=50, hedge_min_samples=1)
+    for endpoint in router.endpoints:
+        endpoint._started()
+        endpoint._finished(0.01, None)
+
+    async def request(endpoint):
+        await asyncio.sleep(1.0 if endpoint.url == "http://slow" else 0.0)
+        return endpoint.url
+
+    router.pick = lambda exclude=(): next(e for e in router.endpoints if e not in exclude)
+    started = time.monotonic()
+    assert asyncio.run(router.acall(request)) == "http://fast"
+    assert time.monotonic() - started < 0.5
+    assert router.endpoints[1].hedges == 1
+
+
+def test_blocking_hedge_skipped_while_pool_is_saturated() -> None:
+    def request(endpoint):
+        time.sleep(0.3 if endpoint.url == "http://slow" else 0.0)
+        return endpoint.url
+
+    for workers, winner, hedges in ((1, "http://slow", 0), (2, "http://fast", 1)):
+        router = LLMRouter(["http://slow", "http://fast"], hedge_percentile=50, hedge_min_samples=1,
+                           hedge_workers=workers)
+        for endpoint in router.endpoints:
+            endpoint._started()
+            endpoint._finished(0.05, None)
+        router.pick = lambda exclude=(), router=router: next(e for e in router.endpoints if e not in exclude)
+        # With one thread the primary holds it, and a hedge would only queue behind it
+        assert router.call(request) == winner
+        assert router.endpoints[1].hedges == hedges
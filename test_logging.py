@@ -0,0 +1,84 @@
+"""
+Unit checks for the structured logging helpers (JSON lines, bound context, sampling, queue handoff).
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import logging
+from logging.handlers import QueueListener
+
+from app.utils.logger import ContextFilter, JsonFormatter, LogQueueHandler, SamplingFilter, log_context
+
+
+def _logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f"test_logging.{id(handler)}")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    return logger
+
+
+def _stream_handler() -> tuple[logging.Handler, io.StringIO]:
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(ContextFilter())
+    return handler, stream
+
+
+def test_json_lines_carry_the_bound_context() -> None:
+    handler, stream = _stream_handler()
+    logger = _logger(handler)
+
+    with log_context(email_id="<a@b>", tenant_id=3):
+        with log_context(stage="triage", job_id=None):
+            logger.info("Processing email: %s", "Invoice")
+        logger.warning("after")
+    logger.info("outside")
+
+    first, second, third = (json.loads(line) for line in stream.getvalue().splitlines())
+    assert first["msg"] == "Processing email: Invoice" and first["level"] == "INFO"
+    assert (first["email_id"], first["tenant_id"], first["stage"]) == ("<a@b>", 3, "triage")
+    assert "job_id" not in first and "stage" not in second and second["tenant_id"] == 3
+    assert "tenant_id" not in third and first["ts"].endswith("+00:00")
+
+
+def test_debug_records_are_sampled_once_for_all_handlers() -> None:
+    sampler = SamplingFilter(0.0)
+    handler, stream = _stream_handler()
+    handler.addFilter(sampler)
+    logger = _logger(handler)
+
+    logger.debug("noisy")
+    logger.info("kept")
+    assert [json.loads(line)["msg"] for line in stream.getvalue().splitlines()] == ["kept"]
+
+    record = logging.makeLogRecord({"levelno": logging.DEBUG})
+    assert SamplingFilter(0.5).filter(record) == SamplingFilter(0.5).filter(record) == record.sampled
+
+
+def test_queue_handler_hands_off_and_drops_when_full() -> None:
+    handler, stream = _stream_handler()
+    queue_handler = LogQueueHandler(maxsize=2)
+    queue_handler.addFilter(ContextFilter())
+    logger = _logger(queue_handler)
+
+    items = {"count": 1}
+    with log_context(stage="action"):
+        logger.info("items=%s", items)
+        items["count"] = 2  # the message was merged when it was logged
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("failed")
+        logger.info("no room")
+    assert queue_handler.dropped == 1
+
+    listener = QueueListener(queue_handler.queue, handler)
+    listener.start()
+    listener.stop()
+    first, second = (json.loads(line) for line in stream.getvalue().splitlines())
+    assert first["msg"] == "items={'count': 1}" and first["stage"] == "action"
+    assert second["stage"] == "action" and "ValueError: boom" in second["exc"]
@@ -0,0 +1,124 @@
+"""
+Unit checks for the UID-checkpointed mailbox sync.
+"""
+
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base
+from app.schemas.email_schema import EmailInbound
+from app.services.mailbox_sync import MailboxSync
+
+
+class FakeMailbox:
+    """Answers the UID SEARCH/FETCH commands MailboxSync issues"""
+
+    def __init__(self, uids: list[int], unseen: list[int], uidvalidity: int = 1) -> None:
+        self.uids = uids
+        self.unseen = unseen
+        self.untagged_responses = {"UIDVALIDITY": [str(uidvalidity).encode()]}
+        self.searches: list[str] = []
+
+    def uid(self, command: str, *args):
+        if command == "FETCH":  # "*" -> highest UID
+            return "OK", [b"%d (UID %d)" % (len(self.uids), max(self.uids))]
+        criteria = args[1]
+        self.searches.append(criteria)
+        if criteria == "UNSEEN":
+            found = self.unseen
+        else:
+            start = int(criteria.split()[1].split(":")[0])
+            found = [uid for uid in self.uids if uid >= start] or [max(self.uids)]
+        return "OK", [" ".join(map(str, found)).encode()]
+
+
+@pytest.fixture()
+def session_factory():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def _email(uid: int) -> EmailInbound:
+    return EmailInbound(subject="s", body="b", uid=uid, message_id=f"<{uid}@example.com>")
+
+
+def test_first_sync_uses_unseen_then_uid_ranges(session_factory) -> None:
+    box = FakeMailbox(uids=[1, 2, 3, 4], unseen=[3])
+    sync = MailboxSync("user", session_factory=session_factory)
+    assert sync.pending(box) == [3]
+    sync.record(_email(3), "AUTO_REPLY")
+    sync.checkpoint()
+    assert sync.last_uid == 4  # seen mail below the baseline is never processed
+
+    box.uids.append(5)
+    sync = MailboxSync("user", session_factory=session_factory)
+    assert sync.pending(box) == [5]
+    assert box.searches[-1] == "UID 5:*"
+
+    # "UID 6:*" still returns the newest message; it must be ignored
+    sync.record(_email(5), "TAG_ARCHIVE")
+    sync.checkpoint()
+    assert MailboxSync("user", session_factory=session_factory).pending(box) == []
+
+
+def test_processed_message_ids_are_never_rerun(session_factory) -> None:
+    box = FakeMailbox(uids=[1, 2], unseen=[1, 2])
+    sync = MailboxSync("user", session_factory=session_factory)
+    sync.pending(box)
+    sync.record(_email(1), "AUTO_REPLY")
+    # Crash before the checkpoint, then a UIDVALIDITY reset renumbers the mail
+    box.untagged_responses["UIDVALIDITY"] = [b"2"]
+    sync = MailboxSync("user", session_factory=session_factory)
+    sync.pending(box)
+    fresh = sync.filter_new([_email(1), _email(2)])
+    assert [email.uid for email in fresh] == [2]
+
+
+def test_failures_hold_checkpoint_until_max_attempts(session_factory) -> None:
+    box = FakeMailbox(uids=[1, 2, 3], unseen=[])
+    sync = MailboxSync("user", max_attempts=2, session_factory=session_factory)
+    sync.pending(box)
+    sync.checkpoint()
+    box.uids += [4, 5]
+
+    sync = MailboxSync("user", max_attempts=2, session_factory=session_factory)
+    assert sync.pending(box) == [4, 5]
+    sync.record(_email(4), None)
+    sync.record(_email(5), "AUTO_REPLY")
+    sync.checkpoint()
+    assert sync.last_uid == 3  # 4 is retried next cycle
+
+    sync = MailboxSync("user", max_attempts=2, session_factory=session_factory)
+    assert sync.pending(box) == [4, 5]
+    assert [email.uid for email in sync.filter_new([_email(4), _email(5)])] == [4]
+    sync.record(_email(4), None)  # second failure: give up
+    sync.checkpoint()
+    assert sync.last_uid == 5
+    assert sync.filter_new([_email(4)]) == []
+
+
+def test_unfetched_uids_hold_checkpoint(session_factory) -> None:
+    box = FakeMailbox(uids=[1, 2, 3], unseen=[])
+    sync = MailboxSync("user", max_attempts=2, session_factory=session_factory)
+    sync.pending(box)
+    sync.checkpoint()
+    box.uids += [4, 5, 6]
+
+    # The FETCH of 4 failed (or it did not parse); 5 and 6 came back and were handled
+    sync = MailboxSync("user", max_attempts=2, session_factory=session_factory)
+    assert sync.pending(box) == [4, 5, 6]
+    for email in sync.filter_new([_email(5), _email(6)]):
+        sync.record(email, "TAG_ARCHIVE")
+    sync.checkpoint()
+    assert sync.last_uid == 3
+
+    # A header FETCH that fails for the whole batch moves nothing either
+    sync = MailboxSync("user", max_attempts=2, session_factory=session_factory)
+    assert sync.pending(box) == [4, 5, 6]
+    assert sync.filter_new([]) == []
+    sync.checkpoint()  # second attempt for 4: given up; 5 and 6 were not fetched this time
+    assert sync.last_uid == 4
@@ -0,0 +1,84 @@
+"""
+Unit checks for the Prometheus metrics registry (exposition, histograms, multi-process merge).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+from app.services.metrics import MetricsRegistry
+
+
+def _registry(directory=None) -> MetricsRegistry:
+    registry = MetricsRegistry(directory=directory or "", flush_interval=60)
+    registry.counter("app_emails_total", "Emails by action", ("action",))
+    registry.gauge("app_queue_depth", "Queued emails")
+    registry.histogram("app_step_seconds", "Step latency", ("step",), buckets=(0.1, 1.0))
+    return registry
+
+
+def test_render_text_format() -> None:
+    registry = _registry()
+    emails = registry._metrics["app_emails_total"]
+    emails.labels("AUTO_REPLY").inc()
+    emails.labels("AUTO_REPLY").inc(2)
+    emails.labels('say "hi"\n').inc()
+    registry._metrics["app_queue_depth"].set(4)
+
+    text = registry.render()
+    assert "# HELP app_emails_total Emails by action\n# TYPE app_emails_total counter\n" in text
+    assert 'app_emails_total{action="AUTO_REPLY"} 3\n' in text
+    assert 'app_emails_total{action="say \\"hi\\"\\n"} 1\n' in text
+    assert "# TYPE app_queue_depth gauge\napp_queue_depth 4\n" in text
+    assert text.endswith("\n")
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    registry = _registry()
+    step = registry._metrics["app_step_seconds"].labels("triage")
+    for seconds in (0.05, 0.1, 0.5, 3.0):
+        step.observe(seconds)
+
+    text = registry.render()
+    assert 'app_step_seconds_bucket{step="triage",le="0.1"} 2\n' in text  # le is inclusive
+    assert 'app_step_seconds_bucket{step="triage",le="1"} 3\n' in text
+    assert 'app_step_seconds_bucket{step="triage",le="+Inf"} 4\n' in text
+    assert 'app_step_seconds_sum{step="triage"} 3.65\n' in text
+    assert 'app_step_seconds_count{step="triage"} 4\n' in text
+
+
+def test_processes_are_summed_and_exited_ones_archived(tmp_path) -> None:
+    worker = _registry(tmp_path)
+    worker._metrics["app_emails_total"].labels("ESCALATE").inc(5)
+    worker._metrics["app_queue_depth"].set(7)
+    worker.flush()
+
+    api = _registry(tmp_path)
+    api._metrics["app_emails_total"].labels("ESCALATE").inc()
+    text = api.render()
+    assert 'app_emails_total{action="ESCALATE"} 6\n' in text
+    assert "app_queue_depth 7\n" in text  # the worker is alive (it is us)
+
+    # The worker exits: its counters stay, its gauge goes
+    snapshot = next(path for path in tmp_path.glob("*.json") if path.name != "archive.json")
+    data = json.loads(snapshot.read_text())
+    data["pid"] = 2 ** 22 + 1  # above pid_max, never a live process
+    snapshot.write_text(json.dumps(data))
+
+    for _ in range(2):  # archived once, then read from the archive
+        text = api.render()
+        assert 'app_emails_total{action="ESCALATE"} 6\n' in text
+        assert "\napp_queue_depth " not in text
+    assert not snapshot.exists() and (tmp_path / "archive.json").exists()
+
+
+def test_stale_snapshots_are_archived(tmp_path) -> None:
+    old = _registry(tmp_path)
+    old._metrics["app_emails_total"].labels("TAG_ARCHIVE").inc()
+    old.flush()
+    snapshot = old._path
+    os.utime(snapshot, (0, 0))  # left over from before a restart; the pid was reused
+
+    assert 'app_emails_total{action="TAG_ARCHIVE"} 1\n' in _registry(tmp_path).render()
+    assert not snapshot.exists()
@@ -0,0 +1,74 @@
+"""
+Unit checks for bounded MIME parsing and HTML-to-text extraction.
+"""
+
+from __future__ import annotations
+
+import base64
+import io
+
+from app.services.mime_parser import html_to_text, parse_message
+
+LATIN1 = (
+    b"From: =?iso-8859-1?q?Jos=E9?= <jose@example.com>\r\n"
+    b"Subject: =?utf-8?b?Q2Fmw6kgb3JkZXI=?=\r\n"
+    b"Message-ID: <l1@example.com>\r\n"
+    b"Content-Type: text/plain; charset=iso-8859-1\r\n"
+    b"Content-Transfer-Encoding: 8bit\r\n\r\n"
+    b"Ol\xe9, where is my order?\r\n"
+)
+
+HTML_ONLY = (
+    b"From: shop@example.com\r\nSubject: Receipt\r\n"
+    b"Content-Type: text/html\r\n\r\n"
+    b'<html><head><meta charset="windows-1252"><title>x</title>'
+    b"<style>p {color: red}</style></head><body>"
+    b"<p>Thanks&nbsp;for   your\n order</p><ul><li>Tea</li><li>Caf\xe9</li></ul>"
+    b"<script>track()</script><p>Total: 5&euro;<br>Bye</p></body></html>"
+)
+
+
+def _with_attachment(size: int) -> bytes:
+    blob = base64.encodebytes(b"\0" * size)
+    return (
+        b"From: a@example.com\r\nSubject: Invoice\r\nMIME-Version: 1.0\r\n"
+        b'Content-Type: multipart/mixed; boundary="b1"\r\n\r\n'
+        b"--b1\r\nContent-Type: text/plain; charset=utf-8\r\n"
+        b"Content-Transfer-Encoding: base64\r\n\r\n"
+        + base64.encodebytes("Invoice attached – thanks!".encode())
+        + b"\r\n--b1\r\nContent-Type: application/pdf\r\n"
+        b'Content-Disposition: attachment; filename="a.pdf"\r\n'
+        b"Content-Transfer-Encoding: base64\r\n\r\n" + blob + b"\r\n--b1--\r\n"
+    )
+
+
+def test_charsets_and_encoded_headers() -> None:
+    parsed = parse_message(LATIN1)
+    assert parsed.body.strip() == "Olé, where is my order?"
+    assert parsed.subject == "Café order"
+    assert parsed.from_address == "José <jose@example.com>"
+    email = parsed.to_inbound(uid=4)
+    assert (email.message_id, email.uid, email.to_address) == ("<l1@example.com>", 4, None)
+
+
+def test_html_only_mail_is_converted() -> None:
+    parsed = parse_message(HTML_ONLY)
+    assert parsed.body == "Thanks for your order\n\n- Tea\n- Café\n\nTotal: 5€\nBye"
+
+
+def test_attachments_are_skipped_and_message_capped() -> None:
+    raw = _with_attachment(3_000_000)
+    parsed = parse_message(io.BytesIO(raw), max_message_bytes=64 * 1024)
+    assert parsed.body.strip() == "Invoice attached – thanks!"
+    assert parsed.truncated
+
+    parsed = parse_message(raw, max_bytes=7)
+    assert parsed.body.startswith("Invoice") and len(parsed.body) < 12
+    assert parsed.truncated
+
+
+def test_html_to_text_streams_and_stops_early() -> None:
+    chunks = iter(["<div>first</div>", "<div>second</div>"] + ["<p>more</p>"] * 1000)
+    assert html_to_text(chunks, max_chars=12) == "first\n\nsecon"
+    assert next(chunks) == "<p>more</p>"  # the rest of the stream was never read
+    assert html_to_text("<pre>a  b\n  c</pre>x") == "a  b\nc\nx"
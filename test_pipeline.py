@@ -0,0 +1,70 @@
+"""
+Unit checks for the staged triage/action pipeline.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from app.schemas.email_schema import EmailInbound
+from app.services.pipeline import EmailPipeline
+
+
+def _email(n: int) -> EmailInbound:
+    return EmailInbound(subject=f"mail {n}", body="body", uid=n)
+
+
+def test_stages_run_concurrently_and_report_outcomes() -> None:
+    done = []
+
+    def triage(email):
+        time.sleep(0.05)
+        if email.uid == 3:
+            raise RuntimeError("model down")
+        return {"action": "AUTO_REPLY"}
+
+    pipeline = EmailPipeline(triage, lambda email, result: email.uid != 5,
+                             triage_workers=4, action_workers=2, queue_size=4)
+    started = time.monotonic()
+    futures = [
+        pipeline.submit(_email(n), on_done=lambda result, handled, n=n: done.append((n, handled)))
+        for n in range(8)
+    ]
+    pipeline.close()
+    assert time.monotonic() - started < 0.35  # 8 x 50ms triage across 4 workers
+
+    with pytest.raises(RuntimeError):
+        futures[3].result()
+    result, handled = futures[5].result()
+    assert (result["action"], handled) == ("AUTO_REPLY", False)
+    result, handled = futures[0].result()
+    assert (result["action"], handled) == ("AUTO_REPLY", True)
+    assert result["stage_ms"]["triage"] >= 50 and "action" in result["stage_ms"]
+    assert sorted(done) == [(n, n != 5) for n in range(8) if n != 3]
+    assert pipeline.stats()["handled"] == 6 and pipeline.stats()["failed"] == 2
+
+
+def test_full_pipeline_pushes_back_and_drains_on_close() -> None:
+    release = threading.Event()
+
+    def act(email, result):
+        release.wait()
+        return True
+
+    pipeline = EmailPipeline(lambda email: {}, act, triage_workers=1, action_workers=1, queue_size=1)
+    accepted = 0
+    with pytest.raises(Exception):
+        for n in range(20):
+            pipeline.submit(_email(n), timeout=0.1)
+            accepted += 1
+    assert accepted < 10  # bounded queues stop intake instead of buffering everything
+
+    release.set()
+    pipeline.close()
+    stats = pipeline.stats()
+    assert stats["handled"] == accepted
+    with pytest.raises(RuntimeError):
+        pipeline.submit(_email(99))
@@ -0,0 +1,28 @@
+"""
+Unit checks for email body preprocessing (boilerplate stripping).
+"""
+
+from __future__ import annotations
+
+from app.services.preprocess import strip_boilerplate
+
+
+def test_trailing_disclaimer_is_stripped() -> None:
+    body = (
+        "Where is my order 1234?\n\n"
+        "CONFIDENTIALITY NOTICE: This e-mail is confidential and intended solely for the addressee.\n\n"
+        "Please consider the environment before printing this email."
+    )
+    assert strip_boilerplate(body) == "Where is my order 1234?"
+
+
+def test_customer_text_between_the_keywords_is_kept() -> None:
+    body = (
+        "I sent you the confidential contract last week.\n\n"
+        "The courier says the package never reached its recipient. Can you check?\n\n"
+        "Thanks, Ana"
+    )
+    assert strip_boilerplate(body) == body
+    # Even in one paragraph, a match does not run across sentences
+    single = body.replace("\n\n", " ")
+    assert strip_boilerplate(single) == single
@@ -0,0 +1,96 @@
+"""
+Unit checks for webhook admission control and mail-loop detection.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request
+from starlette.requests import ClientDisconnect
+
+from app.api import email_webhook
+from app.schemas.email_schema import EmailInbound
+from app.services import rate_limit
+from app.services.loop_guard import auto_generated_reason
+from app.services.rate_limit import AdmissionController, MemoryBuckets, RateLimited, SQLiteBuckets
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_sender_bucket_limits_per_tenant_and_address(backend, tmp_path) -> None:
+    buckets = MemoryBuckets() if backend == "memory" else SQLiteBuckets(str(tmp_path / "buckets.db"))
+    admission = AdmissionController(sender_rate=6, sender_burst=2, buckets=buckets)
+
+    admission.check("1", "Loop <bot@example.com>")
+    admission.check("1", "bot@EXAMPLE.com")
+    with pytest.raises(RateLimited) as refused:
+        admission.check("1", "bot@example.com")
+    assert refused.value.scope == "sender"
+    assert 9 < refused.value.retry_after <= 10  # 6/min -> one token every 10s
+
+    admission.check("2", "bot@example.com")  # other tenant, other bucket
+    admission.check("1", "human@example.com")
+
+
+def test_sqlite_buckets_are_shared_between_instances(tmp_path) -> None:
+    path = str(tmp_path / "buckets.db")
+    first = AdmissionController(tenant_rate=60, tenant_burst=1, buckets=SQLiteBuckets(path))
+    second = AdmissionController(tenant_rate=60, tenant_burst=1, buckets=SQLiteBuckets(path))
+    first.check("7", None)
+    with pytest.raises(RateLimited):
+        second.check("7", None)
+
+
+def test_in_flight_ceiling() -> None:
+    admission = AdmissionController(max_in_flight=2)
+    admission.acquire()
+    admission.acquire()
+    with pytest.raises(RateLimited):
+        admission.acquire()
+    admission.release()
+    admission.acquire()
+    assert admission.in_flight == 2
+
+
+@pytest.mark.parametrize(
+    "email, looped",
+    [
+        (EmailInbound(subject="Where is my order?", body="", from_address="ana@example.com"), False),
+        (EmailInbound(subject="Re: order", body="", headers={"Auto-Submitted": "auto-replied"}), True),
+        (EmailInbound(subject="Re: order", body="", headers={"Auto-Submitted": "no"}), False),
+        (EmailInbound(subject="News", body="", headers={"Precedence": "bulk"}), True),
+        (EmailInbound(subject="Digest", body="", headers={"List-Id": "<team.example.com>"}), True),
+        (EmailInbound(subject="Failure", body="", from_address="MAILER-DAEMON@example.com"), True),
+        (EmailInbound(subject="Hi", body="", from_address="no-reply@shop.example"), True),
+        (EmailInbound(subject="Automatic reply: order", body="", from_address="bob@example.com"), True),
+        (EmailInbound(subject="Out of Office: back Monday", body="", from_address="bob@example.com"), True),
+    ],
+)
+def test_auto_generated_mail_is_detected(email, looped) -> None:
+    assert (auto_generated_reason(email) is not None) == looped
+
+
+def test_webhook_refused_for_a_slot_keeps_its_tokens(monkeypatch) -> None:
+    admission = AdmissionController(tenant_rate=1, max_in_flight=1)
+    monkeypatch.setattr(rate_limit, "_shared", admission)
+    request = Request({"type": "http", "headers": []})
+    payload = EmailInbound(subject="Hi", body="", from_address="ana@example.com")
+
+    admission.acquire()
+    with pytest.raises(HTTPException) as refused:
+        asyncio.run(email_webhook.process_email_stream(payload, request))
+    assert refused.value.status_code == 429 and admission.in_flight == 1
+    admission.release()
+
+    response = asyncio.run(email_webhook.process_email_stream(payload, request))
+    assert admission.in_flight == 1  # the tenant token was still there
+
+    async def gone(message) -> None:
+        raise OSError("client went away")
+
+    # The body is never iterated, yet the slot comes back
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(response(scope, None, gone))
+    assert admission.in_flight == 0
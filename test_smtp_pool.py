@@ -0,0 +1,198 @@
+"""
+SMTP pool and outbound queue checks against a minimal local SMTP server.
+"""
+
+from __future__ import annotations
+
+import email
+import logging
+import smtplib
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import crud
+from app.db.models import Base
+from app.schemas.email_schema import EmailInbound
+from app.services.actions import execute_action
+from app.services.email_service import EmailService
+from app.services.mailbox_sync import MailboxSync
+from app.services.smtp_pool import OutboundQueue, SMTPPool, close_outbound_queue, get_outbound_queue
+from email_monitor import handle_email, record_outcome
+
+
+class DebugSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.wfile.write(b"220 debug ESMTP\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250-debug\r\n250 8BITMIME\r\n")
+            elif verb == b"DATA" and server.reject:
+                self.wfile.write(b"554 rejected\r\n")
+            elif verb == b"DATA":
+                self.wfile.write(b"354 go ahead\r\n")
+                data = b""
+                for chunk in self.rfile:
+                    if chunk == b".\r\n":
+                        break
+                    data += chunk
+                with server.lock:
+                    server.messages.append(email.message_from_bytes(data))
+                self.wfile.write(b"250 queued\r\n")
+            elif verb == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:  # MAIL, RCPT, NOOP, RSET
+                self.wfile.write(b"250 ok\r\n")
+
+
+@pytest.fixture()
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), DebugSMTPHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.messages = []
+    server.reject = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_queue_reuses_pooled_sessions(smtp_server) -> None:
+    pool = SMTPPool("127.0.0.1", smtp_server.server_address[1], size=2, starttls=False)
+    outbound = OutboundQueue(pool, workers=2)
+    service = EmailService()
+    service.email_user = "support@example.com"
+
+    original = EmailInbound(
+        subject="Re: Order 42",
+        body="Where is it?",
+        from_address="ana@example.com",
+        message_id="<m2@example.com>",
+        references="<m1@example.com>",
+    )
+    futures = [outbound.submit(service.build_reply(original, f"Reply {n}")) for n in range(20)]
+    for future in futures:
+        future.result(timeout=10)
+    outbound.close()
+
+    assert len(smtp_server.messages) == 20
+    assert smtp_server.connections <= 2
+    reply = smtp_server.messages[0]
+    assert reply["Subject"] == "Re: Order 42"
+    assert reply["In-Reply-To"] == "<m2@example.com>"
+    assert reply["Auto-Submitted"] == "auto-replied"  # keeps other responders from answering
+    assert reply["References"] == "<m1@example.com> <m2@example.com>"
+
+
+def test_credentials_are_not_sent_without_starttls(smtp_server, monkeypatch) -> None:
+    logins = []
+    monkeypatch.setattr(smtplib.SMTP, "login", lambda self, *args: logins.append(args))
+    pool = SMTPPool("127.0.0.1", smtp_server.server_address[1], "support@example.com", "secret")
+    # The debug server does not advertise STARTTLS, as if it had been stripped
+    with pytest.raises(smtplib.SMTPNotSupportedError):
+        pool._connect()
+    assert logins == []
+
+
+def test_dropped_session_is_replaced(smtp_server) -> None:
+    pool = SMTPPool("127.0.0.1", smtp_server.server_address[1], size=1, starttls=False)
+    service = EmailService()
+    service.email_user = "support@example.com"
+    msg = service.build_reply(EmailInbound(subject="Hi", body="", from_address="a@example.com"), "x")
+
+    pool.send(msg)
+    # The server or network dropped the idle session
+    pool._idle.queue[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+    pool.send(msg)
+    pool.close()
+
+    assert len(smtp_server.messages) == 2
+    assert smtp_server.connections == 2
+
+
+class FakeImap:
+    """The UID SEARCH answers MailboxSync needs: UIDs 1-4, 1-3 already synced"""
+
+    untagged_responses = {"UIDVALIDITY": [b"1"]}
+
+    def uid(self, command: str, *args):
+        return "OK", [b"4"]
+
+
+def _point_at(monkeypatch, smtp_server) -> EmailService:
+    monkeypatch.setenv("EMAIL_SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("EMAIL_SMTP_PORT", str(smtp_server.server_address[1]))
+    monkeypatch.setenv("EMAIL_USER", "support@example.com")
+    monkeypatch.setenv("EMAIL_PASSWORD", "secret")
+    monkeypatch.setenv("EMAIL_LOG_ENABLED", "false")
+    monkeypatch.setenv("SMTP_STARTTLS", "false")  # the debug server has no TLS
+    return EmailService()
+
+
+def test_failed_reply_leaves_email_pending(smtp_server, monkeypatch) -> None:
+    smtp_server.reject = True
+    service = _point_at(monkeypatch, smtp_server)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        crud.save_sync_state(db, "support@example.com", "INBOX", 1, 3)
+    sync = MailboxSync("support@example.com", session_factory=session_factory)
+    assert sync.pending(FakeImap()) == [4]
+
+    original = EmailInbound(
+        subject="Order", body="Where is it?", from_address="ana@example.com", uid=4, message_id="<4@example.com>"
+    )
+    result = {"action": "AUTO_REPLY", "reply": "On its way"}
+    try:
+        handled = handle_email(service, original, result)
+    finally:
+        close_outbound_queue()
+    record_outcome(sync, original, result, handled)
+    sync.checkpoint()
+
+    # Not handled: left unseen (only handled UIDs are marked), the checkpoint
+    # stays below it, and the next cycle retries it
+    assert handled is False and "rejected" in result["action_error"]
+    assert sync.last_uid == 3
+    assert [email.uid for email in sync.filter_new([original])] == [4]
+
+
+def test_sent_is_logged_once_smtp_accepted(smtp_server, monkeypatch, caplog) -> None:
+    _point_at(monkeypatch, smtp_server)
+    original = EmailInbound(subject="Order", body="Where is it?", from_address="ana@example.com")
+    with caplog.at_level(logging.INFO, logger="app.services.actions"):
+        execute_action(original, {"action": "AUTO_REPLY", "reply": "On its way"})
+        deadline = time.monotonic() + 5
+        while "Sent auto-reply for: Order" not in caplog.text and time.monotonic() < deadline:
+            time.sleep(0.01)
+    close_outbound_queue()
+    assert "Sent auto-reply for: Order" in caplog.text
+    assert len(smtp_server.messages) == 1
+
+
+def test_outbound_queue_per_password_and_clamped_settings(monkeypatch) -> None:
+    monkeypatch.setenv("SMTP_QUEUE_SIZE", "0")  # would make the queue unbounded
+    try:
+        first = get_outbound_queue("127.0.0.1", 2525, "support@example.com", "old")
+        assert get_outbound_queue("127.0.0.1", 2525, "support@example.com", "old") is first
+        # A rotated password must not keep sending through sessions of the old one
+        assert get_outbound_queue("127.0.0.1", 2525, "support@example.com", "new") is not first
+        assert first._queue.maxsize == 1
+    finally:
+        close_outbound_queue()
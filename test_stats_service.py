@@ -0,0 +1,65 @@
+"""
+Unit checks for incremental, rotation-aware log statistics.
+"""
+
+from __future__ import annotations
+
+import logging
+from logging.handlers import RotatingFileHandler
+
+from app.services.stats_service import StatsService
+
+
+def _logger(log_dir, max_bytes: int) -> tuple[logging.Logger, RotatingFileHandler]:
+    handler = RotatingFileHandler(log_dir / "email_cleaner.log", maxBytes=max_bytes, backupCount=2)
+    logger = logging.getLogger(f"stats-test-{log_dir.name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_counts_only_new_bytes_and_survives_rotation(tmp_path) -> None:
+    logger, handler = _logger(tmp_path, max_bytes=400)
+    service = StatsService(tmp_path)
+
+    logger.info("Processing email: a")
+    logger.info("Sent auto-reply for: a")
+    assert service.get_stats()["processed"] == 1
+    offsets = [state["offset"] for state in service._files.values()]
+
+    logger.info("Processing email: b")
+    logger.info("Trimmed email body: removed 40 chars")
+    stats = service.get_stats()
+    assert (stats["processed"], stats["auto_replies"], stats["chars_trimmed"]) == (2, 1, 40)
+    assert [state["offset"] for state in service._files.values()] > offsets
+
+    # Rotate a few times: renamed files keep their counts, nothing is recounted
+    for n in range(12):
+        logger.info(f"Processing email: rotated {n} " + "x" * 40)
+    stats = service.get_stats()
+    files = sorted(p.name for p in tmp_path.glob("email_cleaner.log*"))
+    assert files == ["email_cleaner.log", "email_cleaner.log.1", "email_cleaner.log.2"]
+    fresh = StatsService(tmp_path, checkpoint_path=tmp_path / "other.json").get_stats()
+    assert stats == fresh  # files deleted by rotation dropped out of both
+    handler.close()
+
+
+def test_checkpoint_resumes_and_partial_lines_wait(tmp_path) -> None:
+    log = tmp_path / "email_cleaner.log"
+    log.write_bytes(b"Processing email: a\nEscalated email: a\nTagged email with: [x")
+    assert StatsService(tmp_path).get_stats()["escalations"] == 1
+
+    with log.open("ab") as handle:
+        handle.write(b"]\nProcessing email: b\n")
+    restarted = StatsService(tmp_path)
+    saved = restarted._load_checkpoint()
+    assert [state["offset"] for state in saved.values()] == [len(b"Processing email: a\nEscalated email: a\n")]
+    assert restarted.get_stats()["tagged"] == 1  # the finished line is counted once
+    assert restarted.get_stats()["processed"] == 2
+
+    # Truncated (or replaced under the same inode): counted from scratch
+    log.write_bytes(b"Processing email: c\n")
+    assert restarted.get_stats() == {
+        "processed": 1, "auto_replies": 0, "tagged": 0, "escalations": 0, "trimmed": 0, "chars_trimmed": 0,
+    }
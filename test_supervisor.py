@@ -0,0 +1,65 @@
+"""
+Unit checks for mailbox sharding and per-tenant admission control.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from app.db.models import Tenant
+from app.services.supervisor import TenantGate, rendezvous_owner
+from email_monitor import tenant_gate
+
+
+def test_rendezvous_spreads_keys_and_moves_few_on_resize() -> None:
+    keys = [str(n) for n in range(400)]
+    owners = {key: rendezvous_owner(key, 4) for key in keys}
+    assert owners == {key: rendezvous_owner(key, 4) for key in keys}  # stable
+    assert all(60 < list(owners.values()).count(worker) < 140 for worker in range(4))
+
+    # A fifth worker only takes keys over; nothing moves between the old four
+    grown = {key: rendezvous_owner(key, 5) for key in keys}
+    moved = [key for key in keys if grown[key] != owners[key]]
+    assert all(grown[key] == 4 for key in moved)
+    assert 40 < len(moved) < 130
+
+
+def test_gate_caps_concurrency() -> None:
+    gate = TenantGate(max_concurrency=2)
+    assert gate.acquire() and gate.acquire()
+
+    stop = threading.Event()
+    blocked = []
+    thread = threading.Thread(target=lambda: blocked.append(gate.acquire(stop)))
+    thread.start()
+    time.sleep(0.1)
+    assert not blocked  # third email waits for a slot
+    gate.release()
+    thread.join(2)
+    assert blocked == [True]
+
+    stop.set()
+    assert gate.acquire(stop) is False
+
+
+def test_gate_rate_limits_and_stops() -> None:
+    gate = TenantGate(max_concurrency=10, per_minute=120)  # burst of 120, then 2/s
+    gate._tokens = 1.0
+    assert gate.acquire()
+    started = time.monotonic()
+    assert gate.acquire()
+    assert 0.3 < time.monotonic() - started < 1.0
+
+    stop = threading.Event()
+    threading.Timer(0.1, stop.set).start()
+    assert gate.acquire(stop) is False
+    assert gate._slots._value == 8  # the slot held while waiting for a token was handed back
+
+
+def test_tenant_limits_are_split_between_its_workers() -> None:
+    tenant = Tenant(name="acme", max_concurrency=5, llm_emails_per_minute=60)
+    assert (tenant_gate(tenant).max_concurrency, tenant_gate(tenant).per_minute) == (5, 60)
+    gate = tenant_gate(tenant, shares=2)
+    assert (gate.max_concurrency, gate.per_minute) == (3, 30)
+    assert tenant_gate(Tenant(name="small", max_concurrency=1, llm_emails_per_minute=0), 3).per_minute == 0